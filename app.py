@@ -1,149 +1,782 @@
 import os
 import cv2
-import dlib
 import numpy as np
 import sqlite3
-import pickle
 from datetime import datetime, time, timedelta
 import pytz
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, Response, render_template, request, jsonify, session, redirect, url_for, g
 from werkzeug.security import generate_password_hash, check_password_hash
-import base64
+from werkzeug.exceptions import RequestEntityTooLarge
+import hashlib
+import hmac
+import json
+import secrets
+import shutil
+import subprocess
+import sys
+import threading
+import csv
+import io
+import click
+from recognition_service import RecognitionService, RecognitionBusy
+from image_upload import UploadError, read_uploaded_image, read_uploaded_frames
+from face_gallery import FaceGallery, mean_encoding, face_distance, near_duplicate_pairs
+from face_quality import quality_reason
+from face_index import make_index
+from encoding_store import encode_encoding, decode_encoding, migrate_encodings
+from bulk_enroll import bulk_enroll
+from db import get_db
+from timetable import Timetable
+from events import EventBroker, EventScheduler
+from rollups import create_rollups, rebuild_rollups, check_rollups, get_totals
+from reports import ReportCache, load_subjects, last_session_days, build_report
+from ingest import AttendanceIngest, IngestBusy
+from metrics import Metrics, RequestTimer, DISTANCE_BUCKETS
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-this-in-production'
+# Largest request body accepted (photos are sent as files; base64 form fields still work)
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_BYTES', 8 * 1024 * 1024))
+app.config['MAX_FORM_MEMORY_SIZE'] = app.config['MAX_CONTENT_LENGTH']
 
 # Configuration
 UPLOAD_FOLDER = 'static/uploads'
 ENCODINGS_FILE = 'face_encodings.pkl'
-DB_FILE = 'attendance.db'
 PAKISTAN_TZ = pytz.timezone('Asia/Karachi')
+FACE_MATCH_TOLERANCE = 0.6
+# Longest a client may reuse a /get_current_subject answer before revalidating
+TIMETABLE_MAX_AGE = int(os.environ.get('TIMETABLE_MAX_AGE', 60))
+# 'exact' scans every encoding; 'ivf' scans only the FACE_INDEX_NPROBE closest partitions
+FACE_INDEX = os.environ.get('FACE_INDEX', 'exact')
+FACE_INDEX_NPROBE = int(os.environ.get('FACE_INDEX_NPROBE', 8))
+# Face encoding runs in its own process pool, sized independently of the web workers.
+# Every web worker (WEB_CONCURRENCY of them) has its own pool, so by default the cores
+# are divided between them: one encoder process per core in total, at least one each.
+# RECOGNITION_WORKERS=0 encodes inline in the request thread instead.
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+RECOGNITION_WORKERS = int(os.environ.get('RECOGNITION_WORKERS',
+                                         max(1, (os.cpu_count() or 1) // max(1, WEB_CONCURRENCY))))
+RECOGNITION_QUEUE_SIZE = int(os.environ.get('RECOGNITION_QUEUE_SIZE', 16))
+RECOGNITION_TIMEOUT = float(os.environ.get('RECOGNITION_TIMEOUT', 30))
+# The dlib models are loaded on the first face check. PRELOAD_MODELS=1 loads them at
+# import instead: with gunicorn's preload_app (on with it, see gunicorn.conf.py) the
+# master loads them once and every forked worker shares that copy; the pool's processes
+# are forked from a fork server that has them loaded
+PRELOAD_MODELS = os.environ.get('PRELOAD_MODELS', '0') == '1'
+# Bulk imports uploaded through /students/bulk_import: the largest upload, the most its
+# photos may add up to once extracted, and where uploads wait for their import job
+BULK_IMPORT_MAX_BYTES = int(os.environ.get('BULK_IMPORT_MAX_BYTES', 1024 * 1024 * 1024))
+BULK_IMPORT_MAX_EXTRACTED_BYTES = int(os.environ.get('BULK_IMPORT_MAX_EXTRACTED_BYTES', 4 * 1024 * 1024 * 1024))
+IMPORT_JOBS_DIR = os.environ.get('IMPORT_JOBS_DIR', 'import_jobs')
+# Open /events streams per web worker (each holds a thread under gthread, so
+# gunicorn.conf.py caps this at GUNICORN_THREADS - 2 there), and the
+# seconds between keep-alive comments / checks for newly marked attendance
+SSE_MAX_CONNECTIONS = int(os.environ.get('SSE_MAX_CONNECTIONS', 1000))
+SSE_HEARTBEAT = float(os.environ.get('SSE_HEARTBEAT', 15))
+SSE_POLL_INTERVAL = float(os.environ.get('SSE_POLL_INTERVAL', 2))
+# Largest ?limit= page for the attendance lists, and rows per chunk of an export
+MAX_PAGE_SIZE = 1000
+EXPORT_BATCH_SIZE = 1000
+# Attendance percentage under which a student is flagged in reports, and how
+# many computed reports each worker keeps
+LOW_ATTENDANCE_THRESHOLD = float(os.environ.get('LOW_ATTENDANCE_THRESHOLD', 75))
+REPORT_CACHE_SIZE = int(os.environ.get('REPORT_CACHE_SIZE', 32))
+# Seconds after a face check during which a student's later classes the same day are
+# marked without another one, from the same device and place (0 = always check the face)
+VERIFIED_REUSE_SECONDS = int(os.environ.get('VERIFIED_REUSE_SECONDS', 0))
+# Liveness check on student check-ins (see liveness.py): 'off', 'record' (score bursts
+# the page sends and store the score) or 'enforce' (students must send a burst that
+# scores at least LIVENESS_MIN_SCORE)
+LIVENESS_MODE = os.environ.get('LIVENESS_MODE', 'off')
+LIVENESS_MIN_SCORE = float(os.environ.get('LIVENESS_MIN_SCORE', 0.8))
+LIVENESS_FRAMES = int(os.environ.get('LIVENESS_FRAMES', 8))
+# Face templates (see face_gallery.py): up to ENROLL_MAX_IMAGES photos per registration,
+# and at most FACE_MAX_TEMPLATES kept per student. With ADAPTIVE_TEMPLATES=1 a check-in
+# face matched at a distance between ADAPTIVE_MIN_DISTANCE (anything closer adds nothing
+# new) and ADAPTIVE_MAX_DISTANCE is kept as another template, at most one a day per
+# student; once at the cap it replaces the oldest adaptive one (enrollment photos stay)
+ENROLL_MAX_IMAGES = int(os.environ.get('ENROLL_MAX_IMAGES', 5))
+FACE_MAX_TEMPLATES = int(os.environ.get('FACE_MAX_TEMPLATES', 10))
+ADAPTIVE_TEMPLATES = os.environ.get('ADAPTIVE_TEMPLATES', '0') == '1'
+ADAPTIVE_MIN_DISTANCE = float(os.environ.get('ADAPTIVE_MIN_DISTANCE', 0.2))
+ADAPTIVE_MAX_DISTANCE = float(os.environ.get('ADAPTIVE_MAX_DISTANCE', 0.4))
+# Enrollment photos whose face scores under ENROLL_MIN_QUALITY for size, sharpness and
+# pose (see face_quality.py; 0 = accept any face) are turned away. With
+# ENROLL_DUPLICATE_CHECK=1 a registration whose face is within FACE_MATCH_TOLERANCE of an
+# enrolled student is refused until the admin confirms it (allow_duplicate=1, e.g. twins)
+ENROLL_MIN_QUALITY = float(os.environ.get('ENROLL_MIN_QUALITY', 0.5))
+ENROLL_DUPLICATE_CHECK = os.environ.get('ENROLL_DUPLICATE_CHECK', '1') == '1'
+# Check-ins are journaled, acknowledged, and written by one thread per worker in
+# group-committed batches every INGEST_FLUSH_MS (see ingest.py). 'direct' inserts
+# each one in the request instead. At most INGEST_QUEUE_SIZE may wait per worker.
+ATTENDANCE_INGEST = os.environ.get('ATTENDANCE_INGEST', 'queue')
+INGEST_JOURNAL_DIR = os.environ.get('INGEST_JOURNAL_DIR', 'ingest_journal')
+INGEST_QUEUE_SIZE = int(os.environ.get('INGEST_QUEUE_SIZE', 10000))
+INGEST_BATCH_SIZE = int(os.environ.get('INGEST_BATCH_SIZE', 500))
+INGEST_FLUSH_MS = float(os.environ.get('INGEST_FLUSH_MS', 5))
+# Request and stage latency histograms, match distances and check-in outcomes per worker
+# at GET /metrics (Prometheus text; an admin session, or "Authorization: Bearer METRICS_TOKEN").
+# SERVER_TIMING: 'request' adds a Server-Timing header to responses whose request sent
+# "X-Server-Timing: 1", 'always' to every response, 'off' never
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+SERVER_TIMING = os.environ.get('SERVER_TIMING', 'request')
+# What the pages' camera capture uploads (see static/js/capture.js): frames are scaled
+# to max_width, and only sent if they pass the brightness, blur and face checks.
+# The server detects at FACE_DETECT_MAX_WIDTH and encodes a crop of the full frame,
+# so 640 px leaves a selfie-distance face well above the 150 px descriptor chip.
+CAPTURE_SETTINGS = {
+    'max_width': int(os.environ.get('CAPTURE_MAX_WIDTH', 640)),
+    'jpeg_quality': float(os.environ.get('CAPTURE_JPEG_QUALITY', 0.85)),
+    'burst_frames': 3,
+    'burst_interval_ms': 120,
+    'min_brightness': 40,
+    'max_brightness': 220,
+    'min_sharpness': 15,
+    'min_skin_ratio': 0.04,
+    # Frames per liveness burst (0 = send a single photo) and the gap between them
+    'liveness_frames': LIVENESS_FRAMES if LIVENESS_MODE != 'off' else 0,
+    'liveness_interval_ms': 150,
+    # Photos the registration form may send
+    'enroll_max_images': ENROLL_MAX_IMAGES
+}
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-# Initialize dlib face detector and recognizer
-detector = dlib.get_frontal_face_detector()
-predictor = dlib.shape_predictor('shape_predictor_68_face_landmarks.dat')
-face_encoder = dlib.face_recognition_model_v1('dlib_face_recognition_resnet_model_v1.dat')
-
 # Database initialization
+def add_column_if_missing(c, table, column, definition):
+    """Add a column to an existing table (CREATE TABLE IF NOT EXISTS won't)"""
+    c.execute(f"PRAGMA table_info({table})")
+    if column not in [row[1] for row in c.fetchall()]:
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        return True
+    return False
+
+def pakistan_utc_offset():
+    """SQLite date modifier shifting a UTC CURRENT_TIMESTAMP into Pakistan time"""
+    offset_minutes = int(datetime.now(PAKISTAN_TZ).utcoffset().total_seconds() // 60)
+    return f'{offset_minutes:+d} minutes'
+
+def backfill_attendance_dates(c):
+    """Fill attendance_date for existing records and drop same-day duplicates"""
+    # timestamp holds UTC (CURRENT_TIMESTAMP); shift it into Pakistan time
+    c.execute("UPDATE attendance SET attendance_date = DATE(timestamp, ?)", (pakistan_utc_offset(),))
+    # The old read-then-insert check could race; keep the first record of each day
+    c.execute("""DELETE FROM attendance
+                 WHERE subject_id IS NOT NULL
+                 AND id NOT IN (SELECT MIN(id) FROM attendance
+                                WHERE subject_id IS NOT NULL
+                                GROUP BY student_id, subject_id, attendance_date)""")
+
 def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    
-    # Admin table
-    c.execute('''CREATE TABLE IF NOT EXISTS admins
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  username TEXT UNIQUE NOT NULL,
-                  password TEXT NOT NULL,
-                  created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-    
-    # Students table with password
-    c.execute('''CREATE TABLE IF NOT EXISTS students
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  name TEXT NOT NULL,
-                  roll_number TEXT UNIQUE NOT NULL,
-                  password TEXT NOT NULL,
-                  encoding BLOB NOT NULL,
-                  photo_path TEXT,
-                  registered_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-    
-    # Subjects table
-    c.execute('''CREATE TABLE IF NOT EXISTS subjects
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  name TEXT NOT NULL,
-                  code TEXT UNIQUE NOT NULL,
-                  day_of_week TEXT NOT NULL,
-                  start_time TEXT NOT NULL,
-                  end_time TEXT NOT NULL,
-                  attendance_window INTEGER DEFAULT 15,
-                  created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-    
-    # Location/WiFi settings
-    c.execute('''CREATE TABLE IF NOT EXISTS locations
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  name TEXT NOT NULL,
-                  wifi_ssid TEXT,
-                  ip_range TEXT,
-                  latitude REAL,
-                  longitude REAL,
-                  radius INTEGER DEFAULT 100,
-                  is_active INTEGER DEFAULT 1)''')
-    
-    # Attendance table with subject
-    c.execute('''CREATE TABLE IF NOT EXISTS attendance
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  student_id INTEGER,
-                  subject_id INTEGER,
-                  timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                  status TEXT DEFAULT 'Present',
-                  location_info TEXT,
-                  FOREIGN KEY (student_id) REFERENCES students(id),
-                  FOREIGN KEY (subject_id) REFERENCES subjects(id))''')
-    
-    # Create default admin if not exists
-    c.execute("SELECT * FROM admins WHERE username = ?", ('admin',))
-    if not c.fetchone():
-        hashed_password = generate_password_hash('admin123')
-        c.execute("INSERT INTO admins (username, password) VALUES (?, ?)", ('admin', hashed_password))
+    with get_db() as conn:
+        c = conn.cursor()
+        
+        # Admin table
+        c.execute('''CREATE TABLE IF NOT EXISTS admins
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      username TEXT UNIQUE NOT NULL,
+                      password TEXT NOT NULL,
+                      created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        
+        # Students table with password
+        c.execute('''CREATE TABLE IF NOT EXISTS students
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      name TEXT NOT NULL,
+                      roll_number TEXT UNIQUE NOT NULL,
+                      password TEXT NOT NULL,
+                      encoding BLOB NOT NULL,
+                      photo_path TEXT,
+                      registered_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        add_column_if_missing(c, 'students', 'photo_hash', 'TEXT')
+        c.execute('''CREATE INDEX IF NOT EXISTS idx_students_photo_hash
+                     ON students (photo_hash)''')
+        
+        # Every face template of a student; students.encoding holds their centroid.
+        # Students without rows here (bulk imports, older databases) have just that one.
+        c.execute('''CREATE TABLE IF NOT EXISTS face_templates
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      student_id INTEGER NOT NULL,
+                      encoding BLOB NOT NULL,
+                      source TEXT NOT NULL DEFAULT 'enrolled',
+                      created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                      FOREIGN KEY (student_id) REFERENCES students(id))''')
+        c.execute('''CREATE INDEX IF NOT EXISTS idx_face_templates_student
+                     ON face_templates (student_id)''')
+        
+        # Subjects table
+        c.execute('''CREATE TABLE IF NOT EXISTS subjects
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      name TEXT NOT NULL,
+                      code TEXT UNIQUE NOT NULL,
+                      day_of_week TEXT NOT NULL,
+                      start_time TEXT NOT NULL,
+                      end_time TEXT NOT NULL,
+                      attendance_window INTEGER DEFAULT 15,
+                      created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        
+        # Location/WiFi settings
+        c.execute('''CREATE TABLE IF NOT EXISTS locations
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      name TEXT NOT NULL,
+                      wifi_ssid TEXT,
+                      ip_range TEXT,
+                      latitude REAL,
+                      longitude REAL,
+                      radius INTEGER DEFAULT 100,
+                      is_active INTEGER DEFAULT 1)''')
+        
+        # Attendance table with subject
+        c.execute('''CREATE TABLE IF NOT EXISTS attendance
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      student_id INTEGER,
+                      subject_id INTEGER,
+                      timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                      status TEXT DEFAULT 'Present',
+                      location_info TEXT,
+                      FOREIGN KEY (student_id) REFERENCES students(id),
+                      FOREIGN KEY (subject_id) REFERENCES subjects(id))''')
+        # Liveness score of the check-in burst (NULL when none was sent)
+        add_column_if_missing(c, 'attendance', 'liveness_score', 'REAL')
+        # Random key of a journaled check-in, so replaying a journal never inserts it twice
+        add_column_if_missing(c, 'attendance', 'ingest_key', 'TEXT')
+        c.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_attendance_ingest_key
+                     ON attendance (ingest_key) WHERE ingest_key IS NOT NULL''')
+        # Day of the record in Pakistan time, so daily queries can use an index
+        if add_column_if_missing(c, 'attendance', 'attendance_date', 'TEXT'):
+            backfill_attendance_dates(c)
+        c.execute('''CREATE INDEX IF NOT EXISTS idx_attendance_date_subject
+                     ON attendance (attendance_date, subject_id)''')
+        c.execute('''CREATE INDEX IF NOT EXISTS idx_attendance_student_date
+                     ON attendance (student_id, attendance_date)''')
+        # Export and pagination order: (timestamp, id)
+        c.execute('''CREATE INDEX IF NOT EXISTS idx_attendance_timestamp
+                     ON attendance (timestamp)''')
+        # One record per student, subject and day (records without a subject are not deduplicated)
+        c.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_attendance_once_per_day
+                     ON attendance (student_id, subject_id, attendance_date)''')
+        # Daily/monthly counts maintained by triggers (see rollups.py)
+        if create_rollups(c):
+            rebuild_rollups(c)
+        
+        # Which students are enrolled in which subject
+        c.execute('''CREATE TABLE IF NOT EXISTS subject_enrollments
+                     (subject_id INTEGER NOT NULL,
+                      student_id INTEGER NOT NULL,
+                      enrolled_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                      PRIMARY KEY (subject_id, student_id),
+                      FOREIGN KEY (subject_id) REFERENCES subjects(id),
+                      FOREIGN KEY (student_id) REFERENCES students(id))''')
+        c.execute('''CREATE INDEX IF NOT EXISTS idx_subject_enrollments_student
+                     ON subject_enrollments (student_id)''')
+        
+        # Bulk imports started from the web, run by a `flask bulk-import --job` process
+        c.execute('''CREATE TABLE IF NOT EXISTS import_jobs
+                     (id TEXT PRIMARY KEY,
+                      status TEXT NOT NULL DEFAULT 'queued',
+                      message TEXT,
+                      report TEXT,
+                      created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                      finished_date TIMESTAMP)''')
+        
+        # Change counters so every worker process can tell when its caches are stale
+        c.execute('''CREATE TABLE IF NOT EXISTS data_versions
+                     (name TEXT PRIMARY KEY,
+                      version INTEGER NOT NULL DEFAULT 0)''')
+        
+        # Create default admin if not exists
+        c.execute("SELECT * FROM admins WHERE username = ?", ('admin',))
+        if not c.fetchone():
+            hashed_password = generate_password_hash('admin123')
+            c.execute("INSERT INTO admins (username, password) VALUES (?, ?)", ('admin', hashed_password))
+        
+        conn.commit()
+        
+        # Databases from before the binary encoding format still hold pickled encodings,
+        # which the gallery can't read; convert them (a no-op once none are left)
+        c.execute("SELECT 1 FROM students WHERE substr(encoding, 1, 2) != CAST('FE' AS BLOB) LIMIT 1")
+        if c.fetchone():
+            migrate_encodings(conn)
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create the tables and indexes, apply migrations and add the default admin"""
+    init_db()
+    print('Database schema is up to date')
+
+@app.cli.command('migrate-encodings')
+def migrate_encodings_command():
+    """Convert pickled face encodings in the database to the binary format"""
+    with get_db() as conn:
+        converted, already_binary = migrate_encodings(conn)
+    print(f'Converted {converted} encoding(s); {already_binary} already in binary format')
+
+@app.cli.command('bulk-import')
+@click.argument('source', type=click.Path(exists=True))
+@click.argument('names_csv', type=click.Path(exists=True, dir_okay=False))
+@click.option('--workers', type=int, default=None, help='Encoding processes (default: one per core)')
+@click.option('--report', 'report_path', type=click.Path(dir_okay=False), default=None,
+              help='Write the per-file report to this JSON file')
+@click.option('--job', 'job_id', default=None, help='Record progress in this import job (set by the web upload)')
+@click.option('--allow-duplicates', is_flag=True, help='Enroll faces that match an enrolled student too')
+def bulk_import_command(source, names_csv, workers, report_path, job_id, allow_duplicates):
+    """Enroll a directory or ZIP of <roll_number>.jpg photos named by a CSV"""
+    if job_id:
+        report = run_import_job(job_id, source, names_csv, workers, allow_duplicates)
+    else:
+        report = run_bulk_import(source, names_csv, workers, allow_duplicates)
+    for entry in report['files']:
+        if entry['status'] in ('error', 'duplicate'):
+            print(f"{entry['file']}: {entry['message']}")
+    if report_path:
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(import_summary(report))
+
+@app.cli.command('audit-duplicates')
+@click.option('--tolerance', type=float, default=FACE_MATCH_TOLERANCE, show_default=True,
+              help='Report students whose faces are closer than this')
+@click.option('--report', 'report_path', type=click.Path(dir_okay=False), default=None,
+              help='Write the pairs to this JSON file')
+def audit_duplicates_command(tolerance, report_path):
+    """List pairs of enrolled students whose faces look like the same person"""
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id, name, roll_number, encoding FROM students")
+        students = {s[0]: s for s in c.fetchall()}
+        c.execute("SELECT student_id, encoding FROM face_templates")
+        templates = [t for t in c.fetchall() if t[0] in students]
+    # Every template of a student, or their one enrolled encoding if they have none
+    with_templates = {t[0] for t in templates}
+    rows = templates + [(s[0], s[3]) for s in students.values() if s[0] not in with_templates]
+    pairs = near_duplicate_pairs([r[0] for r in rows], [decode_encoding(r[1]) for r in rows], tolerance)
     
-    conn.commit()
-    conn.close()
+    found = []
+    for a, b, distance in pairs:
+        first, second = students[a], students[b]
+        print(f'{first[2]} ({first[1]}) ~ {second[2]} ({second[1]}): {distance:.3f}')
+        found.append({'students': [{'id': s[0], 'name': s[1], 'roll_number': s[2]} for s in (first, second)],
+                      'distance': round(distance, 4)})
+    if report_path:
+        with open(report_path, 'w') as f:
+            json.dump(found, f, indent=2)
+    print(f'{len(found)} pair(s) within {tolerance} among {len(students)} students')
 
-init_db()
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recompute the attendance rollup tables from the attendance history"""
+    with get_db() as conn:
+        rebuild_rollups(conn.cursor())
+        conn.commit()
+    print('Attendance rollups rebuilt')
+
+@app.cli.command('check-rollups')
+def check_rollups_command():
+    """Compare the attendance rollup tables with the attendance history"""
+    with get_db() as conn:
+        problems = check_rollups(conn.cursor())
+    if not problems:
+        print('Attendance rollups are consistent')
+        return
+    for table, diffs in problems.items():
+        for key, expected, actual in diffs:
+            print(f'{table} {key}: expected {expected}, found {actual}')
+    raise SystemExit('Attendance rollups are inconsistent; run `flask --app app rebuild-rollups`')
 
 def get_pakistan_time():
     """Get current time in Pakistan timezone"""
     return datetime.now(PAKISTAN_TZ)
 
+def get_attendance_date():
+    """Today's date in Pakistan time, as stored in attendance.attendance_date"""
+    return get_pakistan_time().strftime('%Y-%m-%d')
+
+# In-memory weekly timetable, shared by every request in this process
+timetable = Timetable()
+
+def get_timetable():
+    """Return the timetable, (re)loading it when any process changed the subjects"""
+    with get_db() as conn:
+        c = conn.cursor()
+        version = get_data_version(c, 'subjects')
+        if not timetable.loaded or timetable.version != version:
+            c.execute("""SELECT id, name, code, day_of_week, start_time, end_time, attendance_window
+                         FROM subjects""")
+            timetable.load(c.fetchall())
+            timetable.version = version
+    return timetable
+
 def get_current_subject():
     """Get the current active subject based on Pakistan time"""
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    
-    current_time = get_pakistan_time()
-    day_name = current_time.strftime('%A')
-    current_time_str = current_time.strftime('%H:%M')
-    
-    c.execute("""SELECT id, name, code, start_time, end_time, attendance_window 
-                 FROM subjects 
-                 WHERE day_of_week = ? 
-                 AND time(?) BETWEEN time(start_time) 
-                 AND time(end_time, '+' || attendance_window || ' minutes')
-                 ORDER BY start_time""", 
-              (day_name, current_time_str))
-    
-    subject = c.fetchone()
-    conn.close()
-    
-    if subject:
-        return {
-            'id': subject[0],
-            'name': subject[1],
-            'code': subject[2],
-            'start_time': subject[3],
-            'end_time': subject[4],
-            'attendance_window': subject[5]
-        }
-    return None
+    subject, _, _ = get_timetable().lookup(get_pakistan_time())
+    return dict(subject) if subject else None
+
+def current_subject_and_change():
+    """(active subject or None, seconds until the answer can next change)"""
+    now = get_pakistan_time()
+    subject, _, slot_end = get_timetable().lookup(now)
+    # Lookups are made at minute resolution, so a change lands on the next whole minute
+    change_at = -(-slot_end // 60) * 60
+    seconds_into_day = now.hour * 3600 + now.minute * 60 + now.second + now.microsecond / 1e6
+    return (dict(subject) if subject else None), max(0.5, change_at - seconds_into_day)
+
+def new_attendance_events(after_id):
+    """Attendance records inserted after `after_id`, as attendance_marked events"""
+    with get_db() as conn:
+        c = conn.cursor()
+        if after_id is None:
+            c.execute("SELECT IFNULL(MAX(id), 0) FROM attendance")
+            return c.fetchone()[0], []
+        c.execute("""SELECT a.id, a.student_id, a.timestamp, s.name, s.roll_number, sub.id, sub.name, sub.code
+                     FROM attendance a
+                     JOIN students s ON a.student_id = s.id
+                     LEFT JOIN subjects sub ON a.subject_id = sub.id
+                     WHERE a.id > ?
+                     ORDER BY a.id
+                     LIMIT 500""", (after_id,))
+        rows = c.fetchall()
+    if not rows:
+        return after_id, []
+    return rows[-1][0], [(r[1], {
+        'student_id': r[1],
+        'name': r[3],
+        'roll_number': r[4],
+        'timestamp': r[2],
+        'subject_id': r[5],
+        'subject_name': r[6] if r[6] else 'N/A',
+        'subject_code': r[7] if r[7] else 'N/A'
+    }) for r in rows]
+
+# Server-sent events for the pages open on this worker
+broker = EventBroker(SSE_MAX_CONNECTIONS, heartbeat=SSE_HEARTBEAT)
+scheduler = EventScheduler(broker, current_subject_and_change, new_attendance_events,
+                           poll_interval=SSE_POLL_INTERVAL)
+
+# Verified check-ins on their way to the attendance table
+ingest = AttendanceIngest(INGEST_JOURNAL_DIR, enabled=ATTENDANCE_INGEST == 'queue',
+                          queue_size=INGEST_QUEUE_SIZE, batch_size=INGEST_BATCH_SIZE,
+                          flush_interval=INGEST_FLUSH_MS / 1000, on_commit=scheduler.wake)
+
+def marked_students(c, student_ids, subject_id, attendance_date):
+    """Which of these students already have this subject's check-in today, written or queued"""
+    if subject_id is None or not student_ids:
+        return set()
+    marked = {s for s in student_ids if ingest.is_pending(s, subject_id, attendance_date)}
+    c.execute(f"""SELECT student_id FROM attendance
+                  WHERE subject_id = ? AND attendance_date = ?
+                  AND student_id IN ({','.join('?' * len(student_ids))})""",
+              [subject_id, attendance_date, *student_ids])
+    return marked | {r[0] for r in c.fetchall()}
+
+def bump_data_version(c, name):
+    """Record a change to `name` and return its new version"""
+    c.execute("""INSERT INTO data_versions (name, version) VALUES (?, 1)
+                 ON CONFLICT(name) DO UPDATE SET version = version + 1""", (name,))
+    c.execute("SELECT version FROM data_versions WHERE name = ?", (name,))
+    return c.fetchone()[0]
+
+def get_data_version(c, name):
+    c.execute("SELECT version FROM data_versions WHERE name = ?", (name,))
+    row = c.fetchone()
+    return row[0] if row else 0
+
+# Attendance reports, cached until the timetable, the students or the attendance change
+reports = ReportCache(REPORT_CACHE_SIZE)
+
+def get_report(start, end, subject_id=None):
+    """Expected vs attended sessions from `start` to `end` (YYYY-MM-DD, Pakistan time)"""
+    now = get_pakistan_time()
+    with get_db() as conn:
+        c = conn.cursor()
+        # Read the versions first: a change landing mid-build only makes the entry stale sooner
+        c.execute("SELECT IFNULL(MAX(id), 0) FROM attendance")
+        last_record = c.fetchone()[0]
+        versions = (get_data_version(c, 'subjects'), get_data_version(c, 'gallery'),
+                    get_data_version(c, 'rosters'), last_record)
+        subjects = load_subjects(c, pakistan_utc_offset(), subject_id)
+        last_days = last_session_days(subjects, end, now)
+        key = (start, end, subject_id)
+        report = reports.get(key, (versions, last_days))
+        if report is None:
+            report = build_report(c, subjects, start, last_days, pakistan_utc_offset())
+            reports.put(key, (versions, last_days), report)
+    return report
 
 # Face encoding functions
-def get_face_encoding(image):
-    """Extract face encoding from image"""
-    rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    faces = detector(rgb, 1)
+recognition = RecognitionService(RECOGNITION_WORKERS, RECOGNITION_QUEUE_SIZE, RECOGNITION_TIMEOUT,
+                                 preload=PRELOAD_MODELS)
+if PRELOAD_MODELS:
+    recognition.load_models()
+
+def recognition_busy_response(e):
+    """503 telling the client when to retry a saturated recognition pool or ingest queue"""
+    response = jsonify({'success': False, 'message': str(e)})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+# Recently-verified tokens: kept in the signed session cookie so every worker honours them
+verification_stats = {'face_checks': 0, 'face_rejected': 0, 'liveness_failed': 0,
+                      'token_used': 0, 'token_refused': 0, 'templates_added': 0, 'templates_evicted': 0}
+
+def device_fingerprint(location_info):
+    """Hash of the browser, client address and reported location of this request"""
+    parts = [request.headers.get('User-Agent', ''), request.access_route[0] if request.access_route else '',
+             location_info]
+    return hashlib.sha256('\n'.join(parts).encode()).hexdigest()[:32]
+
+def recently_verified(location_info):
+    """Whether this student's face was checked recently enough, here, to skip the check"""
+    if VERIFIED_REUSE_SECONDS <= 0:
+        return False
+    token = session.get('verified')
+    if not token:
+        # Nothing to reuse: not a refusal, so it stays out of token_hit_rate
+        return False
+    usable = token['student_id'] == session['user_id'] \
+        and token['date'] == get_attendance_date() \
+        and get_pakistan_time().timestamp() - token['at'] <= VERIFIED_REUSE_SECONDS \
+        and token['device'] == device_fingerprint(location_info)
+    verification_stats['token_used' if usable else 'token_refused'] += 1
+    return usable
+
+def remember_verification(location_info):
+    # Only a face check sets the time, so reusing the token never extends it
+    session['verified'] = {
+        'student_id': session['user_id'],
+        'date': get_attendance_date(),
+        'at': get_pakistan_time().timestamp(),
+        'device': device_fingerprint(location_info)
+    }
+
+# Camera frames uploaded vs turned away by the pages' own check (per worker)
+CAPTURE_REJECT_REASONS = ('dark', 'bright', 'blurry', 'no_face')
+capture_stats = {'uploaded': 0, 'no_face': 0, 'rejected': dict.fromkeys(CAPTURE_REJECT_REASONS, 0)}
+
+def count_frame(found):
+    """Count an uploaded frame, and whether the server found a face in it"""
+    capture_stats['uploaded'] += 1
+    if not found:
+        capture_stats['no_face'] += 1
+
+def compare_faces(encoding1, encoding2, tolerance=FACE_MATCH_TOLERANCE):
+    """Compare a face encoding with a stored one, or the nearest of several stored templates"""
+    distance = face_distance(encoding1, encoding2)
+    return distance < tolerance
+
+# In-memory gallery of all enrolled encodings, shared by every request in this process
+gallery = FaceGallery(index=make_index(FACE_INDEX, nprobe=FACE_INDEX_NPROBE))
+
+def get_gallery():
+    """Return the face gallery, (re)loading it when another process changed the students"""
+    with get_db() as conn:
+        c = conn.cursor()
+        version = get_data_version(c, 'gallery')
+        if not gallery.loaded or gallery.version != version:
+            c.execute("SELECT id, name, roll_number, encoding FROM students")
+            students = c.fetchall()
+            c.execute("SELECT id, student_id, encoding FROM face_templates")
+            gallery.load(((s[0], s[1], s[2], decode_encoding(s[3])) for s in students),
+                         ((t[0], t[1], decode_encoding(t[2])) for t in c.fetchall()))
+            gallery.version = version
+    return gallery
+
+def gallery_changed(version):
+    """Note a change this process has already applied to its own gallery"""
+    # Only skip the reload if nobody else changed the students in between
+    if gallery.version == version - 1:
+        gallery.version = version
+
+def rosters_changed(subject_id, version):
+    """Drop a roster this process changed itself; other processes drop theirs on next use"""
+    gallery.drop_roster(subject_id)
+    if gallery.roster_version == version - 1:
+        gallery.roster_version = version
+
+def get_roster_gallery(subject_id):
+    """Return the gallery with the subject's enrolled roster precomputed"""
+    g = get_gallery()
+    with get_db() as conn:
+        c = conn.cursor()
+        # An enrollment change elsewhere only costs the cached rosters, not a gallery reload
+        version = get_data_version(c, 'rosters')
+        if g.roster_version != version:
+            g.drop_roster()
+            g.roster_version = version
+        if not g.has_roster(subject_id):
+            c.execute("SELECT student_id FROM subject_enrollments WHERE subject_id = ?", (subject_id,))
+            g.set_roster(subject_id, [r[0] for r in c.fetchall()])
+    return g
+
+# Metrics of this worker (see metrics.py)
+metrics = Metrics(enabled=METRICS_ENABLED)
+metrics.histogram('request_seconds', 'Time to build a response, by endpoint and status')
+metrics.histogram('stage_seconds', 'Time spent in each stage of a request, by endpoint and stage')
+metrics.histogram('match_distance', 'Distance from a check-in face to the nearest enrolled face, by scope',
+                  DISTANCE_BUCKETS)
+metrics.counter('checkins_total', 'Check-in attempts (faces, for class photos) by path and outcome')
+metrics.counter('enrollments_total', 'Student registrations by outcome')
+metrics.counter('errors_total', 'Requests answered with an unexpected error, by endpoint and exception')
+metrics.counter('client_errors_total', 'Requests refused for an unusable upload, by endpoint and exception')
+
+def collect_stats():
+    """The counters the other components already keep, as metric series"""
+    pool, sse, queue = recognition.stats(), broker.stats(), ingest.stats()
+    return [
+        ('recognition_in_flight', 'gauge', 'Face encoding jobs running or waiting', [({}, pool['in_flight'])]),
+        ('recognition_rejected_total', 'counter', 'Face encoding jobs refused with 503', [({}, pool['rejected'])]),
+        ('sse_connections', 'gauge', 'Open /events streams', [({}, sse['connections'])]),
+        ('sse_events_total', 'counter', 'Server-sent events published and dropped, and streams refused',
+         [({'result': k}, sse[k]) for k in ('published', 'dropped', 'rejected')]),
+        ('ingest_queued', 'gauge', 'Check-ins journaled but not yet written', [({}, queue['queued'])]),
+        ('ingest_records_total', 'counter', 'Check-in records by result',
+         [({'result': k}, queue[k]) for k in ('journaled', 'inserted', 'ignored', 'replayed', 'rejected')]),
+        ('ingest_batches_total', 'counter', 'Group-committed check-in batches', [({}, queue['batches'])]),
+        ('ingest_write_errors_total', 'counter', 'Failed check-in batch writes', [({}, queue['write_errors'])]),
+        ('verification_total', 'counter', 'Student face checks, verified-token reuse and template changes',
+         [({'event': k}, v) for k, v in verification_stats.items()]),
+        ('capture_uploaded_total', 'counter', 'Camera frames uploaded', [({}, capture_stats['uploaded'])]),
+        ('capture_no_face_total', 'counter', 'Uploaded frames the server found no face in',
+         [({}, capture_stats['no_face'])]),
+        ('capture_rejected_total', 'counter', "Frames turned away by the pages' own check, by reason",
+         [({'reason': k}, v) for k, v in capture_stats['rejected'].items()]),
+        ('report_cache_total', 'counter', 'Report cache lookups by result',
+         [({'result': 'hit'}, reports.hits), ({'result': 'miss'}, reports.misses)]),
+        ('gallery_students', 'gauge', "Students in this worker's face gallery", [({}, len(gallery))])
+    ]
+
+metrics.add_collector(collect_stats)
+
+@app.before_request
+def start_request_timer():
+    g.timer = RequestTimer()
+
+@app.after_request
+def finish_request_timer(response):
+    timer = g.get('timer')
+    if timer is None:
+        return response
+    # Streamed responses (events, exports) are timed up to their first byte
+    endpoint = request.endpoint or 'unmatched'
+    metrics.observe('request_seconds', timer.total_ms() / 1000, endpoint=endpoint, status=response.status_code)
+    metrics.observe_stages('stage_seconds', timer.timings, endpoint=endpoint)
+    if SERVER_TIMING == 'always' or (SERVER_TIMING == 'request' and request.headers.get('X-Server-Timing') == '1'):
+        response.headers['Server-Timing'] = timer.server_timing()
+    return response
+
+def count_checkin(path, outcome, n=1):
+    if n:
+        metrics.inc('checkins_total', n, path=path, outcome=outcome)
+
+def error_response(e):
+    """The usual {'success': False} answer for an exception, counted by type
+
+    A bad upload is the client's mistake: it gets a 400 and is counted apart from
+    the unexpected errors.
+    """
+    if isinstance(e, UploadError):
+        metrics.inc('client_errors_total', endpoint=request.endpoint, error=type(e).__name__)
+        return jsonify({'success': False, 'message': str(e)}), 400
+    metrics.inc('errors_total', endpoint=request.endpoint, error=type(e).__name__)
+    return jsonify({'success': False, 'message': str(e)})
+
+def find_student(encoding, subject_id=None):
+    """Match a face against the subject's roster first, then every student"""
+    if subject_id:
+        match = get_roster_gallery(subject_id).match(encoding, subject_id=subject_id)
+        if match and match['distance'] < FACE_MATCH_TOLERANCE:
+            match['scope'] = 'subject'
+            metrics.observe('match_distance', match['distance'], scope='subject')
+            return match
     
-    if len(faces) == 0:
-        return None
+    match = get_gallery().match(encoding)
+    if match:
+        metrics.observe('match_distance', match['distance'], scope='global')
+    if match and match['distance'] < FACE_MATCH_TOLERANCE:
+        match['scope'] = 'global'
+        return match
+    return None
+
+def find_students(encodings, subject_id=None):
+    """Batched find_student: one vectorized search per scope for all faces"""
+    matches = [None] * len(encodings)
+    if not encodings:
+        return matches
     
-    shape = predictor(rgb, faces[0])
-    encoding = np.array(face_encoder.compute_face_descriptor(rgb, shape))
-    return encoding
+    pending = list(range(len(encodings)))
+    scopes = [('subject', subject_id)] if subject_id else []
+    scopes.append(('global', None))
+    for scope, scope_subject_id in scopes:
+        scope_gallery = get_roster_gallery(scope_subject_id) if scope_subject_id else get_gallery()
+        results = scope_gallery.match_many([encodings[i] for i in pending], subject_id=scope_subject_id)
+        still_pending = []
+        for i, match in zip(pending, results):
+            # Roster misses are measured again against everyone
+            if match and (scope == 'global' or match['distance'] < FACE_MATCH_TOLERANCE):
+                metrics.observe('match_distance', match['distance'], scope=scope)
+            if match and match['distance'] < FACE_MATCH_TOLERANCE:
+                match['scope'] = scope
+                matches[i] = match
+            else:
+                still_pending.append(i)
+        pending = still_pending
+        if not pending:
+            break
+    return matches
 
-def compare_faces(encoding1, encoding2, tolerance=0.6):
-    """Compare two face encodings"""
-    distance = np.linalg.norm(encoding1 - encoding2)
-    return distance < tolerance
+def find_duplicates(encodings, tolerance=FACE_MATCH_TOLERANCE):
+    """Enrolled students within tolerance of any of a new student's encodings, nearest first"""
+    nearest = {}
+    for match in get_gallery().match_many(encodings):
+        for candidate in match['candidates'] if match else []:
+            known = nearest.get(candidate['student_id'])
+            if candidate['distance'] < tolerance and (known is None or candidate['distance'] < known['distance']):
+                nearest[candidate['student_id']] = candidate
+    return sorted(nearest.values(), key=lambda c: c['distance'])
+
+def adapt_templates(student_id, encoding):
+    """Keep a confidently matched check-in face as another template of the student"""
+    if not ADAPTIVE_TEMPLATES:
+        return False
+    student = gallery.get(student_id)
+    if student is None or not ADAPTIVE_MIN_DISTANCE <= face_distance(encoding, student[2]) < ADAPTIVE_MAX_DISTANCE:
+        return False
+    try:
+        with get_db() as conn:
+            c = conn.cursor()
+            c.execute("""SELECT 1 FROM face_templates WHERE student_id = ? AND source = 'adaptive'
+                         AND created_date > DATETIME('now', '-1 day')""", (student_id,))
+            if c.fetchone():
+                return False
+            c.execute("SELECT COUNT(*) FROM face_templates WHERE student_id = ?", (student_id,))
+            if c.fetchone()[0] == 0:
+                # Enrolled with a single photo: that encoding is their first template
+                c.execute("""INSERT INTO face_templates (student_id, encoding)
+                             SELECT id, encoding FROM students WHERE id = ?""", (student_id,))
+            c.execute("""SELECT id FROM face_templates WHERE student_id = ? AND source = 'adaptive'
+                         ORDER BY id""", (student_id,))
+            adaptive = [r[0] for r in c.fetchall()]
+            c.execute("SELECT COUNT(*) FROM face_templates WHERE student_id = ?", (student_id,))
+            if c.fetchone()[0] >= FACE_MAX_TEMPLATES:
+                if not adaptive:
+                    return False
+                c.execute("DELETE FROM face_templates WHERE id = ?", (adaptive[0],))
+                verification_stats['templates_evicted'] += 1
+            c.execute("INSERT INTO face_templates (student_id, encoding, source) VALUES (?, ?, 'adaptive')",
+                      (student_id, encode_encoding(encoding)))
+            c.execute("SELECT id, encoding FROM face_templates WHERE student_id = ? ORDER BY id", (student_id,))
+            templates = [(t[0], decode_encoding(t[1])) for t in c.fetchall()]
+            centroid = mean_encoding([t[1] for t in templates])
+            c.execute("UPDATE students SET encoding = ? WHERE id = ?", (encode_encoding(centroid), student_id))
+            version = bump_data_version(c, 'gallery')
+            conn.commit()
+    except sqlite3.Error:
+        # The check-in itself is already recorded; try again on a later one
+        return False
+    gallery.add(student_id, student[0], student[1], centroid, templates)
+    gallery_changed(version)
+    verification_stats['templates_added'] += 1
+    return True
 
 # Authentication decorators
 def login_required(f):
@@ -162,6 +795,11 @@ def admin_required(f):
     wrapper.__name__ = f.__name__
     return wrapper
 
+@app.errorhandler(413)
+def payload_too_large(e):
+    limit_mb = app.config['MAX_CONTENT_LENGTH'] / (1024 * 1024)
+    return jsonify({'success': False, 'message': f'Upload too large (limit {limit_mb:.0f} MB)'}), 413
+
 # Password reset tokens (in production, use Redis or database)
 password_reset_tokens = {}
 
@@ -192,43 +830,41 @@ def request_password_reset():
     identifier = data.get('identifier')  # roll_number or username
     user_type = data.get('user_type')
     
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    
-    user_found = False
-    user_name = None
-    
-    if user_type == 'student':
-        c.execute("SELECT id, name, roll_number FROM students WHERE roll_number = ?", (identifier,))
-        user = c.fetchone()
-        if user:
-            user_found = True
-            user_name = user[1]
-            # Generate 6-digit reset code
-            import random
-            reset_code = str(random.randint(100000, 999999))
-            password_reset_tokens[identifier] = {
-                'code': reset_code,
-                'type': 'student',
-                'id': user[0],
-                'expires': datetime.now() + timedelta(minutes=15)
-            }
-    else:
-        c.execute("SELECT id, username FROM admins WHERE username = ?", (identifier,))
-        user = c.fetchone()
-        if user:
-            user_found = True
-            user_name = user[1]
-            import random
-            reset_code = str(random.randint(100000, 999999))
-            password_reset_tokens[identifier] = {
-                'code': reset_code,
-                'type': 'admin',
-                'id': user[0],
-                'expires': datetime.now() + timedelta(minutes=15)
-            }
-    
-    conn.close()
+    with get_db() as conn:
+        c = conn.cursor()
+        
+        user_found = False
+        user_name = None
+        
+        if user_type == 'student':
+            c.execute("SELECT id, name, roll_number FROM students WHERE roll_number = ?", (identifier,))
+            user = c.fetchone()
+            if user:
+                user_found = True
+                user_name = user[1]
+                # Generate 6-digit reset code
+                import random
+                reset_code = str(random.randint(100000, 999999))
+                password_reset_tokens[identifier] = {
+                    'code': reset_code,
+                    'type': 'student',
+                    'id': user[0],
+                    'expires': datetime.now() + timedelta(minutes=15)
+                }
+        else:
+            c.execute("SELECT id, username FROM admins WHERE username = ?", (identifier,))
+            user = c.fetchone()
+            if user:
+                user_found = True
+                user_name = user[1]
+                import random
+                reset_code = str(random.randint(100000, 999999))
+                password_reset_tokens[identifier] = {
+                    'code': reset_code,
+                    'type': 'admin',
+                    'id': user[0],
+                    'expires': datetime.now() + timedelta(minutes=15)
+                }
     
     if user_found:
         # In production, send this via email/SMS
@@ -265,17 +901,16 @@ def reset_password():
         return jsonify({'success': False, 'message': 'Invalid reset code'})
     
     # Update password
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    hashed_password = generate_password_hash(new_password)
-    
-    if token_data['type'] == 'student':
-        c.execute("UPDATE students SET password = ? WHERE id = ?", (hashed_password, token_data['id']))
-    else:
-        c.execute("UPDATE admins SET password = ? WHERE id = ?", (hashed_password, token_data['id']))
-    
-    conn.commit()
-    conn.close()
+    with get_db() as conn:
+        c = conn.cursor()
+        hashed_password = generate_password_hash(new_password)
+        
+        if token_data['type'] == 'student':
+            c.execute("UPDATE students SET password = ? WHERE id = ?", (hashed_password, token_data['id']))
+        else:
+            c.execute("UPDATE admins SET password = ? WHERE id = ?", (hashed_password, token_data['id']))
+        
+        conn.commit()
     
     # Remove used token
     del password_reset_tokens[identifier]
@@ -289,30 +924,27 @@ def login():
     password = data.get('password')
     user_type = data.get('user_type')
     
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    
-    if user_type == 'admin':
-        c.execute("SELECT * FROM admins WHERE username = ?", (username,))
-        user = c.fetchone()
-        if user and check_password_hash(user[2], password):
-            session['user_id'] = user[0]
-            session['username'] = user[1]
-            session['user_type'] = 'admin'
-            conn.close()
-            return jsonify({'success': True, 'redirect': '/admin'})
-    else:
-        c.execute("SELECT * FROM students WHERE roll_number = ?", (username,))
-        user = c.fetchone()
-        if user and check_password_hash(user[3], password):
-            session['user_id'] = user[0]
-            session['username'] = user[1]
-            session['user_type'] = 'student'
-            session['roll_number'] = user[2]
-            conn.close()
-            return jsonify({'success': True, 'redirect': '/student'})
-    
-    conn.close()
+    with get_db() as conn:
+        c = conn.cursor()
+        
+        if user_type == 'admin':
+            c.execute("SELECT * FROM admins WHERE username = ?", (username,))
+            user = c.fetchone()
+            if user and check_password_hash(user[2], password):
+                session['user_id'] = user[0]
+                session['username'] = user[1]
+                session['user_type'] = 'admin'
+                return jsonify({'success': True, 'redirect': '/admin'})
+        else:
+            c.execute("SELECT * FROM students WHERE roll_number = ?", (username,))
+            user = c.fetchone()
+            if user and check_password_hash(user[3], password):
+                session['user_id'] = user[0]
+                session['username'] = user[1]
+                session['user_type'] = 'student'
+                session['roll_number'] = user[2]
+                return jsonify({'success': True, 'redirect': '/student'})
+        
     return jsonify({'success': False, 'message': 'Invalid credentials'})
 
 @app.route('/logout')
@@ -342,53 +974,211 @@ def register_student():
         name = request.form.get('name')
         roll_number = request.form.get('roll_number')
         password = request.form.get('password')
-        image_data = request.form.get('image')
-        
-        # Decode base64 image
-        img_data = base64.b64decode(image_data.split(',')[1])
-        nparr = np.frombuffer(img_data, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        # Several photos (different light, angles) become separate templates
+        images = read_uploaded_frames(request, field='images', max_frames=ENROLL_MAX_IMAGES) \
+            or [read_uploaded_image(request)]
         
-        # Get face encoding
-        encoding = get_face_encoding(img)
-        if encoding is None:
+        # Get face encodings, keeping only photos good enough to match against later
+        faces = []
+        rejected = []
+        for data in images:
+            with g.timer.stage('recognition'):
+                result = recognition.encode_enrollment(data, g.timer.timings)
+            count_frame(result is not None)
+            if result is None:
+                continue
+            encoding, quality = result
+            if quality['score'] < ENROLL_MIN_QUALITY:
+                rejected.append(quality)
+            else:
+                faces.append((data, encoding, quality))
+        if not faces:
+            if rejected:
+                best = max(rejected, key=lambda q: q['score'])
+                metrics.inc('enrollments_total', outcome='low_quality')
+                return jsonify({'success': False, 'quality': best,
+                                'message': f'Photo quality too low ({quality_reason(best)}), please retake it'})
+            metrics.inc('enrollments_total', outcome='no_face')
             return jsonify({'success': False, 'message': 'No face detected in image'})
+        img_data = faces[0][0]
+        encodings = np.array([encoding for _, encoding, _ in faces], dtype=np.float32)
+        encoding = mean_encoding(encodings)
+        # Every pair of photos has to match each other, or they aren't all the same student
+        if np.linalg.norm(encodings[:, None] - encodings[None], axis=2).max() >= FACE_MATCH_TOLERANCE:
+            metrics.inc('enrollments_total', outcome='mismatch')
+            return jsonify({'success': False, 'message': 'The photos do not look like the same person'})
+        
+        # The same person enrolled again, e.g. under another roll number
+        if ENROLL_DUPLICATE_CHECK and request.form.get('allow_duplicate') != '1':
+            with g.timer.stage('duplicates'):
+                duplicates = find_duplicates(encodings)
+            if duplicates:
+                metrics.inc('enrollments_total', outcome='duplicate')
+                return jsonify({
+                    'success': False,
+                    'message': f"This face matches {duplicates[0]['name']} ({duplicates[0]['roll_number']}), "
+                               f"who is already enrolled",
+                    'duplicates': duplicates
+                })
         
         # Save photo
         photo_path = os.path.join(UPLOAD_FOLDER, f"{roll_number}.jpg")
-        cv2.imwrite(photo_path, img)
+        if img_data[:2] == b'\xff\xd8':
+            # Already a JPEG: store the uploaded bytes as they are
+            with open(photo_path, 'wb') as f:
+                f.write(img_data)
+        else:
+            img = cv2.imdecode(np.frombuffer(img_data, np.uint8), cv2.IMREAD_COLOR)
+            cv2.imwrite(photo_path, img)
         
         # Hash password
         hashed_password = generate_password_hash(password)
         
         # Save to database
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute("INSERT INTO students (name, roll_number, password, encoding, photo_path) VALUES (?, ?, ?, ?, ?)",
-                  (name, roll_number, hashed_password, pickle.dumps(encoding), photo_path))
-        conn.commit()
-        conn.close()
+        with get_db() as conn:
+            c = conn.cursor()
+            c.execute("""INSERT INTO students (name, roll_number, password, encoding, photo_path, photo_hash)
+                         VALUES (?, ?, ?, ?, ?, ?)""",
+                      (name, roll_number, hashed_password, encode_encoding(encoding), photo_path,
+                       hashlib.sha256(img_data).hexdigest()))
+            student_id = c.lastrowid
+            templates = []
+            for template in encodings:
+                c.execute("INSERT INTO face_templates (student_id, encoding) VALUES (?, ?)",
+                          (student_id, encode_encoding(template)))
+                templates.append((c.lastrowid, template))
+            version = bump_data_version(c, 'gallery')
+            conn.commit()
+        
+        gallery.add(student_id, name, roll_number, encoding, templates)
+        gallery_changed(version)
+        metrics.inc('enrollments_total', outcome='enrolled')
         
-        return jsonify({'success': True, 'message': 'Student registered successfully'})
+        skipped = len(images) - len(faces)
+        return jsonify({
+            'success': True,
+            'message': 'Student registered successfully' +
+                       (f' ({skipped} photo(s) without a clear face were skipped)' if skipped else ''),
+            'templates': len(templates),
+            'quality': min(quality['score'] for _, _, quality in faces)
+        })
+    except (RecognitionBusy, IngestBusy) as e:
+        return recognition_busy_response(e)
+    except RequestEntityTooLarge as e:
+        return payload_too_large(e)
     except sqlite3.IntegrityError:
         return jsonify({'success': False, 'message': 'Roll number already exists'})
+    except Exception as e:
+        return error_response(e)
+
+def run_bulk_import(source, names_csv, workers=None, allow_duplicates=False):
+    """Run a bulk enrollment and make every worker's gallery pick it up"""
+    check_duplicates = ENROLL_DUPLICATE_CHECK and not allow_duplicates
+    with get_db() as conn:
+        report = bulk_enroll(conn, source, names_csv, UPLOAD_FOLDER, workers=workers,
+                             min_quality=ENROLL_MIN_QUALITY, max_extracted_bytes=BULK_IMPORT_MAX_EXTRACTED_BYTES,
+                             duplicate_tolerance=FACE_MATCH_TOLERANCE if check_duplicates else None)
+        if report['enrolled']:
+            bump_data_version(conn.cursor(), 'gallery')
+            conn.commit()
+    return report
+
+def import_summary(report):
+    return (f"Enrolled {report['enrolled']}, skipped {report['skipped']}, "
+            f"duplicates {report['duplicates']}, errors {report['errors']}")
+
+def set_import_job(job_id, status, message=None, report=None):
+    with get_db() as conn:
+        conn.execute("""UPDATE import_jobs SET status = ?, message = ?, report = ?,
+                        finished_date = CASE WHEN ? IN ('done', 'failed') THEN CURRENT_TIMESTAMP END
+                        WHERE id = ?""",
+                     (status, message, json.dumps(report) if report is not None else None, status, job_id))
+        conn.commit()
+
+def run_import_job(job_id, source, names_csv, workers=None, allow_duplicates=False):
+    """Run an uploaded import, recording its outcome, then delete the upload"""
+    set_import_job(job_id, 'running')
+    try:
+        report = run_bulk_import(source, names_csv, workers, allow_duplicates)
+    except Exception as e:
+        set_import_job(job_id, 'failed', str(e))
+        raise
+    finally:
+        shutil.rmtree(os.path.join(IMPORT_JOBS_DIR, job_id), ignore_errors=True)
+    set_import_job(job_id, 'done', import_summary(report), report)
+    return report
+
+@app.route('/students/bulk_import', methods=['POST'])
+@admin_required
+def bulk_import_students():
+    """Start enrolling a ZIP of <roll_number>.jpg photos with a CSV of names; returns a job id"""
+    try:
+        # Photo archives for a whole intake are far bigger than a single capture
+        request.max_content_length = BULK_IMPORT_MAX_BYTES
+        archive = request.files.get('archive')
+        names = request.files.get('names')
+        if not archive or not names:
+            return jsonify({'success': False, 'message': 'Upload a ZIP of photos (archive) and a CSV of names (names)'})
+        
+        job_id = secrets.token_hex(8)
+        job_dir = os.path.join(IMPORT_JOBS_DIR, job_id)
+        os.makedirs(job_dir)
+        archive_path = os.path.join(job_dir, 'photos.zip')
+        names_path = os.path.join(job_dir, 'names.csv')
+        archive.save(archive_path)
+        names.save(names_path)
+        with get_db() as conn:
+            conn.execute("INSERT INTO import_jobs (id) VALUES (?)", (job_id,))
+            conn.commit()
+        
+        # Its own process, not a thread here: an import can take minutes and starts a pool of
+        # encoder processes, and neither belongs in a threaded web worker
+        command = [sys.executable, '-m', 'flask', '--app', 'app', 'bulk-import',
+                   archive_path, names_path, '--job', job_id]
+        if request.form.get('allow_duplicate') == '1':
+            command.append('--allow-duplicates')
+        job = subprocess.Popen(command, stdout=subprocess.DEVNULL, start_new_session=True)
+        threading.Thread(target=job.wait, daemon=True).start()
+        return jsonify({'success': True, 'message': 'Import started', 'job_id': job_id}), 202
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+@app.route('/students/bulk_import/<job_id>')
+@admin_required
+def bulk_import_status(job_id):
+    """Status of a bulk import job, with its per-file report once done"""
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT status, message, report, created_date, finished_date FROM import_jobs WHERE id = ?",
+                  (job_id,))
+        job = c.fetchone()
+    if job is None:
+        return jsonify({'success': False, 'message': 'Import job not found'}), 404
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status': job[0],
+        'message': job[1],
+        'report': json.loads(job[2]) if job[2] else None,
+        'created_date': job[3],
+        'finished_date': job[4]
+    })
+
 # Subject Management
 @app.route('/subjects/add', methods=['POST'])
 @admin_required
 def add_subject():
     try:
         data = request.json
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute("""INSERT INTO subjects (name, code, day_of_week, start_time, end_time, attendance_window)
-                     VALUES (?, ?, ?, ?, ?, ?)""",
-                  (data['name'], data['code'], data['day_of_week'], 
-                   data['start_time'], data['end_time'], data['attendance_window']))
-        conn.commit()
-        conn.close()
+        with get_db() as conn:
+            c = conn.cursor()
+            c.execute("""INSERT INTO subjects (name, code, day_of_week, start_time, end_time, attendance_window)
+                         VALUES (?, ?, ?, ?, ?, ?)""",
+                      (data['name'], data['code'], data['day_of_week'], 
+                       data['start_time'], data['end_time'], data['attendance_window']))
+            bump_data_version(c, 'subjects')
+            conn.commit()
+        scheduler.wake()
         return jsonify({'success': True, 'message': 'Subject added successfully'})
     except sqlite3.IntegrityError:
         return jsonify({'success': False, 'message': 'Subject code already exists'})
@@ -398,11 +1188,10 @@ def add_subject():
 @app.route('/subjects/list')
 @admin_required
 def list_subjects():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT * FROM subjects ORDER BY day_of_week, start_time")
-    subjects = c.fetchall()
-    conn.close()
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT * FROM subjects ORDER BY day_of_week, start_time")
+        subjects = c.fetchall()
     
     return jsonify([{
         'id': s[0],
@@ -418,11 +1207,15 @@ def list_subjects():
 @admin_required
 def delete_subject(subject_id):
     try:
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute("DELETE FROM subjects WHERE id = ?", (subject_id,))
-        conn.commit()
-        conn.close()
+        with get_db() as conn:
+            c = conn.cursor()
+            c.execute("DELETE FROM subject_enrollments WHERE subject_id = ?", (subject_id,))
+            c.execute("DELETE FROM subjects WHERE id = ?", (subject_id,))
+            bump_data_version(c, 'subjects')
+            version = bump_data_version(c, 'rosters')
+            conn.commit()
+        rosters_changed(subject_id, version)
+        scheduler.wake()
         return jsonify({'success': True, 'message': 'Subject deleted successfully'})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
@@ -432,33 +1225,100 @@ def delete_subject(subject_id):
 def update_subject(subject_id):
     try:
         data = request.json
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute("""UPDATE subjects 
-                     SET name = ?, code = ?, day_of_week = ?, start_time = ?, end_time = ?, attendance_window = ?
-                     WHERE id = ?""",
-                  (data['name'], data['code'], data['day_of_week'], 
-                   data['start_time'], data['end_time'], data['attendance_window'], subject_id))
-        conn.commit()
-        conn.close()
+        with get_db() as conn:
+            c = conn.cursor()
+            c.execute("""UPDATE subjects 
+                         SET name = ?, code = ?, day_of_week = ?, start_time = ?, end_time = ?, attendance_window = ?
+                         WHERE id = ?""",
+                      (data['name'], data['code'], data['day_of_week'], 
+                       data['start_time'], data['end_time'], data['attendance_window'], subject_id))
+            bump_data_version(c, 'subjects')
+            conn.commit()
+        scheduler.wake()
         return jsonify({'success': True, 'message': 'Subject updated successfully'})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+def resolve_student_ids(c, data):
+    """Collect student ids from a request's student_ids and/or roll_numbers lists"""
+    student_ids = [int(i) for i in data.get('student_ids', [])]
+    roll_numbers = data.get('roll_numbers', [])
+    if roll_numbers:
+        placeholders = ','.join('?' * len(roll_numbers))
+        c.execute(f"SELECT id FROM students WHERE roll_number IN ({placeholders})", roll_numbers)
+        student_ids.extend(r[0] for r in c.fetchall())
+    return student_ids
+
+@app.route('/subjects/<int:subject_id>/enroll', methods=['POST'])
+@admin_required
+def enroll_students(subject_id):
+    """Bulk-enroll students in a subject"""
+    try:
+        data = request.json
+        with get_db() as conn:
+            c = conn.cursor()
+            student_ids = resolve_student_ids(c, data)
+            c.executemany("INSERT OR IGNORE INTO subject_enrollments (subject_id, student_id) VALUES (?, ?)",
+                          [(subject_id, student_id) for student_id in student_ids])
+            enrolled = c.rowcount
+            version = bump_data_version(c, 'rosters')
+            conn.commit()
+        rosters_changed(subject_id, version)
+        return jsonify({'success': True, 'message': f'{enrolled} student(s) enrolled'})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+@app.route('/subjects/<int:subject_id>/unenroll', methods=['POST'])
+@admin_required
+def unenroll_students(subject_id):
+    """Bulk-remove students from a subject"""
+    try:
+        data = request.json
+        with get_db() as conn:
+            c = conn.cursor()
+            student_ids = resolve_student_ids(c, data)
+            c.executemany("DELETE FROM subject_enrollments WHERE subject_id = ? AND student_id = ?",
+                          [(subject_id, student_id) for student_id in student_ids])
+            removed = c.rowcount
+            version = bump_data_version(c, 'rosters')
+            conn.commit()
+        rosters_changed(subject_id, version)
+        return jsonify({'success': True, 'message': f'{removed} student(s) unenrolled'})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+@app.route('/subjects/<int:subject_id>/students')
+@admin_required
+def list_enrolled_students(subject_id):
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("""SELECT s.id, s.name, s.roll_number, e.enrolled_date
+                     FROM subject_enrollments e
+                     JOIN students s ON e.student_id = s.id
+                     WHERE e.subject_id = ?
+                     ORDER BY s.roll_number""", (subject_id,))
+        students = c.fetchall()
+    
+    return jsonify([{
+        'id': s[0],
+        'name': s[1],
+        'roll_number': s[2],
+        'enrolled_date': s[3]
+    } for s in students])
+
 # Location Management
 @app.route('/locations/add', methods=['POST'])
 @admin_required
 def add_location():
     try:
         data = request.json
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute("""INSERT INTO locations (name, wifi_ssid, ip_range, latitude, longitude, radius)
-                     VALUES (?, ?, ?, ?, ?, ?)""",
-                  (data['name'], data.get('wifi_ssid'), data.get('ip_range'),
-                   data.get('latitude'), data.get('longitude'), data.get('radius', 100)))
-        conn.commit()
-        conn.close()
+        with get_db() as conn:
+            c = conn.cursor()
+            c.execute("""INSERT INTO locations (name, wifi_ssid, ip_range, latitude, longitude, radius)
+                         VALUES (?, ?, ?, ?, ?, ?)""",
+                      (data['name'], data.get('wifi_ssid'), data.get('ip_range'),
+                       data.get('latitude'), data.get('longitude'), data.get('radius', 100)))
+            conn.commit()
         return jsonify({'success': True, 'message': 'Location added successfully'})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
@@ -466,11 +1326,10 @@ def add_location():
 @app.route('/locations/list')
 @admin_required
 def list_locations():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT * FROM locations WHERE is_active = 1")
-    locations = c.fetchall()
-    conn.close()
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT * FROM locations WHERE is_active = 1")
+        locations = c.fetchall()
     
     return jsonify([{
         'id': l[0],
@@ -486,11 +1345,10 @@ def list_locations():
 @admin_required
 def delete_location(location_id):
     try:
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute("UPDATE locations SET is_active = 0 WHERE id = ?", (location_id,))
-        conn.commit()
-        conn.close()
+        with get_db() as conn:
+            c = conn.cursor()
+            c.execute("UPDATE locations SET is_active = 0 WHERE id = ?", (location_id,))
+            conn.commit()
         return jsonify({'success': True, 'message': 'Location deleted successfully'})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
@@ -500,15 +1358,14 @@ def delete_location(location_id):
 def update_location(location_id):
     try:
         data = request.json
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute("""UPDATE locations 
-                     SET name = ?, wifi_ssid = ?, ip_range = ?, latitude = ?, longitude = ?, radius = ?
-                     WHERE id = ?""",
-                  (data['name'], data.get('wifi_ssid'), data.get('ip_range'),
-                   data.get('latitude'), data.get('longitude'), data.get('radius', 100), location_id))
-        conn.commit()
-        conn.close()
+        with get_db() as conn:
+            c = conn.cursor()
+            c.execute("""UPDATE locations 
+                         SET name = ?, wifi_ssid = ?, ip_range = ?, latitude = ?, longitude = ?, radius = ?
+                         WHERE id = ?""",
+                      (data['name'], data.get('wifi_ssid'), data.get('ip_range'),
+                       data.get('latitude'), data.get('longitude'), data.get('radius', 100), location_id))
+            conn.commit()
         return jsonify({'success': True, 'message': 'Location updated successfully'})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
@@ -517,150 +1374,402 @@ def update_location(location_id):
 @login_required
 def get_active_subject():
     """Get currently active subject for attendance"""
-    subject = get_current_subject()
+    tt = get_timetable()
+    now = get_pakistan_time()
+    subject, slot_start, slot_end = tt.lookup(now)
     if subject:
-        return jsonify({'success': True, 'subject': subject})
-    return jsonify({'success': False, 'message': 'No active class at this time'})
+        response = jsonify({'success': True, 'subject': subject})
+    else:
+        response = jsonify({'success': False, 'message': 'No active class at this time'})
+    
+    # The answer only changes at the next slot boundary or when the timetable is edited
+    response.set_etag(f"{tt.version}-{now.strftime('%Y%m%d')}-{slot_start}")
+    seconds_into_day = now.hour * 3600 + now.minute * 60 + now.second
+    response.cache_control.private = True
+    response.cache_control.max_age = max(0, min(TIMETABLE_MAX_AGE, slot_end - seconds_into_day))
+    return response.make_conditional(request)
+
+@app.route('/events')
+@login_required
+def events():
+    """Server-sent events: class_start, window_close and attendance_marked"""
+    subscriber = broker.subscribe(session['user_type'], session['user_id'])
+    if subscriber is None:
+        response = jsonify({'success': False, 'message': 'Too many open event streams, falling back to polling'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '60'
+        return response
+    scheduler.start()
+    return Response(broker.stream(subscriber), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/events/stats')
+@admin_required
+def event_stats():
+    """Open event streams on this worker"""
+    return jsonify(broker.stats())
+
+@app.route('/metrics')
+def metrics_view():
+    """Prometheus text metrics of the worker that answers"""
+    token = request.headers.get('Authorization', '')
+    if session.get('user_type') != 'admin' and \
+            not (METRICS_TOKEN and hmac.compare_digest(token.encode(), f'Bearer {METRICS_TOKEN}'.encode())):
+        return jsonify({'success': False, 'message': 'Admin access required'}), 403
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/ingest/stats')
+@admin_required
+def ingest_stats():
+    """Check-ins queued, written and ignored by this worker's ingest queue"""
+    return jsonify(ingest.stats())
+
+@app.route('/capture_settings')
+@login_required
+def capture_settings():
+    """Frame size, JPEG quality and local check thresholds for the camera pages"""
+    response = jsonify(CAPTURE_SETTINGS)
+    response.headers['Cache-Control'] = 'private, max-age=300'
+    return response
+
+@app.route('/capture/rejected', methods=['POST'])
+@login_required
+def capture_rejected():
+    """A page turned a frame away without uploading it"""
+    reason = request.values.get('reason')
+    if reason in CAPTURE_REJECT_REASONS:
+        capture_stats['rejected'][reason] += 1
+    return '', 204
+
+@app.route('/capture/stats')
+@admin_required
+def capture_stats_view():
+    """Frames uploaded vs rejected on the device, on the worker that answers"""
+    rejected = sum(capture_stats['rejected'].values())
+    return jsonify({
+        'uploaded': capture_stats['uploaded'],
+        'no_face': capture_stats['no_face'],
+        'no_face_rate': round(capture_stats['no_face'] / capture_stats['uploaded'], 3)
+                        if capture_stats['uploaded'] else None,
+        'rejected_on_device': capture_stats['rejected'],
+        # Every rejected frame is an upload and a face detection the server didn't run
+        'rejected_share': round(rejected / (rejected + capture_stats['uploaded']), 3)
+                          if rejected + capture_stats['uploaded'] else None
+    })
+
+@app.route('/verification/stats')
+@admin_required
+def verification_stats_view():
+    """Face checks vs recently-verified token reuse on the worker that answers"""
+    attempts = verification_stats['token_used'] + verification_stats['token_refused']
+    return jsonify({
+        **verification_stats,
+        'reuse_seconds': VERIFIED_REUSE_SECONDS,
+        'token_hit_rate': round(verification_stats['token_used'] / attempts, 3) if attempts else None
+    })
 
 @app.route('/mark_attendance', methods=['POST'])
 @login_required
 def mark_attendance():
     """Mark attendance using face recognition with time and location validation"""
+    path = 'student' if session.get('user_type') == 'student' else 'admin'
+    timer = g.timer
     try:
-        image_data = request.form.get('image')
-        location_info = request.form.get('location_info', '')
+        location_info = request.values.get('location_info', '')
         
         # Check if there's an active subject
         current_subject = get_current_subject()
         if not current_subject and session['user_type'] == 'student':
+            count_checkin(path, 'no_class')
             return jsonify({'success': False, 'message': 'No active class at this time. Attendance window closed.'})
         
-        # Decode image
-        img_data = base64.b64decode(image_data.split(',')[1])
-        nparr = np.frombuffer(img_data, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        # Get face encoding
-        encoding = get_face_encoding(img)
-        if encoding is None:
-            return jsonify({'success': False, 'message': 'No face detected'})
+        # For students, only verify their own identity, against the in-memory gallery
+        verified_by = 'face'
+        if session['user_type'] == 'student':
+            with timer.stage('gallery'):
+                student = get_gallery().get(session['user_id'])
+            if student is None:
+                return jsonify({'success': False, 'message': 'Student not found'})
+            matched_student = (session['user_id'], student[0], student[1])
+            # Don't spend a face check on a class that is already marked
+            with timer.stage('db'), get_db() as conn:
+                already_marked = marked_students(conn.cursor(), [session['user_id']], current_subject['id'],
+                                                 get_attendance_date())
+            if already_marked:
+                count_checkin(path, 'already_marked')
+                return jsonify({'success': False,
+                                'message': f"Attendance already marked for {current_subject['name']} today"})
+            if recently_verified(location_info):
+                verified_by = 'token'
         
-        # Compare with database
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
+        liveness = None
+        if verified_by == 'face':
+            frames = read_uploaded_frames(request, max_frames=LIVENESS_FRAMES) if LIVENESS_MODE != 'off' else []
+            if frames:
+                # Detect on the first frame, track the face through the rest
+                with timer.stage('recognition'):
+                    result = recognition.encode_live(frames, timer.timings)
+                encoding, liveness = result if result else (None, None)
+            elif LIVENESS_MODE == 'enforce' and session['user_type'] == 'student':
+                return jsonify({'success': False, 'message': 'Please update the page: a short video burst is required'})
+            else:
+                img_data = read_uploaded_image(request)
+                
+                # Get face encoding
+                with timer.stage('recognition'):
+                    encoding = recognition.encode(img_data, timer.timings)
+            count_frame(encoding is not None)
+            if encoding is None:
+                count_checkin(path, 'no_face')
+                return jsonify({'success': False, 'message': 'No face detected'})
         
-        # For students, only verify their own identity
-        if session['user_type'] == 'student':
-            c.execute("SELECT id, name, roll_number, encoding FROM students WHERE id = ?", (session['user_id'],))
-            student = c.fetchone()
-            if student:
-                stored_encoding = pickle.loads(student[3])
-                if not compare_faces(encoding, stored_encoding):
-                    conn.close()
-                    return jsonify({'success': False, 'message': 'Face does not match your registered profile'})
-                matched_student = student
+        with get_db() as conn:
+            c = conn.cursor()
+            
+            if session['user_type'] == 'student':
+                if verified_by == 'face':
+                    verification_stats['face_checks'] += 1
+                    with timer.stage('match'):
+                        distance = face_distance(encoding, student[2])
+                    metrics.observe('match_distance', distance, scope='own')
+                    if distance >= FACE_MATCH_TOLERANCE:
+                        verification_stats['face_rejected'] += 1
+                        count_checkin(path, 'mismatch')
+                        return jsonify({'success': False, 'message': 'Face does not match your registered profile'})
+                    if LIVENESS_MODE == 'enforce' and liveness['score'] < LIVENESS_MIN_SCORE:
+                        verification_stats['liveness_failed'] += 1
+                        count_checkin(path, 'liveness_failed')
+                        return jsonify({'success': False, 'liveness': liveness,
+                                        'message': 'Liveness check failed. Blink or turn your head slightly and try again.'})
+                    remember_verification(location_info)
+                    confident = liveness is None or liveness['score'] >= LIVENESS_MIN_SCORE
             else:
-                conn.close()
-                return jsonify({'success': False, 'message': 'Student not found'})
-        else:
-            # For admin marking attendance
-            c.execute("SELECT id, name, roll_number, encoding FROM students")
-            students = c.fetchall()
+                # For admin marking attendance, pick the closest face in the class roster
+                with timer.stage('match'):
+                    match = find_student(encoding, current_subject['id'] if current_subject else None)
+                if not match:
+                    count_checkin(path, 'not_recognized')
+                    return jsonify({'success': False, 'message': 'Face not recognized'})
+                matched_student = (match['student_id'], match['name'], match['roll_number'])
+                # Only a face no other student comes close to may become a template
+                confident = match['margin'] is None or match['distance'] + match['margin'] >= FACE_MATCH_TOLERANCE
             
-            matched_student = None
-            for student in students:
-                stored_encoding = pickle.loads(student[3])
-                if compare_faces(encoding, stored_encoding):
-                    matched_student = student
-                    break
+            student_id = matched_student[0]
+            subject_id = current_subject['id'] if current_subject else None
+            attendance_date = get_attendance_date()
+            if session['user_type'] != 'student':
+                with timer.stage('db'):
+                    already_marked = marked_students(c, [student_id], subject_id, attendance_date)
+                if already_marked:
+                    count_checkin(path, 'already_marked')
+                    subject_name = current_subject['name']
+                    return jsonify({'success': False, 'message': f'Attendance already marked for {subject_name} today'})
+        
+        # Acknowledged once journaled; the unique index still ignores a racing second mark
+        with timer.stage('ingest'):
+            ingest.submit([{'student_id': student_id, 'subject_id': subject_id, 'location_info': location_info,
+                            'attendance_date': attendance_date,
+                            'liveness_score': liveness['score'] if liveness else None}])
+        count_checkin(path, 'marked')
+        if verified_by == 'face' and confident:
+            with timer.stage('adapt'):
+                adapt_templates(student_id, encoding)
+        subject_info = f" for {current_subject['name']}" if current_subject else ""
+        return jsonify({
+            'success': True,
+            'message': f'Attendance marked for {matched_student[1]} ({matched_student[2]}){subject_info}',
+            'verified_by': verified_by,
+            'liveness': liveness
+        })
             
-            if not matched_student:
-                conn.close()
-                return jsonify({'success': False, 'message': 'Face not recognized'})
+    except (RecognitionBusy, IngestBusy) as e:
+        count_checkin(path, 'busy')
+        return recognition_busy_response(e)
+    except RequestEntityTooLarge as e:
+        return payload_too_large(e)
+    except UploadError as e:
+        count_checkin(path, 'bad_upload')
+        return error_response(e)
+    except Exception as e:
+        count_checkin(path, 'error')
+        return error_response(e)
+
+@app.route('/mark_attendance/batch', methods=['POST'])
+@admin_required
+def mark_attendance_batch():
+    """Mark attendance for every recognized face in one classroom photo"""
+    try:
+        location_info = request.values.get('location_info', '')
         
-        student_id = matched_student[0]
+        current_subject = get_current_subject()
         subject_id = current_subject['id'] if current_subject else None
         
-        # Check if already marked for this subject today
-        if subject_id:
-            c.execute("""SELECT * FROM attendance 
-                        WHERE student_id = ? 
-                        AND subject_id = ?
-                        AND DATE(timestamp) = DATE('now')""", (student_id, subject_id))
-            if c.fetchone():
-                conn.close()
-                subject_name = current_subject['name']
-                return jsonify({'success': False, 'message': f'Attendance already marked for {subject_name} today'})
+        img_data = read_uploaded_image(request)
         
-        # Mark attendance
-        c.execute("INSERT INTO attendance (student_id, subject_id, location_info) VALUES (?, ?, ?)", 
-                  (student_id, subject_id, location_info))
-        conn.commit()
-        conn.close()
+        with g.timer.stage('recognition'):
+            detected = recognition.encode_all(img_data, g.timer.timings)
+        count_frame(bool(detected))
+        if not detected:
+            count_checkin('batch', 'no_face')
+            return jsonify({'success': False, 'message': 'No face detected'})
+        
+        with g.timer.stage('match'):
+            matches = find_students([encoding for _, encoding in detected], subject_id)
+        
+        # The same student can only be marked once; keep their closest face
+        best_face = {}
+        for i, match in enumerate(matches):
+            if match and (match['student_id'] not in best_face or
+                          match['distance'] < matches[best_face[match['student_id']]]['distance']):
+                best_face[match['student_id']] = i
+        
+        attendance_date = get_attendance_date()
+        with g.timer.stage('db'), get_db() as conn:
+            already_marked = marked_students(conn.cursor(), list(best_face), subject_id, attendance_date)
+        to_mark = [student_id for student_id in best_face if student_id not in already_marked]
+        with g.timer.stage('ingest'):
+            ingest.submit([{'student_id': student_id, 'subject_id': subject_id, 'location_info': location_info,
+                            'attendance_date': attendance_date, 'liveness_score': None} for student_id in to_mark])
+        
+        faces = []
+        for i, ((box, _), match) in enumerate(zip(detected, matches)):
+            face = {'box': box}
+            if not match:
+                face['status'] = 'unknown'
+            else:
+                face.update({
+                    'student_id': match['student_id'],
+                    'name': match['name'],
+                    'roll_number': match['roll_number'],
+                    'distance': match['distance'],
+                    'scope': match['scope']
+                })
+                if best_face[match['student_id']] != i:
+                    face['status'] = 'duplicate'
+                elif match['student_id'] in already_marked:
+                    face['status'] = 'already_marked'
+                else:
+                    face['status'] = 'marked'
+            faces.append(face)
+        for status in ('marked', 'already_marked', 'duplicate'):
+            count_checkin('batch', status, sum(1 for f in faces if f['status'] == status))
         
         subject_info = f" for {current_subject['name']}" if current_subject else ""
+        unknown = sum(1 for f in faces if f['status'] == 'unknown')
+        count_checkin('batch', 'not_recognized', unknown)
         return jsonify({
             'success': True,
-            'message': f'Attendance marked for {matched_student[1]} ({matched_student[2]}){subject_info}'
+            'message': f'Attendance marked for {len(to_mark)} student(s){subject_info}; {unknown} face(s) not recognized',
+            'marked': len(to_mark),
+            'already_marked': len(already_marked),
+            'unknown': unknown,
+            'faces': faces
         })
             
+    except (RecognitionBusy, IngestBusy) as e:
+        count_checkin('batch', 'busy')
+        return recognition_busy_response(e)
+    except RequestEntityTooLarge as e:
+        return payload_too_large(e)
+    except UploadError as e:
+        count_checkin('batch', 'bad_upload')
+        return error_response(e)
     except Exception as e:
-        return jsonify({'success': False, 'message': str(e)})
+        count_checkin('batch', 'error')
+        return error_response(e)
+
+def page_args():
+    """(limit, cursor) from ?limit=&after=; limit is None when the client wants everything
+
+    Raises ValueError for a ?limit= that isn't a number or an ?after= that isn't
+    a next_cursor this API handed out.
+    """
+    limit = request.args.get('limit')
+    if limit is not None:
+        try:
+            limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        except ValueError:
+            raise ValueError('Invalid ?limit=; pass a number of rows') from None
+    cursor = None
+    after = request.args.get('after')
+    if after:
+        timestamp, _, record_id = after.rpartition('|')
+        try:
+            datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
+            cursor = (timestamp, int(record_id))
+        except ValueError:
+            raise ValueError('Invalid ?after= cursor; pass the next_cursor of the previous page') from None
+    return limit, cursor
+
+def bad_page_response(e):
+    return jsonify({'success': False, 'message': str(e)}), 400
+
+def fetch_attendance_page(c, columns, where, params, limit=None, cursor=None):
+    """Newest-first attendance rows, keyset-paginated on (timestamp, id)
+
+    `columns` must start with a.id, a.timestamp. Returns (rows, next_cursor);
+    next_cursor is None on the last page.
+    """
+    where, params = list(where), list(params)
+    if cursor:
+        where.append("(a.timestamp, a.id) < (?, ?)")
+        params.extend(cursor)
+    sql = f"""SELECT {columns}
+              FROM attendance a
+              JOIN students s ON a.student_id = s.id
+              LEFT JOIN subjects sub ON a.subject_id = sub.id
+              WHERE {' AND '.join(where) or '1'}
+              ORDER BY a.timestamp DESC, a.id DESC"""
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+    c.execute(sql, params)
+    rows = c.fetchall()
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        return rows, f"{rows[-1][1]}|{rows[-1][0]}"
+    return rows, None
+
+def paged_response(records, next_cursor, limit):
+    """A plain list for old clients, or {'records', 'next'} when ?limit= was given"""
+    if limit is None:
+        return jsonify(records)
+    return jsonify({'records': records, 'next': next_cursor})
 
 @app.route('/get_attendance')
 @login_required
 def get_attendance():
     """Get attendance records"""
-    date = request.args.get('date', datetime.now().strftime('%Y-%m-%d'))
+    date = request.args.get('date') or get_attendance_date()
     subject_id = request.args.get('subject_id')
+    try:
+        limit, cursor = page_args()
+    except ValueError as e:
+        return bad_page_response(e)
     
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    
+    where, params = ["a.attendance_date = ?"], [date]
     if session['user_type'] == 'student':
         # Students see only their own attendance
-        if subject_id:
-            c.execute("""SELECT s.name, s.roll_number, a.timestamp, a.status, sub.name, sub.code
-                         FROM attendance a
-                         JOIN students s ON a.student_id = s.id
-                         LEFT JOIN subjects sub ON a.subject_id = sub.id
-                         WHERE s.id = ? AND a.subject_id = ? AND DATE(a.timestamp) = ?
-                         ORDER BY a.timestamp DESC""", (session['user_id'], subject_id, date))
-        else:
-            c.execute("""SELECT s.name, s.roll_number, a.timestamp, a.status, sub.name, sub.code
-                         FROM attendance a
-                         JOIN students s ON a.student_id = s.id
-                         LEFT JOIN subjects sub ON a.subject_id = sub.id
-                         WHERE s.id = ? AND DATE(a.timestamp) = ?
-                         ORDER BY a.timestamp DESC""", (session['user_id'], date))
-    else:
-        # Admin sees all attendance
-        if subject_id:
-            c.execute("""SELECT s.name, s.roll_number, a.timestamp, a.status, sub.name, sub.code
-                         FROM attendance a
-                         JOIN students s ON a.student_id = s.id
-                         LEFT JOIN subjects sub ON a.subject_id = sub.id
-                         WHERE a.subject_id = ? AND DATE(a.timestamp) = ?
-                         ORDER BY a.timestamp DESC""", (subject_id, date))
-        else:
-            c.execute("""SELECT s.name, s.roll_number, a.timestamp, a.status, sub.name, sub.code
-                         FROM attendance a
-                         JOIN students s ON a.student_id = s.id
-                         LEFT JOIN subjects sub ON a.subject_id = sub.id
-                         WHERE DATE(a.timestamp) = ?
-                         ORDER BY a.timestamp DESC""", (date,))
+        where.append("a.student_id = ?")
+        params.append(session['user_id'])
+    if subject_id:
+        where.append("a.subject_id = ?")
+        params.append(subject_id)
     
-    records = c.fetchall()
-    conn.close()
+    with get_db() as conn:
+        records, next_cursor = fetch_attendance_page(
+            conn.cursor(), "a.id, a.timestamp, s.name, s.roll_number, a.status, sub.name, sub.code, a.liveness_score",
+            where, params, limit, cursor)
     
-    return jsonify([{
-        'name': r[0],
-        'roll_number': r[1],
-        'timestamp': r[2],
-        'status': r[3],
-        'subject_name': r[4] if r[4] else 'N/A',
-        'subject_code': r[5] if r[5] else 'N/A'
-    } for r in records])
+    return paged_response([{
+        'name': r[2],
+        'roll_number': r[3],
+        'timestamp': r[1],
+        'status': r[4],
+        'subject_name': r[5] if r[5] else 'N/A',
+        'subject_code': r[6] if r[6] else 'N/A',
+        'liveness_score': r[7]
+    } for r in records], next_cursor, limit)
 
 @app.route('/get_my_attendance')
 @login_required
@@ -668,34 +1777,159 @@ def get_my_attendance():
     """Get student's full attendance history"""
     if session['user_type'] != 'student':
         return jsonify({'success': False, 'message': 'Not authorized'}), 403
+    try:
+        limit, cursor = page_args()
+    except ValueError as e:
+        return bad_page_response(e)
     
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("""SELECT DATE(a.timestamp) as date, a.timestamp, a.status, sub.name, sub.code
-                 FROM attendance a
-                 LEFT JOIN subjects sub ON a.subject_id = sub.id
-                 WHERE a.student_id = ?
-                 ORDER BY a.timestamp DESC""", (session['user_id'],))
-    records = c.fetchall()
-    conn.close()
+    with get_db() as conn:
+        records, next_cursor = fetch_attendance_page(
+            conn.cursor(), "a.id, a.timestamp, a.attendance_date, a.status, sub.name, sub.code",
+            ["a.student_id = ?"], [session['user_id']], limit, cursor)
     
-    return jsonify([{
-        'date': r[0],
+    return paged_response([{
+        'date': r[2],
         'timestamp': r[1],
-        'status': r[2],
-        'subject_name': r[3] if r[3] else 'N/A',
-        'subject_code': r[4] if r[4] else 'N/A'
-    } for r in records])
+        'status': r[3],
+        'subject_name': r[4] if r[4] else 'N/A',
+        'subject_code': r[5] if r[5] else 'N/A'
+    } for r in records], next_cursor, limit)
+
+EXPORT_COLUMNS = ['id', 'date', 'timestamp', 'student_id', 'roll_number', 'name',
+                  'subject_id', 'subject_code', 'subject_name', 'status', 'location_info', 'liveness_score']
+
+def pakistan_day_start_utc(day):
+    """UTC timestamp (as stored in attendance.timestamp) of midnight Pakistan time on `day`"""
+    start = PAKISTAN_TZ.localize(datetime.combine(day, time.min))
+    return start.astimezone(pytz.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+def export_rows(where, params):
+    """Yield attendance rows oldest first, straight from a SQLite cursor"""
+    with get_db() as conn:
+        c = conn.execute(f"""SELECT a.id, a.attendance_date, a.timestamp, a.student_id, s.roll_number, s.name,
+                                    a.subject_id, sub.code, sub.name, a.status, a.location_info, a.liveness_score
+                             FROM attendance a
+                             JOIN students s ON a.student_id = s.id
+                             LEFT JOIN subjects sub ON a.subject_id = sub.id
+                             WHERE {' AND '.join(where) or '1'}
+                             ORDER BY a.timestamp, a.id""", params)
+        while True:
+            rows = c.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+            yield rows
+
+def export_csv(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+def export_ndjson(batches):
+    for rows in batches:
+        yield ''.join(json.dumps(dict(zip(EXPORT_COLUMNS, r))) + '\n' for r in rows)
+
+@app.route('/attendance/export')
+@login_required
+def export_attendance():
+    """Stream attendance records as CSV or NDJSON (?from=&to=&subject_id=&student_id=&format=)"""
+    try:
+        today = get_pakistan_time().date()
+        start = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') else None
+        end = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else today
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Dates must be YYYY-MM-DD'}), 400
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'success': False, 'message': 'format must be csv or ndjson'}), 400
+    
+    # Filter on the timestamp range covering the Pakistan-time days so rows come
+    # off the timestamp index already in export order (no sort, flat memory)
+    where, params = ["a.timestamp < ?"], [pakistan_day_start_utc(end + timedelta(days=1))]
+    if start:
+        where.append("a.timestamp >= ?")
+        params.append(pakistan_day_start_utc(start))
+    if request.args.get('subject_id'):
+        where.append("a.subject_id = ?")
+        params.append(request.args.get('subject_id', type=int))
+    if session['user_type'] == 'student':
+        where.append("a.student_id = ?")
+        params.append(session['user_id'])
+    elif request.args.get('student_id'):
+        where.append("a.student_id = ?")
+        params.append(request.args.get('student_id', type=int))
+    
+    batches = export_rows(where, params)
+    filename = f"attendance_{start or 'all'}_{end}.{fmt}"
+    if fmt == 'csv':
+        body, mimetype = export_csv(batches), 'text/csv'
+    else:
+        body, mimetype = export_ndjson(batches), 'application/x-ndjson'
+    return Response(body, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+def report_range():
+    """(from, to) as YYYY-MM-DD from ?from=&to=, defaulting to this month so far"""
+    today = get_pakistan_time().date()
+    start = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') \
+        else today.replace(day=1)
+    end = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else today
+    return start.isoformat(), end.isoformat()
+
+@app.route('/reports/attendance')
+@login_required
+def attendance_report():
+    """Expected vs attended sessions per student and subject (?from=&to=&subject_id=&threshold=&below=1)"""
+    try:
+        start, end = report_range()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Dates must be YYYY-MM-DD'}), 400
+    threshold = request.args.get('threshold', LOW_ATTENDANCE_THRESHOLD, type=float)
+    report = get_report(start, end, request.args.get('subject_id', type=int))
+    
+    mask = None
+    if session['user_type'] == 'student':
+        # Students see only their own rows
+        mask = report.student(session['user_id'])
+    if request.args.get('below'):
+        below = report.below(threshold)
+        mask = below if mask is None else mask & below
+    
+    response = {
+        'success': True,
+        'from': start,
+        'to': end,
+        'threshold': threshold,
+        'students': report.rows(threshold, mask)
+    }
+    if session['user_type'] == 'admin':
+        response['subjects'] = report.subject_summary(threshold)
+    return jsonify(response)
+
+@app.route('/reports/absentees')
+@admin_required
+def absentee_report():
+    """Students missing from each class held on a day (?date=&subject_id=)"""
+    try:
+        day = datetime.strptime(request.args.get('date') or get_attendance_date(), '%Y-%m-%d').date().isoformat()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Dates must be YYYY-MM-DD'}), 400
+    report = get_report(day, day, request.args.get('subject_id', type=int))
+    return jsonify({'success': True, 'date': day, 'subjects': report.absentees()})
 
 @app.route('/get_students')
 @admin_required
 def get_students():
     """Get all registered students"""
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT id, name, roll_number, registered_date FROM students")
-    students = c.fetchall()
-    conn.close()
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id, name, roll_number, registered_date FROM students")
+        students = c.fetchall()
     
     return jsonify([{
         'id': s[0],
@@ -708,13 +1942,20 @@ def get_students():
 @admin_required
 def delete_student(student_id):
     try:
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        # Also delete their attendance records
-        c.execute("DELETE FROM attendance WHERE student_id = ?", (student_id,))
-        c.execute("DELETE FROM students WHERE id = ?", (student_id,))
-        conn.commit()
-        conn.close()
+        # Write this worker's queued check-ins first so the DELETE below takes them too;
+        # those still queued elsewhere are dropped by the ingest insert once the student is gone
+        ingest.drain(5.0)
+        with get_db() as conn:
+            c = conn.cursor()
+            # Also delete their attendance records
+            c.execute("DELETE FROM attendance WHERE student_id = ?", (student_id,))
+            c.execute("DELETE FROM subject_enrollments WHERE student_id = ?", (student_id,))
+            c.execute("DELETE FROM face_templates WHERE student_id = ?", (student_id,))
+            c.execute("DELETE FROM students WHERE id = ?", (student_id,))
+            version = bump_data_version(c, 'gallery')
+            conn.commit()
+        gallery.remove(student_id)
+        gallery_changed(version)
         return jsonify({'success': True, 'message': 'Student deleted successfully'})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
@@ -724,20 +1965,22 @@ def delete_student(student_id):
 def update_student(student_id):
     try:
         data = request.json
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        
-        # Update basic info
-        c.execute("""UPDATE students SET name = ?, roll_number = ? WHERE id = ?""",
-                  (data['name'], data['roll_number'], student_id))
-        
-        # Update password if provided
-        if data.get('password'):
-            hashed_password = generate_password_hash(data['password'])
-            c.execute("UPDATE students SET password = ? WHERE id = ?", (hashed_password, student_id))
-        
-        conn.commit()
-        conn.close()
+        with get_db() as conn:
+            c = conn.cursor()
+            
+            # Update basic info
+            c.execute("""UPDATE students SET name = ?, roll_number = ? WHERE id = ?""",
+                      (data['name'], data['roll_number'], student_id))
+            
+            # Update password if provided
+            if data.get('password'):
+                hashed_password = generate_password_hash(data['password'])
+                c.execute("UPDATE students SET password = ? WHERE id = ?", (hashed_password, student_id))
+            
+            version = bump_data_version(c, 'gallery')
+            conn.commit()
+        gallery.update(student_id, name=data['name'], roll_number=data['roll_number'])
+        gallery_changed(version)
         return jsonify({'success': True, 'message': 'Student updated successfully'})
     except sqlite3.IntegrityError:
         return jsonify({'success': False, 'message': 'Roll number already exists'})
@@ -748,37 +1991,35 @@ def update_student(student_id):
 @admin_required
 def get_stats():
     """Get attendance statistics"""
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    
-    # Total students
-    c.execute("SELECT COUNT(*) FROM students")
-    total_students = c.fetchone()[0]
-    
-    # Today's attendance
-    c.execute("""SELECT COUNT(DISTINCT student_id) FROM attendance 
-                 WHERE DATE(timestamp) = DATE('now')""")
-    today_present = c.fetchone()[0]
-    
-    # Total subjects
-    c.execute("SELECT COUNT(*) FROM subjects")
-    total_subjects = c.fetchone()[0]
-    
-    # This month's total attendance records
-    c.execute("""SELECT COUNT(*) FROM attendance
-                 WHERE strftime('%Y-%m', timestamp) = strftime('%Y-%m', 'now')""")
-    month_attendance = c.fetchone()[0]
-    
-    conn.close()
-    
+    with get_db() as conn:
+        c = conn.cursor()
+        
+        # Total students
+        c.execute("SELECT COUNT(*) FROM students")
+        total_students = c.fetchone()[0]
+        
+        # Today's attendance (one rollup row, however long the history). The dashboard
+        # polls this, so who missed which class is left to /reports/absentees
+        today = get_pakistan_time()
+        today_present = get_totals(c, today.strftime('%Y-%m-%d'))[1]
+        today_absent = total_students - today_present
+        
+        # Total subjects
+        c.execute("SELECT COUNT(*) FROM subjects")
+        total_subjects = c.fetchone()[0]
+        
+        # This month's total attendance records
+        month_attendance = get_totals(c, today.strftime('%Y-%m'))[0]
+        
     return jsonify({
         'total_students': total_students,
         'today_present': today_present,
-        'today_absent': total_students - today_present,
+        'today_absent': today_absent,
         'total_subjects': total_subjects,
         'month_attendance': month_attendance
     })
 
 if __name__ == '__main__':
+    init_db()
     port = int(os.environ.get("PORT", 5001))
     app.run(debug=True, host='0.0.0.0', port=port)
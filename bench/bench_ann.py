@@ -0,0 +1,92 @@
+"""Recall@1 and latency of the approximate face index against exact search
+
+Synthetic identities are drawn to look like dlib descriptors (same-person
+distance around 0.35, different-person distance around 0.9). Each query is a
+noisy re-capture of an enrolled identity.
+
+    python bench/bench_ann.py
+    python bench/bench_ann.py --sizes 1000 10000 --nprobe 4 8 16 --queries 500
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from face_index import ExactIndex, IVFIndex
+
+
+def synthetic_gallery(n, dim=128, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.normal(size=(n, dim)) * (0.9 / np.sqrt(2 * dim))).astype(np.float32)
+
+
+def synthetic_queries(gallery, count, noise=0.35, seed=1):
+    rng = np.random.default_rng(seed)
+    truth = rng.integers(0, len(gallery), size=count)
+    jitter = rng.normal(size=(count, gallery.shape[1])) * (noise / np.sqrt(gallery.shape[1]))
+    return (gallery[truth] + jitter).astype(np.float32), truth
+
+
+def time_queries(index, queries, **kwargs):
+    latencies, results = [], []
+    for q in queries:
+        start = time.perf_counter()
+        ids, _ = index.search(q, 1, **kwargs)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(ids[0] if len(ids) else -1)
+    return np.array(results), np.array(latencies)
+
+
+def run(sizes, nprobes, n_queries):
+    report = []
+    for n in sizes:
+        vectors = synthetic_gallery(n)
+        ids = np.arange(n)
+        queries, _ = synthetic_queries(vectors, n_queries)
+
+        exact = ExactIndex()
+        exact.build(ids, vectors)
+        exact_ids, exact_ms = time_queries(exact, queries)
+        report.append({'size': n, 'index': 'exact', 'nprobe': None, 'recall_at_1': 1.0,
+                       'p50_ms': float(np.percentile(exact_ms, 50)),
+                       'p99_ms': float(np.percentile(exact_ms, 99))})
+
+        start = time.perf_counter()
+        ivf = IVFIndex()
+        ivf.build(ids, vectors)
+        build_s = time.perf_counter() - start
+
+        for nprobe in nprobes:
+            ivf_ids, ivf_ms = time_queries(ivf, queries, nprobe=nprobe)
+            report.append({'size': n, 'index': 'ivf', 'nprobe': nprobe,
+                           'recall_at_1': float(np.mean(ivf_ids == exact_ids)),
+                           'p50_ms': float(np.percentile(ivf_ms, 50)),
+                           'p99_ms': float(np.percentile(ivf_ms, 99)),
+                           'build_s': build_s})
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--json', action='store_true', help='print the raw report as JSON')
+    args = parser.parse_args()
+
+    report = run(args.sizes, args.nprobe, args.queries)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{'size':>8} {'index':>6} {'nprobe':>7} {'recall@1':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for r in report:
+        print(f"{r['size']:>8} {r['index']:>6} {str(r['nprobe'] or '-'):>7} "
+              f"{r['recall_at_1']:>9.3f} {r['p50_ms']:>8.3f} {r['p99_ms']:>8.3f}")
+
+
+if __name__ == '__main__':
+    main()
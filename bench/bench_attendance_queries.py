@@ -0,0 +1,145 @@
+"""Daily attendance queries: DATE(timestamp) scans vs the indexed attendance_date column
+
+Seeds a database in the old schema (no attendance_date, no secondary
+indexes) with N attendance records, times the queries the dashboard used to
+run, then lets init_db migrate it and times the rewritten queries.
+
+    python bench/bench_attendance_queries.py --rows 5000000
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+LEGACY_SCHEMA = [
+    '''CREATE TABLE students
+       (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, roll_number TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL, encoding BLOB NOT NULL, photo_path TEXT,
+        registered_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''',
+    '''CREATE TABLE subjects
+       (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, code TEXT UNIQUE NOT NULL,
+        day_of_week TEXT NOT NULL, start_time TEXT NOT NULL, end_time TEXT NOT NULL,
+        attendance_window INTEGER DEFAULT 15, created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''',
+    '''CREATE TABLE attendance
+       (id INTEGER PRIMARY KEY AUTOINCREMENT, student_id INTEGER, subject_id INTEGER,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP, status TEXT DEFAULT 'Present', location_info TEXT)''',
+]
+
+LIST_COLUMNS = """SELECT s.name, s.roll_number, a.timestamp, a.status, sub.name, sub.code
+                  FROM attendance a
+                  JOIN students s ON a.student_id = s.id
+                  LEFT JOIN subjects sub ON a.subject_id = sub.id"""
+
+# name -> (old query, new query); parameters are filled in by query_params()
+QUERIES = {
+    'day listing': (
+        LIST_COLUMNS + " WHERE DATE(a.timestamp) = :day ORDER BY a.timestamp DESC",
+        LIST_COLUMNS + " WHERE a.attendance_date = :day ORDER BY a.timestamp DESC"),
+    'day listing, one subject': (
+        LIST_COLUMNS + " WHERE a.subject_id = :subject AND DATE(a.timestamp) = :day ORDER BY a.timestamp DESC",
+        LIST_COLUMNS + " WHERE a.attendance_date = :day AND a.subject_id = :subject ORDER BY a.timestamp DESC"),
+    'already marked check': (
+        "SELECT * FROM attendance WHERE student_id = :student AND subject_id = :subject AND DATE(timestamp) = :day",
+        "SELECT * FROM attendance WHERE student_id = :student AND subject_id = :subject AND attendance_date = :day"),
+    'stats: present today': (
+        "SELECT COUNT(DISTINCT student_id) FROM attendance WHERE DATE(timestamp) = :day",
+        "SELECT COUNT(DISTINCT student_id) FROM attendance WHERE attendance_date = :day"),
+    'stats: records this month': (
+        "SELECT COUNT(*) FROM attendance WHERE strftime('%Y-%m', timestamp) = :month",
+        "SELECT COUNT(*) FROM attendance WHERE attendance_date >= :month_start AND attendance_date < :next_month"),
+}
+
+
+def seed(path, rows, students, subjects, days):
+    conn = sqlite3.connect(path)
+    for statement in LEGACY_SCHEMA:
+        conn.execute(statement)
+    conn.executemany("INSERT INTO students (name, roll_number, password, encoding) VALUES (?, ?, ?, ?)",
+                     ((f'Student {i}', f'R{i:06d}', 'x', b'') for i in range(students)))
+    conn.executemany("INSERT INTO subjects (name, code, day_of_week, start_time, end_time) VALUES (?, ?, ?, ?, ?)",
+                     ((f'Subject {i}', f'S{i}', 'Monday', '09:00', '10:00') for i in range(subjects)))
+
+    rng = np.random.default_rng(0)
+    start = datetime(2026, 1, 1) - timedelta(days=days)
+    chunk = 500000
+    for offset in range(0, rows, chunk):
+        n = min(chunk, rows - offset)
+        seconds = np.sort(rng.integers(0, days * 86400, n))
+        student_ids = rng.integers(1, students + 1, n)
+        subject_ids = rng.integers(1, subjects + 1, n)
+        conn.executemany("INSERT INTO attendance (student_id, subject_id, timestamp) VALUES (?, ?, ?)",
+                         ((int(st), int(su), (start + timedelta(seconds=int(t))).strftime('%Y-%m-%d %H:%M:%S'))
+                          for st, su, t in zip(student_ids, subject_ids, seconds)))
+        conn.commit()
+    conn.close()
+    return start + timedelta(days=days - 1)
+
+
+def query_params(day):
+    month_start = day.replace(day=1)
+    next_month = (month_start + timedelta(days=32)).replace(day=1)
+    return {'day': day.strftime('%Y-%m-%d'), 'month': day.strftime('%Y-%m'), 'subject': 3, 'student': 42,
+            'month_start': month_start.strftime('%Y-%m-%d'), 'next_month': next_month.strftime('%Y-%m-%d')}
+
+
+def time_query(conn, sql, params, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def query_plan(conn, sql, params):
+    return '; '.join(row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5000000)
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--subjects', type=int, default=20)
+    parser.add_argument('--days', type=int, default=3 * 365)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        start = time.perf_counter()
+        last_day = seed(path, args.rows, args.students, args.subjects, args.days)
+        print(f'seeded {args.rows} attendance rows in {time.perf_counter() - start:.1f} s')
+        params = query_params(last_day)
+
+        conn = sqlite3.connect(path)
+        before = {name: time_query(conn, old, params, args.repeat) for name, (old, _) in QUERIES.items()}
+        conn.close()
+
+        # init_db adds attendance_date, backfills it and builds the indexes
+        os.environ['DB_FILE'] = path
+        os.chdir(tmp)
+        start = time.perf_counter()
+        import app
+        app.init_db()
+        print(f'migration (init_db):  {time.perf_counter() - start:.1f} s')
+
+        conn = sqlite3.connect(path)
+        print(f'\n{"query":28s} {"before ms":>10s} {"after ms":>10s} {"speedup":>9s}')
+        for name, (_, new) in QUERIES.items():
+            after = time_query(conn, new, params, args.repeat)
+            print(f'{name:28s} {before[name] * 1000:10.2f} {after * 1000:10.2f} {before[name] / after:8.0f}x')
+        print('\nquery plans after migration:')
+        for name, (_, new) in QUERIES.items():
+            print(f'  {name:28s} {query_plan(conn, new, params)}')
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Latency of the fast detection pipeline vs the original full-frame pass
+
+Runs both on every photo in static/uploads (needs the dlib model files in the
+project root):
+
+  * baseline: cvtColor on the full frame, detector(rgb, 1), landmarks and
+    descriptor on the full frame (the original get_face_encoding)
+  * pipeline: face_engine.get_face_encoding (downscaled detection without
+    upsampling, then landmarks/descriptor on a full-resolution crop)
+
+and reports per-image latency, the pipeline's per-stage breakdown, the
+descriptor drift between the two paths, and whether every pairwise match
+decision (distance < 0.6) comes out the same.
+
+    python bench/bench_detection.py --repeat 10
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+import face_engine
+
+TOLERANCE = 0.6
+
+
+def baseline_encoding(image):
+    rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    faces = face_engine.detector(rgb, 1)
+    if len(faces) == 0:
+        return None
+    shape = face_engine.predictor(rgb, faces[0])
+    return np.array(face_engine.face_encoder.compute_face_descriptor(rgb, shape))
+
+
+def timed(fn, image, repeat):
+    samples, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(image)
+        samples.append((time.perf_counter() - start) * 1000)
+    return result, float(np.median(samples))
+
+
+def decisions(encodings):
+    matrix = np.array(encodings)
+    dist = np.linalg.norm(matrix[:, None, :] - matrix[None, :, :], axis=2)
+    return dist < TOLERANCE
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', default=os.path.join('static', 'uploads', '*.jpg'))
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    base_encodings, fast_encodings = [], []
+    stage_totals = {}
+    print(f"{'image':<24} {'size':>9} {'baseline ms':>12} {'pipeline ms':>12} {'drift':>8}")
+    for path in sorted(glob.glob(args.images)):
+        image = cv2.imread(path)
+        base, base_ms = timed(baseline_encoding, image, args.repeat)
+        fast, fast_ms = timed(face_engine.get_face_encoding, image, args.repeat)
+
+        timings = {}
+        face_engine.get_face_encoding(image, timings)
+        for stage, ms in timings.items():
+            stage_totals.setdefault(stage, []).append(ms)
+
+        if base is None or fast is None:
+            drift = 'no face' if base is None and fast is None else 'MISMATCH'
+        else:
+            base_encodings.append(base)
+            fast_encodings.append(fast)
+            drift = f'{np.linalg.norm(base - fast):.4f}'
+        size = f'{image.shape[1]}x{image.shape[0]}'
+        print(f'{os.path.basename(path):<24} {size:>9} {base_ms:>12.1f} {fast_ms:>12.1f} {drift:>8}')
+
+    print('\npipeline stages (median ms):')
+    for stage, values in stage_totals.items():
+        print(f'  {stage:<12} {np.median(values):8.2f}')
+
+    if base_encodings:
+        same = np.array_equal(decisions(base_encodings), decisions(fast_encodings))
+        print(f'\nidentical match decisions across {len(base_encodings)} faces: {same}')
+
+
+if __name__ == '__main__':
+    main()
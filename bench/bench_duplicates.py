@@ -0,0 +1,110 @@
+"""Duplicate-enrollment audit: blocked matrix search against a per-pair Python loop
+
+Synthetic students look like dlib descriptors (as in bench_ann.py), two
+templates each, with --duplicates of them enrolled a second time under
+another id (a noisy re-capture, distance about 0.35). For each size this
+times near_duplicate_pairs (what `flask --app app audit-duplicates` runs)
+and, up to --loop-max rows, the obvious loop over every pair, checks that
+both find the same pairs, and times the check a registration makes against
+the gallery (find_duplicates: one batched search for its photos). It also
+times scoring an enrollment photo's quality on the static/uploads photos,
+with a synthetic frontal landmark set (no model files needed).
+
+    python bench/bench_duplicates.py --sizes 1000 10000 50000
+"""
+import argparse
+import glob
+import itertools
+import os
+import sys
+import time
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from face_gallery import FaceGallery, near_duplicate_pairs
+from face_quality import score_quality
+from liveness import POSE_LANDMARKS, POSE_MODEL
+
+TOLERANCE = 0.6
+
+
+def synthetic_students(n, duplicates, templates=2, dim=128, seed=0):
+    """(owners, vectors): `templates` rows per student, the last `duplicates` students re-enrolled ones"""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(n, dim)) * (0.9 / np.sqrt(2 * dim))
+    centres[n - duplicates:] = centres[:duplicates] + rng.normal(size=(duplicates, dim)) * (0.35 / np.sqrt(dim))
+    vectors = np.repeat(centres, templates, axis=0) + rng.normal(size=(n * templates, dim)) * (0.2 / np.sqrt(dim))
+    return np.repeat(np.arange(n), templates), vectors.astype(np.float32)
+
+
+def loop_pairs(owners, vectors, tolerance):
+    nearest = {}
+    for i, j in itertools.combinations(range(len(vectors)), 2):
+        if owners[i] == owners[j]:
+            continue
+        distance = float(np.linalg.norm(vectors[i] - vectors[j]))
+        if distance < tolerance:
+            key = (min(owners[i], owners[j]), max(owners[i], owners[j]))
+            nearest[key] = min(nearest.get(key, distance), distance)
+    return nearest
+
+
+def frontal_landmarks(width, height):
+    camera = np.array([[width, 0, width / 2], [0, width, height / 2], [0, 0, 1]], dtype=np.float64)
+    points, _ = cv2.projectPoints(POSE_MODEL, np.array([np.pi, 0, 0]), np.array([0, 0, 1500.0]), camera,
+                                  np.zeros(4))
+    landmarks = np.zeros((68, 2))
+    landmarks[POSE_LANDMARKS] = points.reshape(-1, 2)
+    return landmarks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--duplicates', type=int, default=20)
+    parser.add_argument('--block-size', type=int, default=2048)
+    parser.add_argument('--loop-max', type=int, default=2000, help='Largest row count to run the Python loop on')
+    parser.add_argument('--photos', type=int, default=3, help='Photos per registration for the gallery check')
+    args = parser.parse_args()
+
+    print(f"{'students':>8s} {'rows':>7s} {'pairs':>6s} {'blocked':>9s} {'loop':>9s} {'same':>5s} "
+          f"{'register check':>15s}")
+    for n in args.sizes:
+        owners, vectors = synthetic_students(n, args.duplicates)
+        start = time.perf_counter()
+        pairs = near_duplicate_pairs(owners, vectors, TOLERANCE, args.block_size)
+        blocked_s = time.perf_counter() - start
+
+        loop, same = '-', '-'
+        if len(vectors) <= args.loop_max:
+            start = time.perf_counter()
+            expected = loop_pairs(owners, vectors, TOLERANCE)
+            loop = f'{time.perf_counter() - start:8.2f}s'
+            same = 'yes' if sorted(expected) == sorted((a, b) for a, b, _ in pairs) else 'NO'
+
+        gallery = FaceGallery()
+        templates = [(row, owner, vector) for row, (owner, vector) in enumerate(zip(owners, vectors))]
+        gallery.load([(i, f'n{i}', f'r{i}', vectors[owners == i].mean(axis=0)) for i in range(n)], templates)
+        probes = vectors[:args.photos]
+        start = time.perf_counter()
+        for _ in range(20):
+            gallery.match_many(probes)
+        check_ms = (time.perf_counter() - start) / 20 * 1000
+        print(f'{n:8d} {len(vectors):7d} {len(pairs):6d} {blocked_s:8.2f}s {loop:>9s} {same:>5s} '
+              f'{check_ms:13.2f}ms')
+
+    photos = sorted(glob.glob(os.path.join(ROOT, 'static', 'uploads', '*.jpg')))
+    if photos:
+        images = [cv2.imread(path) for path in photos]
+        start = time.perf_counter()
+        for image in images * 10:
+            height, width = image.shape[:2]
+            score_quality(image, (width // 4, height // 4, 3 * width // 4, 3 * height // 4),
+                          frontal_landmarks(width, height))
+        print(f'quality score: {(time.perf_counter() - start) / (len(images) * 10) * 1000:.2f} ms per photo')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Gallery load time: pickled float64 encodings vs binary float32 encodings
+
+Builds two throwaway SQLite databases holding the same N synthetic students,
+one in the legacy pickle format and one in the encoding_store format, then
+times SELECT + decode + stacking into the gallery matrix for each.
+
+    python bench/bench_encoding_storage.py --students 10000
+"""
+import argparse
+import os
+import pickle
+import sqlite3
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from encoding_store import encode_encoding, decode_encoding
+
+
+def build_db(path, encodings, serialize):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE students (id INTEGER PRIMARY KEY, name TEXT, roll_number TEXT, encoding BLOB)")
+    conn.executemany("INSERT INTO students VALUES (?, ?, ?, ?)",
+                     ((i, f'Student {i}', f'R{i:06d}', serialize(e)) for i, e in enumerate(encodings)))
+    conn.commit()
+    conn.close()
+
+
+def time_load(path, deserialize, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn = sqlite3.connect(path)
+        rows = conn.execute("SELECT id, name, roll_number, encoding FROM students").fetchall()
+        matrix = np.array([deserialize(r[3]) for r in rows], dtype=np.float32)
+        conn.close()
+        best = min(best, time.perf_counter() - start)
+    return best, matrix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    encodings = np.random.default_rng(0).normal(scale=0.08, size=(args.students, 128))
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_db = os.path.join(tmp, 'legacy.db')
+        binary_db = os.path.join(tmp, 'binary.db')
+        build_db(legacy_db, encodings, pickle.dumps)
+        build_db(binary_db, encodings, encode_encoding)
+
+        legacy_s, legacy = time_load(legacy_db, pickle.loads, args.repeat)
+        binary_s, binary = time_load(binary_db, decode_encoding, args.repeat)
+
+        print(f'students:          {args.students}')
+        print(f'pickle  load:      {legacy_s * 1000:8.1f} ms   db size {os.path.getsize(legacy_db) / 1e6:6.2f} MB')
+        print(f'binary  load:      {binary_s * 1000:8.1f} ms   db size {os.path.getsize(binary_db) / 1e6:6.2f} MB')
+        print(f'speedup:           {legacy_s / binary_s:8.2f}x')
+        print(f'max abs diff:      {np.abs(legacy - binary).max():.2e}')
+
+
+if __name__ == '__main__':
+    main()
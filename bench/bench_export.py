@@ -0,0 +1,121 @@
+"""Memory ceiling for /attendance/export on a large history
+
+Seeds N attendance rows, streams the full CSV and NDJSON exports through the
+Flask test client while sampling this process's anonymous RSS, and fails if it grows
+more than --max-rss-mb above where it started. For contrast it then loads the
+same rows the old way (fetchall + one JSON list) and reports that growth too.
+
+    python bench/bench_export.py --rows 1000000 --max-rss-mb 64
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def rss_mb():
+    # Anonymous RSS only: pages of the database file that SQLite memory-maps
+    # (mmap_size) also count towards RSS but are page cache, not our memory
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('RssAnon:'):
+                return int(line.split()[1]) / 1024
+
+
+def seed(path, rows, students, subjects, days):
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO students (name, roll_number, password, encoding) VALUES (?, ?, ?, ?)",
+                     ((f'Student {i}', f'R{i:06d}', 'x', b'') for i in range(students)))
+    conn.executemany("INSERT INTO subjects (name, code, day_of_week, start_time, end_time) VALUES (?, ?, ?, ?, ?)",
+                     ((f'Subject {i}', f'S{i}', 'Monday', '09:00', '10:00') for i in range(subjects)))
+    rng = np.random.default_rng(0)
+    start = datetime(2026, 1, 1)
+    span = days * 86400
+    chunk = 200000
+    for offset in range(0, rows, chunk):
+        n = min(chunk, rows - offset)
+        # Timestamps increase chunk by chunk, like a real history
+        seconds = np.sort(rng.integers(offset * span // rows, (offset + n) * span // rows, n))
+        subject_ids = rng.integers(1, subjects + 1, n)
+        conn.executemany("""INSERT OR IGNORE INTO attendance
+                            (student_id, subject_id, timestamp, attendance_date, location_info)
+                            VALUES (?, ?, ?, ?, ?)""",
+                         (((offset + i) % students + 1, int(subject_id),
+                           (start + timedelta(seconds=int(t))).strftime('%Y-%m-%d %H:%M:%S'),
+                           (start + timedelta(seconds=int(t) + 5 * 3600)).strftime('%Y-%m-%d'),
+                           '{"wifi": "campus"}')
+                          for i, (subject_id, t) in enumerate(zip(subject_ids, seconds))))
+        conn.commit()
+    count = conn.execute("SELECT COUNT(*) FROM attendance").fetchone()[0]
+    conn.close()
+    return count
+
+
+def stream(client, url):
+    response = client.get(url, buffered=False)
+    assert response.status_code == 200, response.status_code
+    base = peak = rss_mb()
+    size = lines = 0
+    start = time.perf_counter()
+    for i, chunk in enumerate(response.response):
+        size += len(chunk)
+        lines += chunk.count('\n') if isinstance(chunk, str) else chunk.count(b'\n')
+        if i % 50 == 0:
+            peak = max(peak, rss_mb())
+    response.close()
+    return lines, size, time.perf_counter() - start, max(peak, rss_mb()) - base
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--max-rss-mb', type=float, default=64)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        os.environ['DB_FILE'] = path
+        os.chdir(tmp)
+        import app as app_module
+        app_module.init_db()
+
+        rows = seed(path, args.rows, args.students, 20, 365)
+        client = app_module.app.test_client()
+        with client.session_transaction() as sess:
+            sess.update(user_id=1, user_type='admin', user_name='admin')
+        print(f'attendance rows: {rows}   starting RSS {rss_mb():.0f} MB')
+
+        failed = False
+        for fmt in ('csv', 'ndjson'):
+            lines, size, seconds, growth = stream(client, f'/attendance/export?from=2025-12-01&to=2027-01-31&format={fmt}')
+            ok = growth <= args.max_rss_mb
+            failed |= not ok
+            print(f'{fmt:7s} export: {lines:>9} lines  {size / 1e6:7.1f} MB  {seconds:6.1f} s  '
+                  f'{lines / seconds:9.0f} rows/s  RSS +{growth:5.1f} MB  {"ok" if ok else "OVER CEILING"}')
+
+        # The old approach: fetch everything, then build one JSON document
+        base = rss_mb()
+        conn = sqlite3.connect(path)
+        records = conn.execute("""SELECT s.name, s.roll_number, a.timestamp, a.status, sub.name, sub.code
+                                  FROM attendance a JOIN students s ON a.student_id = s.id
+                                  LEFT JOIN subjects sub ON a.subject_id = sub.id""").fetchall()
+        body = json.dumps([{'name': r[0], 'roll_number': r[1], 'timestamp': r[2], 'status': r[3],
+                            'subject_name': r[4], 'subject_code': r[5]} for r in records])
+        print(f'fetchall + one JSON list (old style): RSS +{rss_mb() - base:.0f} MB for {len(body) / 1e6:.0f} MB of JSON')
+        conn.close()
+
+    if failed:
+        sys.exit(f'export RSS grew past the {args.max_rss_mb:.0f} MB ceiling')
+
+
+if __name__ == '__main__':
+    main()
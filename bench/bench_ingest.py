@@ -0,0 +1,136 @@
+"""Check-in burst load test: sustained inserts/sec and ack latency per ingest mode
+
+Simulates --processes web workers with --threads request threads each, all
+marking attendance at once (e.g. 800 students in one attendance window), and
+compares:
+
+  * direct: every check-in is its own INSERT OR IGNORE + commit in the
+    request thread (ATTENDANCE_INGEST=direct, the old behaviour)
+  * queue: check-ins are journaled and acknowledged, then written by one
+    thread per worker in group-committed batches (ATTENDANCE_INGEST=queue)
+
+against a scratch database created by the app (so the rollup triggers and
+indexes are the real ones). Reports rows written per second until everything
+is in the database, the p50/p99 time until a check-in is acknowledged, and
+requests that failed (e.g. "database is locked").
+
+    python bench/bench_ingest.py --checkins 8000 --processes 4 --threads 16
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import threading
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def worker(mode, journal_dir, jobs, threads, flush_ms, barrier, results):
+    from ingest import AttendanceIngest
+    ingest = AttendanceIngest(journal_dir, enabled=mode == 'queue', flush_interval=flush_ms / 1000)
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def run(chunk):
+        mine, failed = [], 0
+        for student_id, subject_id in chunk:
+            start = time.perf_counter()
+            try:
+                ingest.submit([{'student_id': student_id, 'subject_id': subject_id, 'location_info': '',
+                                'attendance_date': '2026-10-19', 'liveness_score': None}])
+            except sqlite3.Error:
+                failed += 1
+                continue
+            mine.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    pool = [threading.Thread(target=run, args=(jobs[i::threads],)) for i in range(threads)]
+    barrier.wait()
+    start = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    acked = time.perf_counter() - start
+    ingest.drain(60)
+    results.put((latencies, errors[0], acked, time.perf_counter() - start, ingest.stats()))
+
+
+def run_mode(mode, db_path, args):
+    jobs = [(student_id, subject_id) for subject_id in range(1, args.subjects + 1)
+            for student_id in range(1, args.checkins // args.subjects + 1)]
+    ctx = multiprocessing.get_context('fork')
+    barrier = ctx.Barrier(args.processes)
+    results = ctx.Queue()
+    journal_dir = os.path.join(os.path.dirname(db_path), f'journal-{mode}')
+    procs = [ctx.Process(target=worker, args=(mode, journal_dir, jobs[i::args.processes], args.threads,
+                                              args.flush_ms, barrier, results))
+             for i in range(args.processes)]
+    for p in procs:
+        p.start()
+    outcomes = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+
+    latencies = np.array([l for o in outcomes for l in o[0]]) * 1000
+    errors = sum(o[1] for o in outcomes)
+    wall = max(o[3] for o in outcomes)
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT COUNT(*) FROM attendance").fetchone()[0]
+    conn.execute("DELETE FROM attendance")
+    conn.commit()
+    conn.close()
+    batches = sum(o[4]['batches'] for o in outcomes)
+    return {
+        'mode': mode,
+        'rows': rows,
+        'errors': errors,
+        'inserts_per_sec': rows / wall,
+        'p50': float(np.percentile(latencies, 50)) if len(latencies) else float('nan'),
+        'p99': float(np.percentile(latencies, 99)) if len(latencies) else float('nan'),
+        'max': float(latencies.max()) if len(latencies) else float('nan'),
+        'batches': batches
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--checkins', type=int, default=8000)
+    parser.add_argument('--subjects', type=int, default=10)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--flush-ms', type=float, default=5)
+    parser.add_argument('--modes', nargs='+', default=['direct', 'queue'])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        os.environ['DB_FILE'] = db_path
+        os.environ['INGEST_JOURNAL_DIR'] = os.path.join(tmp, 'journal')
+        os.chdir(tmp)
+        import app
+        app.init_db()
+        # Check-ins for students who don't exist are dropped, so enroll the ones the jobs use
+        with app.get_db() as conn:
+            conn.executemany("INSERT INTO students (id, name, roll_number, password, encoding) "
+                             "VALUES (?, ?, ?, '', x'')",
+                             [(i, f's{i}', f'r{i}') for i in range(1, args.checkins // args.subjects + 1)])
+            conn.commit()
+        print(f'{args.checkins} check-ins from {args.processes} processes x {args.threads} threads')
+        print(f"{'mode':8s} {'rows':>6s} {'errors':>6s} {'inserts/s':>10s} {'ack p50':>8s} {'ack p99':>8s} "
+              f"{'ack max':>8s} {'batches':>8s}")
+        for mode in args.modes:
+            r = run_mode(mode, db_path, args)
+            print(f"{r['mode']:8s} {r['rows']:6d} {r['errors']:6d} {r['inserts_per_sec']:10.0f} "
+                  f"{r['p50']:6.2f}ms {r['p99']:6.2f}ms {r['max']:6.1f}ms {r['batches']:8d}")
+
+
+if __name__ == '__main__':
+    main()
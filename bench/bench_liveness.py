@@ -0,0 +1,100 @@
+"""CPU cost of a liveness burst: detect once and track vs detect every frame
+
+Builds a burst from each photo in static/uploads by shifting and slightly
+rotating it frame to frame (a head moving in front of the camera), then times
+(needs the dlib model files in the project root):
+
+  * naive: detect_faces + landmarks on every frame, descriptor on the first
+  * tracked: face_engine.get_live_face_encoding (detection on the first frame
+    only, correlation tracking + landmarks on the rest)
+
+and reports the median burst latency of each, the per-stage breakdown of the
+tracked path, the cost relative to a single-photo check-in, and the score.
+
+    python bench/bench_liveness.py --frames 8 --repeat 5
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+import face_engine
+from liveness import score_liveness
+
+
+def make_burst(image, frames):
+    height, width = image.shape[:2]
+    burst = []
+    for i in range(frames):
+        angle = 6.0 * np.sin(i / max(frames - 1, 1) * np.pi)
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+        matrix[0, 2] += 3 * i
+        burst.append(cv2.warpAffine(image, matrix, (width, height), borderMode=cv2.BORDER_REPLICATE))
+    return burst
+
+
+def naive(images):
+    faces = face_engine.detect_faces(images[0])
+    if not faces:
+        return None
+    encoding = face_engine.encode_face(images[0], faces[0])
+    frames = []
+    for image in images:
+        found = face_engine.detect_faces(image)
+        if found:
+            _, shape, origin = face_engine.face_landmarks(image, found[0])
+            frames.append(face_engine.shape_points(shape, origin))
+    return encoding, score_liveness(frames, (images[0].shape[1], images[0].shape[0]))
+
+
+def timed(fn, arg, repeat):
+    samples, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(arg)
+        samples.append((time.perf_counter() - start) * 1000)
+    return result, float(np.median(samples))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frames', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--images', default=os.path.join(ROOT, 'static', 'uploads', '*.jpg'))
+    args = parser.parse_args()
+
+    print(f"{'image':28s} {'single':>8s} {'naive':>8s} {'tracked':>8s} {'x single':>9s} {'score':>6s}")
+    totals = {'single': [], 'naive': [], 'tracked': []}
+    for path in sorted(glob.glob(args.images)):
+        image = cv2.imread(path)
+        if image is None:
+            continue
+        burst = make_burst(image, args.frames)
+        _, single_ms = timed(face_engine.get_face_encoding, image, args.repeat)
+        _, naive_ms = timed(naive, burst, args.repeat)
+        timings = {}
+        result = face_engine.get_live_face_encoding(burst, timings)
+        _, tracked_ms = timed(face_engine.get_live_face_encoding, burst, args.repeat)
+        if result is None:
+            print(f'{os.path.basename(path):28s} no face')
+            continue
+        totals['single'].append(single_ms)
+        totals['naive'].append(naive_ms)
+        totals['tracked'].append(tracked_ms)
+        print(f'{os.path.basename(path):28s} {single_ms:8.1f} {naive_ms:8.1f} {tracked_ms:8.1f} '
+              f'{tracked_ms / single_ms:9.2f} {result[1]["score"]:6.2f}')
+        print('    ' + '  '.join(f'{stage} {ms:.1f}' for stage, ms in timings.items()))
+
+    if totals['tracked']:
+        print(f"median ms: single {np.median(totals['single']):.1f}  naive burst {np.median(totals['naive']):.1f}  "
+              f"tracked burst {np.median(totals['tracked']):.1f}")
+
+
+if __name__ == '__main__':
+    main()
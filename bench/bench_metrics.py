@@ -0,0 +1,119 @@
+"""Overhead of the request instrumentation (metrics.py) on a check-in
+
+Registers one student from a photo in static/uploads in a throwaway database
+(needs the dlib model files in the project root), then drives an admin
+/mark_attendance with that photo through the Flask test client, alternating
+rounds with the metrics and the Server-Timing header on and off, and reports
+the median request time of each and the difference. Recognition runs inline
+(RECOGNITION_WORKERS=0) so only the instrumented code is being timed; the
+stage timers themselves always run (face_engine has always kept them), so
+their cost is measured separately, per call, along with recording a
+histogram value and rendering /metrics.
+
+    python bench/bench_metrics.py --requests 200
+"""
+import argparse
+import glob
+import io
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def per_call_us(fn, n=100000):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def median_ms(client, photo, n):
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        response = client.post('/mark_attendance', data={'image': (io.BytesIO(photo), 'photo.jpg')},
+                               content_type='multipart/form-data', headers={'X-Server-Timing': '1'})
+        samples.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200
+    return float(np.median(samples))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200, help='Check-ins per round')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--image', default=None, help='Photo to check in with (default: the first upload)')
+    args = parser.parse_args()
+
+    photo_path = args.image or sorted(glob.glob(os.path.join(ROOT, 'static', 'uploads', '*.jpg')))[0]
+    with open(photo_path, 'rb') as f:
+        photo = f.read()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['DB_FILE'] = os.path.join(tmp, 'bench.db')
+    os.environ['INGEST_JOURNAL_DIR'] = os.path.join(tmp, 'journal')
+    os.environ['RECOGNITION_WORKERS'] = '0'
+    os.chdir(ROOT)
+    import app
+    from metrics import Metrics, StageTimer
+    app.init_db()
+
+    client = app.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 1
+        session['user_type'] = 'admin'
+    app.UPLOAD_FOLDER = tmp
+    registered = client.post('/register', data={'name': 'Bench', 'roll_number': 'BENCH1', 'password': 'x',
+                                                'image': (io.BytesIO(photo), 'photo.jpg')},
+                             content_type='multipart/form-data').json
+    if not registered['success']:
+        sys.exit(f"Can't register {photo_path}: {registered['message']}")
+
+    median_ms(client, photo, 10)
+    on, off = [], []
+    for i in range(args.rounds):
+        # Alternate which goes first so warm-up and drift don't favour either
+        for enabled, results in ((True, on), (False, off))[::1 if i % 2 else -1]:
+            app.metrics.enabled = enabled
+            app.SERVER_TIMING = 'request' if enabled else 'off'
+            results.append(median_ms(client, photo, args.requests))
+    on_ms, off_ms = float(np.median(on)), float(np.median(off))
+    app.metrics.enabled = True
+    app.SERVER_TIMING = 'request'
+    print(f'{os.path.basename(photo_path)}: check-in {off_ms:.2f} ms without metrics, {on_ms:.2f} ms with '
+          f'({(on_ms - off_ms) * 1000:+.0f} us, {(on_ms - off_ms) / off_ms:+.2%})')
+
+    metrics = Metrics()
+    metrics.histogram('h', 'bench')
+    metrics.counter('c', 'bench')
+    timer = StageTimer({})
+
+    def stage():
+        with timer.stage('s'):
+            pass
+
+    observe_us = per_call_us(lambda: metrics.observe('h', 0.01, endpoint='x', stage='y'))
+    inc_us = per_call_us(lambda: metrics.inc('c', path='x', outcome='y'))
+    stage_us = per_call_us(stage)
+    print(f'per call: observe {observe_us:.2f} us, inc {inc_us:.2f} us, stage timer {stage_us:.2f} us')
+
+    # What one check-in records: a histogram value per stage plus the request
+    # time and the match distance, one outcome count and the header
+    timed = client.post('/mark_attendance', data={'image': (io.BytesIO(photo), 'photo.jpg')},
+                        content_type='multipart/form-data', headers={'X-Server-Timing': '1'})
+    stages = timed.headers['Server-Timing'].count(',')
+    estimate_us = (stages + 2) * observe_us + inc_us + stages * stage_us
+    print(f'estimated per check-in: {stages} stages, {estimate_us:.0f} us = {estimate_us / 1000 / off_ms:.2%} '
+          f'of this check-in')
+    start = time.perf_counter()
+    text = app.metrics.render()
+    print(f'render /metrics: {(time.perf_counter() - start) * 1000:.2f} ms for {len(text.splitlines())} lines')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Semester attendance report: cold build and cached time for /reports/attendance
+
+Seeds a school of N students, each enrolled in --per-student of --subjects
+weekly classes over a semester, with --rate of sessions attended, then times
+the full-semester report through the Flask test client: once cold, then again
+from the cache, then after one new attendance record invalidates it. Exits
+non-zero if a cold report takes longer than --max-seconds.
+
+    python bench/bench_reports.py --students 5000 --weeks 18 --max-seconds 1
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+SEMESTER_START = date(2026, 2, 2)
+
+
+def seed(path, students, subjects, per_student, weeks, rate):
+    rng = np.random.default_rng(0)
+    conn = sqlite3.connect(path)
+    conn.executemany("""INSERT INTO subjects (id, name, code, day_of_week, start_time, end_time, created_date)
+                        VALUES (?, ?, ?, ?, ?, ?, '2026-01-01 00:00:00')""",
+                     ((i, f'Subject {i}', f'S{i:03d}', WEEKDAYS[i % 5], f'{8 + i % 8:02d}:00', f'{9 + i % 8:02d}:00')
+                      for i in range(1, subjects + 1)))
+    conn.executemany("""INSERT INTO students (id, name, roll_number, password, encoding, registered_date)
+                        VALUES (?, ?, ?, 'x', x'', '2026-01-01 00:00:00')""",
+                     ((i, f'Student {i}', f'R{i:06d}') for i in range(1, students + 1)))
+    taken = np.argsort(rng.random((students, subjects)), axis=1)[:, :per_student] + 1
+    conn.executemany("INSERT INTO subject_enrollments (subject_id, student_id, enrolled_date) "
+                     "VALUES (?, ?, '2026-01-01 00:00:00')",
+                     ((int(subject_id), student_id + 1) for student_id, row in enumerate(taken) for subject_id in row))
+
+    def records():
+        for student_id, row in enumerate(taken, 1):
+            for subject_id in row:
+                weekday = WEEKDAYS.index(WEEKDAYS[subject_id % 5])
+                first = SEMESTER_START + timedelta(days=weekday)
+                for week in np.flatnonzero(rng.random(weeks) < rate):
+                    yield student_id, int(subject_id), (first + timedelta(weeks=int(week))).isoformat()
+
+    conn.executemany("INSERT INTO attendance (student_id, subject_id, attendance_date) VALUES (?, ?, ?)", records())
+    conn.commit()
+    count = conn.execute("SELECT COUNT(*) FROM attendance").fetchone()[0]
+    conn.close()
+    return count
+
+
+def timed(client, url):
+    start = time.perf_counter()
+    response = client.get(url)
+    elapsed = time.perf_counter() - start
+    assert response.status_code == 200, response.status_code
+    return elapsed, response.get_json()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--subjects', type=int, default=30)
+    parser.add_argument('--per-student', type=int, default=6)
+    parser.add_argument('--weeks', type=int, default=18)
+    parser.add_argument('--rate', type=float, default=0.85)
+    parser.add_argument('--max-seconds', type=float, default=1.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        os.environ['DB_FILE'] = path
+        os.chdir(tmp)
+        import app as app_module
+        app_module.init_db()
+
+        records = seed(path, args.students, args.subjects, args.per_student, args.weeks, args.rate)
+        client = app_module.app.test_client()
+        with client.session_transaction() as sess:
+            sess.update(user_id=1, user_type='admin', user_name='admin')
+        end = SEMESTER_START + timedelta(weeks=args.weeks) - timedelta(days=1)
+        url = f'/reports/attendance?from={SEMESTER_START}&to={end}'
+        print(f'{args.students} students x {args.per_student} subjects, {args.weeks} weeks, '
+              f'{records} attendance records')
+
+        cold, report = timed(client, url)
+        cached, _ = timed(client, url)
+        below, flagged = timed(client, url + '&below=1')
+        with app_module.get_db() as conn:
+            conn.execute("INSERT INTO attendance (student_id, subject_id, attendance_date) VALUES (1, NULL, ?)",
+                         (end.isoformat(),))
+            conn.commit()
+        rebuilt, _ = timed(client, url)
+        # The report alone, without building and serializing the JSON rows
+        start = time.perf_counter()
+        app_module.reports.put((str(SEMESTER_START), str(end), None), None, None)
+        app_module.get_report(str(SEMESTER_START), str(end))
+        engine = time.perf_counter() - start
+
+        expected = sum(r['expected'] for r in report['students'])
+        attended = sum(r['attended'] for r in report['students'])
+        print(f'rows: {len(report["students"])}  expected sessions {expected}  attended {attended} '
+              f'({100 * attended / expected:.1f}%)  below threshold {len(flagged["students"])}')
+        print(f'cold report (full JSON):       {cold * 1000:7.0f} ms')
+        print(f'cached report (full JSON):     {cached * 1000:7.0f} ms')
+        print(f'cached, below-threshold only:  {below * 1000:7.0f} ms')
+        print(f'after a new record:            {rebuilt * 1000:7.0f} ms')
+        print(f'report engine alone (cold):    {engine * 1000:7.0f} ms')
+
+    if cold > args.max_seconds:
+        sys.exit(f'cold report took {cold:.2f} s (limit {args.max_seconds:.2f} s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Requests/sec on /get_stats and /get_attendance: per-request connect vs pooled get_db
+
+Seeds a throwaway database with N students and M attendance rows, then drives
+the routes through the Flask test client twice: once with get_db replaced by
+the old open-connect-close-per-request behaviour, and once with the pooled,
+PRAGMA-tuned connection from db.py.
+
+    python bench/bench_routes.py --students 2000 --attendance 200000
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def seed(path, students, attendance):
+    conn = sqlite3.connect(path)
+    blob = b'\0' * 520
+    conn.executemany("INSERT INTO students (name, roll_number, password, encoding) VALUES (?, ?, ?, ?)",
+                     ((f'Student {i}', f'R{i:06d}', 'x', blob) for i in range(students)))
+    conn.executemany("INSERT INTO subjects (name, code, day_of_week, start_time, end_time) VALUES (?, ?, ?, ?, ?)",
+                     ((f'Subject {i}', f'S{i}', 'Monday', '09:00', '10:00') for i in range(10)))
+    rng = np.random.default_rng(0)
+    now = datetime.now()
+    conn.executemany("INSERT INTO attendance (student_id, subject_id, timestamp) VALUES (?, ?, ?)",
+                     ((int(rng.integers(1, students + 1)), int(rng.integers(1, 11)),
+                       (now - timedelta(minutes=int(m))).strftime('%Y-%m-%d %H:%M:%S'))
+                      for m in rng.integers(0, 60 * 24 * 90, attendance)))
+    conn.commit()
+    conn.close()
+
+
+def per_request_connection(path):
+    # What every route did before db.py: connect, run, close
+    @contextmanager
+    def get_db():
+        conn = sqlite3.connect(path)
+        try:
+            yield conn
+        finally:
+            conn.close()
+    return get_db
+
+
+def requests_per_sec(client, url, seconds):
+    client.get(url)
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        assert client.get(url).status_code == 200
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--attendance', type=int, default=200000)
+    parser.add_argument('--seconds', type=float, default=3.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        os.environ['DB_FILE'] = path
+        os.chdir(tmp)
+        import app as app_module
+        import db
+        app_module.init_db()
+
+        seed(path, args.students, args.attendance)
+        client = app_module.app.test_client()
+        with client.session_transaction() as sess:
+            sess.update(user_id=1, user_type='admin', user_name='admin')
+
+        today = datetime.now().strftime('%Y-%m-%d')
+        urls = ['/get_stats', f'/get_attendance?date={today}', f'/get_attendance?date={today}&subject_id=3']
+        modes = [('connect per request', per_request_connection(path)), ('pooled get_db', db.get_db)]
+
+        print(f'students: {args.students}   attendance rows: {args.attendance}')
+        for url in urls:
+            results = []
+            for label, get_db in modes:
+                app_module.get_db = get_db
+                results.append(requests_per_sec(client, url, args.seconds))
+                print(f'{url:45s} {label:20s} {results[-1]:8.0f} req/s')
+            print(f'{"":45s} {"speedup":20s} {results[1] / results[0]:8.2f}x')
+        db.close_thread_connection()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""Load test for /events: how many event streams one web worker sustains
+
+Opens N concurrent /events connections (signed admin session cookie), holds
+them for a while, and inserts an attendance record every --interval seconds.
+Reports how many streams stayed connected, how many attendance_marked events
+reached them and how late, and the server's own connection count.
+
+Without --url the app is served in-process by a threaded werkzeug server (one
+"worker"). To measure a real deployment, start one worker against a scratch
+copy of the database and point the test at it:
+
+    DB_FILE=/tmp/scratch.db GUNICORN_WORKER_CLASS=gevent WEB_CONCURRENCY=1 \\
+        gunicorn -c gunicorn.conf.py app:app
+    DB_FILE=/tmp/scratch.db python bench/bench_sse.py --url http://127.0.0.1:8000 --connections 2000
+
+The test inserts attendance rows, so never point it at a production database.
+"""
+import argparse
+import logging
+import os
+import resource
+import selectors
+import socket
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def session_cookie(app):
+    serializer = app.session_interface.get_signing_serializer(app)
+    return serializer.dumps({'user_id': 1, 'user_type': 'admin', 'user_name': 'bench'})
+
+
+def http_get(host, port, path, cookie):
+    with socket.create_connection((host, port)) as sock:
+        sock.sendall(f'GET {path} HTTP/1.1\r\nHost: {host}\r\nCookie: session={cookie}\r\n'
+                     f'Connection: close\r\n\r\n'.encode())
+        data = b''
+        while chunk := sock.recv(65536):
+            data += chunk
+    return data.split(b'\r\n\r\n', 1)[1].decode()
+
+
+class Stream:
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = b''
+        self.connected = False
+        self.rejected = False
+        self.events = []
+        self.closed = False
+
+
+def open_streams(host, port, cookie, count, selector):
+    request = (f'GET /events HTTP/1.1\r\nHost: {host}\r\nCookie: session={cookie}\r\n'
+               f'Accept: text/event-stream\r\n\r\n').encode()
+    streams = []
+    for _ in range(count):
+        sock = socket.create_connection((host, port))
+        sock.sendall(request)
+        sock.setblocking(False)
+        stream = Stream(sock)
+        selector.register(sock, selectors.EVENT_READ, stream)
+        streams.append(stream)
+    return streams
+
+
+def pump(selector, timeout):
+    for key, _ in selector.select(timeout):
+        stream = key.data
+        try:
+            chunk = stream.sock.recv(65536)
+        except BlockingIOError:
+            continue
+        except ConnectionError:
+            chunk = b''
+        if not chunk:
+            stream.closed = True
+            selector.unregister(stream.sock)
+            continue
+        now = time.perf_counter()
+        *messages, stream.buffer = (stream.buffer + chunk).split(b'\n\n')
+        for message in messages:
+            if message.startswith(b'HTTP/') and b' 200 ' not in message.split(b'\r\n', 1)[0]:
+                stream.rejected = True
+            elif b'retry:' in message:
+                stream.connected = True
+            elif b'event: attendance_marked' in message:
+                stream.events.append(now)
+
+
+def insert_attendance(db_path, student_id, attendance_date):
+    conn = sqlite3.connect(db_path, timeout=10)
+    conn.execute("INSERT INTO attendance (student_id, subject_id, attendance_date) VALUES (?, NULL, ?)",
+                 (student_id, attendance_date))
+    conn.commit()
+    conn.close()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else float('nan')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--connections', type=int, default=500)
+    parser.add_argument('--seconds', type=float, default=30)
+    parser.add_argument('--interval', type=float, default=2.0, help='seconds between attendance inserts')
+    parser.add_argument('--url', default=None, help='server to test (default: serve the app in-process)')
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ.setdefault('DB_FILE', os.path.join(tmp.name, 'bench.db'))
+    db_path = os.path.abspath(os.environ['DB_FILE'])
+    os.chdir(tmp.name)
+    import app as app_module
+    app_module.init_db()
+    from encoding_store import encode_encoding
+    from werkzeug.serving import make_server
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("""INSERT OR IGNORE INTO students (name, roll_number, password, encoding)
+                    VALUES ('SSE Bench', 'SSE-BENCH', 'x', ?)""", (encode_encoding(np.zeros(128)),))
+    conn.commit()
+    student_id = conn.execute("SELECT id FROM students WHERE roll_number = 'SSE-BENCH'").fetchone()[0]
+    conn.close()
+
+    if args.url:
+        url = urlparse(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = '127.0.0.1', server.server_port
+
+    cookie = session_cookie(app_module.app)
+    selector = selectors.DefaultSelector()
+    start = time.perf_counter()
+    streams = open_streams(host, port, cookie, args.connections, selector)
+    deadline = time.perf_counter() + 30
+    while sum(s.connected or s.rejected for s in streams) < len(streams) and time.perf_counter() < deadline:
+        pump(selector, 0.1)
+    connect_s = time.perf_counter() - start
+    connected = sum(s.connected for s in streams)
+    rejected = sum(s.rejected for s in streams)
+    print(f'connected {connected}/{args.connections} streams in {connect_s:.1f} s ({rejected} refused)')
+
+    sent = []
+    attendance_date = app_module.get_attendance_date()
+    end = time.perf_counter() + args.seconds
+    next_insert = time.perf_counter()
+    while time.perf_counter() < end:
+        if time.perf_counter() >= next_insert:
+            insert_attendance(db_path, student_id, attendance_date)
+            sent.append(time.perf_counter())
+            next_insert += args.interval
+        pump(selector, 0.05)
+    # Let the last event arrive
+    drain = time.perf_counter() + app_module.SSE_POLL_INTERVAL + 1
+    while time.perf_counter() < drain:
+        pump(selector, 0.05)
+
+    stats = http_get(host, port, '/events/stats', cookie)
+    alive = [s for s in streams if s.connected and not s.closed]
+    delivered = sum(min(len(s.events), len(sent)) for s in alive)
+    latencies = [received - sent[i] for s in alive for i, received in enumerate(s.events[:len(sent)])]
+    print(f'still open after {args.seconds:.0f} s: {len(alive)}')
+    print(f'attendance_marked: {delivered}/{len(alive) * len(sent)} delivered, '
+          f'latency p50 {percentile(latencies, 50) * 1000:.0f} ms, p99 {percentile(latencies, 99) * 1000:.0f} ms')
+    print(f'server /events/stats: {stats}')
+    if not args.url:
+        print(f'max RSS of this process (server + client): {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB')
+
+    for s in streams:
+        s.sock.close()
+    tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
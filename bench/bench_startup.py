@@ -0,0 +1,159 @@
+"""Worker startup: launch to first served request, first face check, and memory per worker
+
+Starts gunicorn on a scratch database (schema created once beforehand with
+`flask init-db`, as gunicorn.conf.py does) in each mode:
+
+  * eager: every worker loads the dlib models when it imports the app
+    (PRELOAD_MODELS=1 without preload_app: what each worker used to pay)
+  * lazy: the default; a worker loads them on its first face check
+  * preload: PRELOAD_MODELS=1 with preload_app; the master loads them once
+    and the workers are forked from it
+
+and reports the time from launch until /login answers, the first admin
+check-in (a photo from static/uploads) and the median of the next ones, and
+the master's and the workers' resident (RSS) and proportional (PSS: shared
+pages split between the processes sharing them) memory after the check-ins.
+Recognition runs inline in the web workers (RECOGNITION_WORKERS=0), which is
+where preloading shares the models. Needs Linux (/proc) and the model files.
+
+    python bench/bench_startup.py --workers 4
+"""
+import argparse
+import glob
+import http.cookiejar
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODES = {
+    'eager': {'PRELOAD_MODELS': '1'},
+    'lazy': {},
+    'preload': {'PRELOAD_MODELS': '1'},
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def memory_kb(pid):
+    """(RSS, PSS) of a process in kB"""
+    rss = pss = 0
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                rss = int(line.split()[1])
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    pss = int(line.split()[1])
+    except OSError:
+        pass
+    return rss, pss
+
+
+def children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(p) for p in f.read().split()]
+
+
+def run_mode(mode, args, env, photo, tmp):
+    port = free_port()
+    conf = os.path.join(tmp, f'{mode}.conf.py')
+    with open(conf, 'w') as f:
+        f.write(f"bind = '127.0.0.1:{port}'\nworkers = {args.workers}\nthreads = {args.threads}\n"
+                f"worker_class = 'gthread'\npreload_app = {mode == 'preload'}\n")
+    base = f'http://127.0.0.1:{port}'
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', conf, 'app:app'], cwd=ROOT,
+                              env=dict(env, **MODES[mode]), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError(f'gunicorn exited with status {server.returncode}')
+            if time.perf_counter() - start > args.timeout:
+                raise RuntimeError('no answer from gunicorn')
+            try:
+                if opener.open(f'{base}/login', timeout=5).status == 200:
+                    break
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)
+        first_request = time.perf_counter() - start
+
+        login = urllib.request.Request(f'{base}/auth/login', method='POST', headers={'Content-Type': 'application/json'},
+                                       data=json.dumps({'username': 'admin', 'password': 'admin123',
+                                                        'user_type': 'admin'}).encode())
+        opener.open(login, timeout=30).read()
+        checkins = []
+        for _ in range(args.checkins):
+            request = urllib.request.Request(f'{base}/mark_attendance', data=photo, method='POST',
+                                             headers={'Content-Type': 'application/octet-stream'})
+            t = time.perf_counter()
+            opener.open(request, timeout=args.timeout).read()
+            checkins.append((time.perf_counter() - t) * 1000)
+
+        workers = children(server.pid)
+        master = memory_kb(server.pid)
+        worker_memory = np.array([memory_kb(pid) for pid in workers])
+        return {
+            'mode': mode,
+            'first_request_ms': first_request * 1000,
+            'first_checkin_ms': checkins[0],
+            'checkin_ms': float(np.median(checkins[1:])) if len(checkins) > 1 else float('nan'),
+            'master_rss_mb': master[0] / 1024,
+            'worker_rss_mb': worker_memory[:, 0].mean() / 1024,
+            'worker_pss_mb': worker_memory[:, 1].mean() / 1024,
+            'total_pss_mb': (master[1] + worker_memory[:, 1].sum()) / 1024,
+        }
+    finally:
+        server.terminate()
+        server.wait(30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--checkins', type=int, default=20, help='Admin check-ins after startup')
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+    parser.add_argument('--image', default=None, help='Photo to check in with (default: the first upload)')
+    parser.add_argument('--timeout', type=float, default=120)
+    args = parser.parse_args()
+
+    photo_path = args.image or sorted(glob.glob(os.path.join(ROOT, 'static', 'uploads', '*.jpg')))[0]
+    with open(photo_path, 'rb') as f:
+        photo = f.read()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DB_FILE=os.path.join(tmp, 'bench.db'), RECOGNITION_WORKERS='0',
+                   INGEST_JOURNAL_DIR=os.path.join(tmp, 'journal'), WEB_CONCURRENCY=str(args.workers))
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'], cwd=ROOT, env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+        print(f'{args.workers} workers x {args.threads} threads, {args.checkins} check-ins with '
+              f'{os.path.basename(photo_path)}')
+        print(f"{'mode':8s} {'1st req':>9s} {'1st check':>10s} {'check':>8s} {'master':>9s} "
+              f"{'worker RSS':>11s} {'worker PSS':>11s} {'total PSS':>10s}")
+        for mode in args.modes:
+            r = run_mode(mode, args, env, photo, tmp)
+            print(f"{r['mode']:8s} {r['first_request_ms']:7.0f}ms {r['first_checkin_ms']:8.0f}ms "
+                  f"{r['checkin_ms']:6.0f}ms {r['master_rss_mb']:7.0f}MB {r['worker_rss_mb']:9.0f}MB "
+                  f"{r['worker_pss_mb']:9.0f}MB {r['total_pss_mb']:8.0f}MB")
+
+
+if __name__ == '__main__':
+    main()
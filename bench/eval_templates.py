@@ -0,0 +1,177 @@
+"""Face templates: false accept/reject rates and retries per check-in
+
+Enrolls the people of a labeled image folder (one subfolder per person) from
+their first --enroll photos and plays the rest back, in order, as check-in
+attempts. People in --impostors extra subfolders are never enrolled; every
+photo of theirs is an impostor attempt. Each matching strategy is scored:
+
+  * single: the first enrollment photo only (the old behaviour)
+  * centroid: the mean of the enrollment photos
+  * templates: the nearest of the enrollment photos and their centroid
+  * adaptive: templates, plus check-ins matched between --adaptive-min and
+    --adaptive-max (and clear of every other student) kept as templates, up
+    to --max-templates per student, evicting the oldest adaptive one (the
+    app keeps at most one a day; here every check-in counts as a new day)
+
+  FRR      genuine attempts not matched to their own student
+  FAR      impostor attempts matched to somebody
+  retries  failed attempts per successful check-in (each one a wasted encode)
+
+Encodings need the dlib model files in the project root and are cached in
+--cache; --synthetic N instead generates N people whose photos vary with a
+few lighting conditions, so the script runs without models or photos.
+
+    python bench/eval_templates.py --folder faces/ --enroll 3 --impostors 10
+    python bench/eval_templates.py --synthetic 500
+"""
+import argparse
+import os
+import sys
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from face_gallery import FaceGallery, mean_encoding
+
+STRATEGIES = ['single', 'centroid', 'templates', 'adaptive']
+
+
+def folder_encodings(folder, cache):
+    """{person: [encoding, ...]} for the photos in each subfolder, in file name order"""
+    if cache and os.path.exists(cache):
+        data = np.load(cache, allow_pickle=False)
+        return {name: list(data[name]) for name in data.files}
+    import cv2
+    import face_engine
+    people = {}
+    for person in sorted(os.listdir(folder)):
+        path = os.path.join(folder, person)
+        if not os.path.isdir(path):
+            continue
+        encodings = []
+        for name in sorted(os.listdir(path)):
+            image = cv2.imread(os.path.join(path, name))
+            encoding = face_engine.get_face_encoding(image) if image is not None else None
+            if encoding is not None:
+                encodings.append(np.asarray(encoding, dtype=np.float32))
+        if encodings:
+            people[person] = encodings
+    if cache:
+        np.savez(cache, **{person: np.array(e) for person, e in people.items()})
+    return people
+
+
+def synthetic_encodings(n, photos, conditions=4, seed=0, dim=128):
+    """People ~0.9 apart; each lighting condition moves a face ~0.45, each photo ~0.15 more"""
+    rng = np.random.default_rng(seed)
+
+    def scaled(size, norm):
+        return rng.normal(size=size) * (norm / np.sqrt(dim))
+
+    people = {}
+    for i in range(n):
+        centre = scaled(dim, 0.9 / np.sqrt(2))
+        lighting = scaled((conditions, dim), 0.45)
+        # Enrollment photos are taken one per condition, check-ins in any light
+        seen = np.concatenate([np.arange(conditions), rng.integers(0, conditions, photos)])[:photos]
+        people[f'person{i:05d}'] = list((centre + lighting[seen] + scaled((photos, dim), 0.15)).astype(np.float32))
+    return people
+
+
+def enroll(strategy, people, n_enroll):
+    """Gallery for a strategy, and each student's [(template_id, encoding, source)]"""
+    gallery = FaceGallery()
+    rows, templates, stored = [], [], {}
+    for student_id, encodings in enumerate(people.values(), 1):
+        enrolled = encodings[:1] if strategy == 'single' else encodings[:n_enroll]
+        rows.append((student_id, str(student_id), str(student_id), mean_encoding(enrolled)))
+        stored[student_id] = []
+        if strategy in ('templates', 'adaptive'):
+            for encoding in enrolled:
+                stored[student_id].append((len(templates) + 1, encoding, 'enrolled'))
+                templates.append((len(templates) + 1, student_id, encoding))
+    gallery.load(rows, templates)
+    return gallery, stored, len(templates)
+
+
+def evaluate(strategy, people, impostors, args):
+    gallery, stored, last_template_id = enroll(strategy, people, args.enroll)
+    genuine = rejected = attempts = successes = adapted = 0
+    for student_id, encodings in enumerate(people.values(), 1):
+        for encoding in encodings[args.enroll:]:
+            genuine += 1
+            attempts += 1
+            match = gallery.match(encoding)
+            if not match or match['distance'] >= args.tolerance or match['student_id'] != student_id:
+                rejected += 1
+                continue
+            successes += 1
+            confident = match['margin'] is None or match['distance'] + match['margin'] >= args.tolerance
+            if strategy == 'adaptive' and confident and \
+                    args.adaptive_min <= match['distance'] < args.adaptive_max:
+                templates = stored[student_id]
+                if len(templates) >= args.max_templates:
+                    oldest = next((t for t in templates if t[2] == 'adaptive'), None)
+                    if oldest is None:
+                        continue
+                    templates.remove(oldest)
+                last_template_id += 1
+                templates.append((last_template_id, encoding, 'adaptive'))
+                gallery.add(student_id, str(student_id), str(student_id),
+                            mean_encoding([t[1] for t in templates]), [(t[0], t[1]) for t in templates])
+                adapted += 1
+
+    accepted = 0
+    probes = [encoding for encodings in impostors.values() for encoding in encodings]
+    for match in gallery.match_many(probes) if probes else []:
+        if match and match['distance'] < args.tolerance:
+            accepted += 1
+
+    return {
+        'frr': rejected / genuine if genuine else float('nan'),
+        'far': accepted / len(probes) if probes else float('nan'),
+        'retries': (attempts - successes) / successes if successes else float('inf'),
+        'genuine': genuine,
+        'impostor': len(probes),
+        'adapted': adapted
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--folder', help='One subfolder of photos per person')
+    parser.add_argument('--cache', default=None, help='.npz file to keep the folder encodings in')
+    parser.add_argument('--synthetic', type=int, default=0, help='Generate this many people instead')
+    parser.add_argument('--photos', type=int, default=12, help='Photos per synthetic person')
+    parser.add_argument('--enroll', type=int, default=3)
+    parser.add_argument('--impostors', type=int, default=None,
+                        help='People held out of enrollment (default: a tenth)')
+    parser.add_argument('--tolerance', type=float, default=0.6)
+    parser.add_argument('--adaptive-min', type=float, default=0.2)
+    parser.add_argument('--adaptive-max', type=float, default=0.4)
+    parser.add_argument('--max-templates', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        people = synthetic_encodings(args.synthetic, args.photos)
+    elif args.folder:
+        people = folder_encodings(args.folder, args.cache)
+    else:
+        parser.error('give --folder or --synthetic')
+
+    names = sorted(people)
+    n_impostors = args.impostors if args.impostors is not None else len(names) // 10
+    impostors = {name: people[name] for name in names[len(names) - n_impostors:]}
+    enrolled = {name: people[name] for name in names[:len(names) - n_impostors]
+                if len(people[name]) > args.enroll}
+    print(f'{len(enrolled)} enrolled people ({args.enroll} photos each), {len(impostors)} impostors')
+
+    print(f"{'strategy':10s} {'FRR':>7s} {'FAR':>7s} {'retries':>8s} {'genuine':>8s} {'impostor':>9s} {'adapted':>8s}")
+    for strategy in STRATEGIES:
+        r = evaluate(strategy, enrolled, impostors, args)
+        print(f"{strategy:10s} {r['frr']:7.2%} {r['far']:7.2%} {r['retries']:8.3f} {r['genuine']:8d} "
+              f"{r['impostor']:9d} {r['adapted']:8d}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+"""Benchmark suite for the recognition and attendance pipeline, with a regression check
+
+Runs offline, from fixed seeds, so two runs on the same machine measure the
+same work (e.g. before and after a requirements.txt or code change):
+
+  * gallery  load and match a synthetic gallery of --gallery identities
+             (exact and IVF index): per-face and batched match latency
+  * encode   face_engine.get_face_encoding on the static/uploads photos
+             (needs the dlib model files in the project root): median per
+             photo, and per stage
+  * routes   a throwaway database with --students students and --attendance
+             rows; the Flask test client drives an admin /mark_attendance (with
+             one of the photos, inline recognition; needs the models),
+             /get_attendance and /get_stats from 1, 4, 16... threads: req/s
+             and p50/p99 latency
+
+Results go to --out as JSON, with the library versions, Python, CPU count and
+git commit they were measured with. --compare BASELINE.json compares against
+an earlier run and exits with status 1 when a result got worse by more than
+--threshold (default 10%); --current RESULTS.json compares two saved runs
+without measuring anything.
+
+    python bench/suite.py --out baseline.json
+    python bench/suite.py --out after.json --compare baseline.json
+    python bench/suite.py --current after.json --compare baseline.json --threshold 0.2
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from importlib import metadata
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from face_gallery import FaceGallery
+from face_index import make_index
+
+CASES = ['gallery', 'encode', 'routes']
+PACKAGES = ['numpy', 'opencv-python', 'opencv-python-headless', 'dlib', 'Flask', 'Werkzeug']
+
+
+def result(value, unit, better='lower'):
+    return {'value': round(float(value), 4), 'unit': unit, 'better': better}
+
+
+def environment():
+    versions = {}
+    for package in PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            pass
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {'python': platform.python_version(), 'platform': platform.platform(),
+            'cpus': os.cpu_count(), 'commit': commit, 'packages': versions,
+            'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+
+
+def median_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples))
+
+
+def synthetic_encodings(n, seed=0):
+    """Unit-scale 128-d encodings spread like dlib's (people ~0.9 apart)"""
+    rng = np.random.default_rng(seed)
+    return (rng.normal(size=(n, 128)) * (0.9 / np.sqrt(2) / np.sqrt(128))).astype(np.float32)
+
+
+def bench_gallery(args, results):
+    encodings = synthetic_encodings(args.gallery)
+    rng = np.random.default_rng(1)
+    probes = encodings[rng.integers(0, len(encodings), args.probes)] + \
+        (rng.normal(size=(args.probes, 128)) * (0.3 / np.sqrt(128))).astype(np.float32)
+    rows = [(i + 1, f'Student {i}', f'R{i:06d}', e) for i, e in enumerate(encodings)]
+    for index in ('exact', 'ivf'):
+        gallery = FaceGallery(index=make_index(index))
+        key = f'gallery.{index}.n{args.gallery}'
+        results[f'{key}.load'] = result(median_ms(lambda: gallery.load(rows), args.repeat), 'ms')
+        results[f'{key}.match'] = result(
+            median_ms(lambda: [gallery.match(p) for p in probes], args.repeat) / len(probes), 'ms')
+        results[f'{key}.match_many'] = result(
+            median_ms(lambda: gallery.match_many(list(probes)), args.repeat) / len(probes), 'ms')
+
+
+def sample_photos():
+    return sorted(glob.glob(os.path.join(ROOT, 'static', 'uploads', '*.jpg')))
+
+
+def bench_encode(args, results):
+    import cv2
+    import face_engine
+    per_photo, stages = [], {}
+    for path in sample_photos():
+        image = cv2.imread(path)
+        if image is None or face_engine.get_face_encoding(image) is None:
+            continue
+        per_photo.append(median_ms(lambda: face_engine.get_face_encoding(image), args.repeat))
+        timings = {}
+        face_engine.get_face_encoding(image, timings)
+        for stage, ms in timings.items():
+            stages.setdefault(stage, []).append(ms)
+    if not per_photo:
+        raise RuntimeError('no face found in any static/uploads photo')
+    results['encode.get_face_encoding'] = result(np.median(per_photo), 'ms')
+    for stage, samples in stages.items():
+        results[f'encode.stage.{stage}'] = result(np.median(samples), 'ms')
+
+
+def seed_database(conn, students, attendance, today):
+    """Students with synthetic encodings, 10 subjects and `attendance` distinct records over 90 days"""
+    from encoding_store import encode_encoding
+    conn.executemany("INSERT INTO students (name, roll_number, password, encoding) VALUES (?, ?, ?, ?)",
+                     ((f'Student {i}', f'R{i:06d}', 'x', encode_encoding(e))
+                      for i, e in enumerate(synthetic_encodings(students, seed=2))))
+    # Today's classes have already ended, so no class is active while the suite runs
+    days = [(today - timedelta(days=d)).strftime('%A') for d in range(7)]
+    conn.executemany("""INSERT INTO subjects (name, code, day_of_week, start_time, end_time, attendance_window)
+                        VALUES (?, ?, ?, ?, ?, 0)""",
+                     ((f'Subject {i}', f'S{i}', days[i % 7], '00:00' if i % 7 == 0 else '09:00',
+                       '00:01' if i % 7 == 0 else '10:00') for i in range(10)))
+    conn.executemany("INSERT INTO subject_enrollments (subject_id, student_id) VALUES (?, ?)",
+                     ((subject, student) for subject in range(1, 11) for student in range(1, students + 1)))
+    rng = np.random.default_rng(3)
+    picks = rng.choice(students * 10 * 90, size=min(attendance, students * 10 * 90), replace=False)
+    conn.executemany("""INSERT INTO attendance (student_id, subject_id, timestamp, attendance_date)
+                        VALUES (?, ?, ?, ?)""",
+                     ((int(p // 900) + 1, int(p % 10) + 1,
+                       (today - timedelta(days=int(p // 10 % 90))).strftime('%Y-%m-%d 09:30:00'),
+                       (today - timedelta(days=int(p // 10 % 90))).strftime('%Y-%m-%d'))
+                      for p in np.sort(picks)))
+    conn.commit()
+
+
+def drive(app_module, request, concurrency, total):
+    """(req/s, p50 ms, p99 ms) for `total` requests split over `concurrency` admin clients"""
+    latencies, failures = [], []
+    lock = threading.Lock()
+
+    def run(n):
+        client = app_module.app.test_client()
+        with client.session_transaction() as session:
+            session.update(user_id=1, user_type='admin', user_name='admin')
+        mine = []
+        for _ in range(n):
+            start = time.perf_counter()
+            response = request(client)
+            mine.append((time.perf_counter() - start) * 1000)
+            body = response.get_json(silent=True)
+            if response.status_code != 200 or (isinstance(body, dict) and body.get('success') is False):
+                failures.append(response.get_data(as_text=True)[:200])
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=run, args=(total // concurrency,)) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    if failures:
+        raise RuntimeError(f'{len(failures)} failed requests, e.g. {failures[0]}')
+    return len(latencies) / wall, float(np.percentile(latencies, 50)), float(np.percentile(latencies, 99))
+
+
+def models_available():
+    try:
+        import face_engine
+        face_engine.load_models()
+        return True
+    except (ImportError, RuntimeError):
+        return False
+
+
+def bench_routes(args, results, skipped):
+    tmp = tempfile.mkdtemp()
+    os.environ['DB_FILE'] = os.path.join(tmp, 'bench.db')
+    os.environ['INGEST_JOURNAL_DIR'] = os.path.join(tmp, 'journal')
+    os.environ['RECOGNITION_WORKERS'] = '0'
+    import app as app_module
+    from db import get_db
+    app_module.init_db()
+    app_module.UPLOAD_FOLDER = tmp
+    with get_db() as conn:
+        seed_database(conn, args.students, args.attendance, app_module.get_pakistan_time())
+
+    today = app_module.get_attendance_date()
+    requests = {
+        'get_attendance': lambda client: client.get(f'/get_attendance?date={today}&limit=100'),
+        'get_stats': lambda client: client.get('/get_stats'),
+    }
+    if not models_available():
+        skipped['routes.mark_attendance'] = 'needs dlib and the model files'
+    else:
+        photo = None
+        admin = app_module.app.test_client()
+        with admin.session_transaction() as session:
+            session.update(user_id=1, user_type='admin', user_name='admin')
+        for path in sample_photos():
+            with open(path, 'rb') as f:
+                data = f.read()
+            registered = admin.post('/register', data={'name': 'Bench', 'roll_number': 'BENCH', 'password': 'x',
+                                                       'image': (io.BytesIO(data), 'photo.jpg')},
+                                    content_type='multipart/form-data').json
+            if registered['success']:
+                photo = data
+                break
+        if photo is None:
+            raise RuntimeError('no static/uploads photo could be registered')
+        requests['mark_attendance'] = lambda client: client.post(
+            '/mark_attendance', data={'image': (io.BytesIO(photo), 'photo.jpg')}, content_type='multipart/form-data')
+
+    for name, request in requests.items():
+        drive(app_module, request, 1, 5)
+        for concurrency in args.concurrency:
+            # Median of each figure over a few rounds; one round is at the mercy of the scheduler
+            rounds = [drive(app_module, request, concurrency, max(args.requests, concurrency))
+                      for _ in range(args.rounds)]
+            rps, p50, p99 = np.median(rounds, axis=0)
+            key = f'routes.{name}.c{concurrency}'
+            results[f'{key}.rps'] = result(rps, 'req/s', 'higher')
+            results[f'{key}.p50'] = result(p50, 'ms')
+            results[f'{key}.p99'] = result(p99, 'ms')
+    app_module.ingest.drain(10)
+
+
+def compare(baseline, current, threshold):
+    """Print both runs side by side; returns the keys that got worse by more than `threshold`"""
+    old_env, new_env = baseline['environment'], current['environment']
+    for field in ('python', 'cpus', 'platform'):
+        if old_env.get(field) != new_env.get(field):
+            print(f'! {field}: {old_env.get(field)} -> {new_env.get(field)}')
+    for package in sorted(set(old_env['packages']) | set(new_env['packages'])):
+        if old_env['packages'].get(package) != new_env['packages'].get(package):
+            print(f"! {package}: {old_env['packages'].get(package)} -> {new_env['packages'].get(package)}")
+    print(f"{'result':42s} {'baseline':>10s} {'current':>10s} {'change':>8s}")
+    regressions = []
+    for key in sorted(set(baseline['results']) | set(current['results'])):
+        old, new = baseline['results'].get(key), current['results'].get(key)
+        if old is None or new is None:
+            print(f"{key:42s} {'-' if old is None else old['value']:>10} {'-' if new is None else new['value']:>10}")
+            continue
+        change = (new['value'] - old['value']) / old['value'] if old['value'] else 0.0
+        worse = change > threshold if new['better'] == 'lower' else change < -threshold
+        better = change < -threshold if new['better'] == 'lower' else change > threshold
+        flag = 'REGRESSION' if worse else 'improved' if better else ''
+        print(f"{key:42s} {old['value']:10.3f} {new['value']:10.3f} {change:+8.1%} {new['unit']:6s} {flag}")
+        if worse:
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--out', help='Write the results here (JSON)')
+    parser.add_argument('--compare', metavar='BASELINE', help='Earlier results to compare against')
+    parser.add_argument('--current', metavar='RESULTS', help='Compare these saved results instead of measuring')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Change that counts as a regression')
+    parser.add_argument('--cases', nargs='+', choices=CASES, default=CASES)
+    parser.add_argument('--gallery', type=int, default=10000, help='Synthetic identities in the gallery case')
+    parser.add_argument('--probes', type=int, default=200)
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--attendance', type=int, default=200000)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=200, help='Requests per route and concurrency level')
+    parser.add_argument('--rounds', type=int, default=3, help='Rounds per route and concurrency level')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed repeats of each gallery and encode step')
+    args = parser.parse_args()
+
+    if args.current:
+        with open(args.current) as f:
+            run = json.load(f)
+    else:
+        run = {'environment': environment(), 'config': {k: v for k, v in vars(args).items()
+                                                        if k not in ('out', 'compare', 'current', 'threshold')},
+               'results': {}, 'skipped': {}}
+        # face_engine loads the model files from the working directory
+        os.chdir(ROOT)
+        for case in args.cases:
+            start = time.perf_counter()
+            try:
+                if case == 'gallery':
+                    bench_gallery(args, run['results'])
+                elif case == 'encode':
+                    bench_encode(args, run['results'])
+                else:
+                    bench_routes(args, run['results'], run['skipped'])
+            except (ImportError, RuntimeError) as e:
+                # No dlib or no model files: the rest of the suite still runs
+                run['skipped'][case] = str(e)
+                print(f'{case}: skipped ({e})')
+                continue
+            print(f'{case}: {time.perf_counter() - start:.1f} s')
+        if args.out:
+            with open(args.out, 'w') as f:
+                json.dump(run, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, run, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} result(s) more than {args.threshold:.0%} worse than {args.compare}')
+            sys.exit(1)
+    else:
+        for key, value in sorted(run['results'].items()):
+            print(f"{key:42s} {value['value']:10.3f} {value['unit']}")
+
+
+if __name__ == '__main__':
+    main()
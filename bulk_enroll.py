@@ -0,0 +1,246 @@
+import csv
+import hashlib
+import multiprocessing
+import os
+import secrets
+import tempfile
+import zipfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+from werkzeug.security import generate_password_hash
+from encoding_store import encode_encoding, decode_encoding
+from face_gallery import ENCODING_DIM
+
+# Bulk student enrollment
+# Photos are named <roll_number>.jpg (the same naming UPLOAD_FOLDER uses) and
+# names come from a CSV with roll_number,name[,password] columns. Files are
+# hashed first so a re-run skips anything already enrolled, then the
+# remaining photos are encoded across a process pool and inserted in batches.
+# The pool's processes are spawned, never forked, so it is safe to start from
+# a threaded process; the web app runs imports as a separate `flask bulk-import`
+# process anyway (see the /students/bulk_import route).
+# Photos whose face scores under `min_quality` (see face_quality.py) are
+# reported as errors. With a `duplicate_tolerance`, a face that close to an
+# enrolled student (any of their templates) or to one enrolled earlier in the
+# same import is reported as a duplicate and not enrolled, like a registration.
+
+PHOTO_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+COMMIT_BATCH_SIZE = 500
+# Most the photos in one archive may add up to once extracted
+MAX_EXTRACTED_BYTES = 4 * 1024 * 1024 * 1024
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_names_csv(path):
+    """Map roll_number -> {'name', 'password'} from a names CSV"""
+    students = {}
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            roll_number = (row.get('roll_number') or '').strip()
+            if roll_number:
+                students[roll_number] = {
+                    'name': (row.get('name') or '').strip(),
+                    'password': (row.get('password') or '').strip()
+                }
+    return students
+
+
+def list_photos(photo_dir):
+    """Return (roll_number, path) for every photo in a directory"""
+    photos = []
+    for filename in sorted(os.listdir(photo_dir)):
+        roll_number, ext = os.path.splitext(filename)
+        if ext.lower() in PHOTO_EXTENSIONS:
+            photos.append((roll_number, os.path.join(photo_dir, filename)))
+    return photos
+
+
+def extract_zip(zip_path, target_dir, max_bytes=MAX_EXTRACTED_BYTES):
+    """Extract the photos in a ZIP (ignoring folders inside it) into target_dir
+
+    Photos are named by roll number alone, so a file name found in more than
+    one folder is ambiguous and none of those photos is extracted. Returns
+    (member name, message) for each photo left out. Raises ValueError if the
+    photos add up to more than max_bytes.
+    """
+    with zipfile.ZipFile(zip_path) as archive:
+        photos = [m for m in archive.infolist()
+                  if not m.is_dir() and os.path.basename(m.filename).lower().endswith(PHOTO_EXTENSIONS)]
+        names = Counter(os.path.basename(m.filename) for m in photos)
+        too_large = ValueError(f'The photos in the archive add up to more than {max_bytes // (1024 * 1024)} MB')
+        if sum(m.file_size for m in photos) > max_bytes:
+            raise too_large
+
+        left_out = []
+        total = 0
+        for member in photos:
+            filename = os.path.basename(member.filename)
+            if names[filename] > 1:
+                left_out.append((member.filename, f'{names[filename]} photos in the archive are named {filename}'))
+                continue
+            with archive.open(member) as src, open(os.path.join(target_dir, filename), 'wb') as dst:
+                # The sizes in the archive's directory could lie; count what is really written
+                for chunk in iter(lambda: src.read(1 << 20), b''):
+                    total += len(chunk)
+                    if total > max_bytes:
+                        raise too_large
+                    dst.write(chunk)
+    return left_out
+
+
+def enroll_photo(job):
+    """Worker: encode and score one photo, save it to the uploads folder and hash the password
+
+    Returns (encoding_bytes, password_hash, error_message).
+    """
+    from face_engine import get_enrollment_encoding
+    from face_quality import quality_reason
+
+    path, password, photo_path, min_quality = job
+    img = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return None, None, 'Could not decode image'
+    result = get_enrollment_encoding(img)
+    if result is None:
+        return None, None, 'No face detected in image'
+    encoding, quality = result
+    if quality['score'] < min_quality:
+        return None, None, f"Photo quality too low ({quality_reason(quality)}, score {quality['score']:.2f})"
+    cv2.imwrite(photo_path, img)
+    return encode_encoding(encoding), generate_password_hash(password), None
+
+
+def enrolled_faces(c):
+    """(roll_numbers, vectors): every template of each enrolled student, or their one encoding"""
+    c.execute("""SELECT s.roll_number, COALESCE(t.encoding, s.encoding) FROM students s
+                 LEFT JOIN face_templates t ON t.student_id = s.id""")
+    rows = c.fetchall()
+    vectors = np.array([decode_encoding(r[1]) for r in rows], dtype=np.float32).reshape(len(rows), ENCODING_DIM)
+    return [r[0] for r in rows], vectors
+
+
+def bulk_enroll(conn, source, names_csv, upload_folder, workers=None, min_quality=0,
+                max_extracted_bytes=MAX_EXTRACTED_BYTES, duplicate_tolerance=None):
+    """Enroll every photo in a directory or ZIP file
+
+    Returns a report with one entry per photo: roll_number, file, status
+    ('enrolled', 'skipped', 'duplicate' or 'error'), message, and a
+    generated_password for students whose CSV row had none. Duplicates also
+    name the roll number they match (duplicate_of). duplicate_tolerance=None
+    doesn't compare faces at all.
+    """
+    students = read_names_csv(names_csv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        left_out = []
+        if zipfile.is_zipfile(source):
+            left_out = extract_zip(source, tmp, max_extracted_bytes)
+            photo_dir = tmp
+        else:
+            photo_dir = source
+
+        c = conn.cursor()
+        c.execute("SELECT roll_number FROM students")
+        existing_rolls = {r[0] for r in c.fetchall()}
+        c.execute("SELECT photo_hash FROM students WHERE photo_hash IS NOT NULL")
+        existing_hashes = {r[0] for r in c.fetchall()}
+
+        report = [{'roll_number': os.path.splitext(os.path.basename(name))[0], 'file': name,
+                   'status': 'error', 'message': message} for name, message in left_out]
+        pending = []
+        queued_rolls = set()
+        for roll_number, path in list_photos(photo_dir):
+            entry = {'roll_number': roll_number, 'file': os.path.basename(path)}
+            report.append(entry)
+            photo_hash = file_sha256(path)
+            if photo_hash in existing_hashes:
+                entry.update(status='skipped', message='Photo already enrolled')
+            elif roll_number in existing_rolls:
+                entry.update(status='error', message='Roll number already exists')
+            elif roll_number in queued_rolls:
+                # e.g. 123.jpg and 123.png: both would be saved as uploads/123.jpg
+                entry.update(status='error', message='Roll number repeated in this import')
+            elif roll_number not in students or not students[roll_number]['name']:
+                entry.update(status='error', message='No name for this roll number in the CSV')
+            else:
+                existing_hashes.add(photo_hash)
+                queued_rolls.add(roll_number)
+                password = students[roll_number]['password']
+                if not password:
+                    password = secrets.token_urlsafe(8)
+                    entry['generated_password'] = password
+                photo_path = os.path.join(upload_folder, f"{roll_number}.jpg")
+                pending.append((entry, photo_hash, (path, password, photo_path, min_quality)))
+
+        # Faces already enrolled, then a row for each one this import enrolls
+        known_rolls, known = enrolled_faces(c) if duplicate_tolerance is not None else ([], None)
+        added_rolls = []
+        added = np.empty((len(pending), ENCODING_DIM), dtype=np.float32)
+
+        def nearest_enrolled(vector):
+            """(roll_number, where) of the closest face within duplicate_tolerance, or None"""
+            best = None
+            for rolls, vectors, where in ((known_rolls, known, 'already enrolled'),
+                                          (added_rolls, added[:len(added_rolls)], 'earlier in this import')):
+                if len(rolls):
+                    distances = np.linalg.norm(vectors - vector, axis=1)
+                    i = int(np.argmin(distances))
+                    if distances[i] < duplicate_tolerance and (best is None or distances[i] < best[0]):
+                        best = (distances[i], rolls[i], where)
+            return best and best[1:]
+
+        batch = []
+
+        def flush():
+            c.executemany("""INSERT INTO students (name, roll_number, password, encoding, photo_path, photo_hash)
+                             VALUES (?, ?, ?, ?, ?, ?)""", batch)
+            conn.commit()
+            batch.clear()
+
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                                 mp_context=multiprocessing.get_context('spawn')) as pool:
+            results = pool.map(enroll_photo, [job for _, _, job in pending], chunksize=8)
+            for (entry, photo_hash, job), (encoding, password_hash, error) in zip(pending, results):
+                if error:
+                    entry.pop('generated_password', None)
+                    entry.update(status='error', message=error)
+                    continue
+
+                roll_number = entry['roll_number']
+                if duplicate_tolerance is not None:
+                    vector = decode_encoding(encoding)
+                    duplicate = nearest_enrolled(vector)
+                    if duplicate:
+                        entry.pop('generated_password', None)
+                        entry.update(status='duplicate', duplicate_of=duplicate[0],
+                                     message=f'This face matches {duplicate[0]} ({duplicate[1]})')
+                        os.remove(job[2])
+                        continue
+                    added[len(added_rolls)] = vector
+                    added_rolls.append(roll_number)
+                batch.append((students[roll_number]['name'], roll_number, password_hash,
+                              encoding, job[2], photo_hash))
+                entry.update(status='enrolled', message='Student registered successfully')
+
+                # Commit in batches so an interrupted import can simply be re-run
+                if len(batch) >= COMMIT_BATCH_SIZE:
+                    flush()
+            if batch:
+                flush()
+
+    return {
+        'enrolled': sum(1 for e in report if e['status'] == 'enrolled'),
+        'skipped': sum(1 for e in report if e['status'] == 'skipped'),
+        'duplicates': sum(1 for e in report if e['status'] == 'duplicate'),
+        'errors': sum(1 for e in report if e['status'] == 'error'),
+        'files': report
+    }
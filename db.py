@@ -0,0 +1,65 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Data access
+# Each thread keeps one long-lived SQLite connection (re-opened after a fork)
+# instead of every route paying connect + schema parse + statement prepare.
+# Prepared statements are reused through sqlite3's per-connection cache.
+
+DB_FILE = os.environ.get('DB_FILE', 'attendance.db')
+STATEMENT_CACHE_SIZE = 256
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",        # readers never block the writer
+    "PRAGMA synchronous = NORMAL",      # safe with WAL, far fewer fsyncs
+    "PRAGMA busy_timeout = 5000",       # wait for a competing writer instead of failing
+    "PRAGMA mmap_size = 268435456",     # 256 MB memory-mapped reads
+    "PRAGMA cache_size = -16000",       # 16 MB page cache per connection
+    "PRAGMA temp_store = MEMORY",
+)
+
+_local = threading.local()
+
+
+def connect(path=None):
+    """Open a new tuned connection (callers normally want get_db instead)"""
+    conn = sqlite3.connect(path or DB_FILE, cached_statements=STATEMENT_CACHE_SIZE)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def _thread_connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.pid != os.getpid() or _local.path != DB_FILE:
+        conn = connect()
+        _local.conn, _local.pid, _local.path, _local.depth = conn, os.getpid(), DB_FILE, 0
+    return conn
+
+
+@contextmanager
+def get_db():
+    """Borrow this thread's connection for the duration of a with-block
+
+    Callers commit their own writes. Whatever happens inside the block, the
+    outermost block leaves the connection with no open transaction, so an
+    exception can never keep the database locked.
+    """
+    conn = _thread_connection()
+    _local.depth += 1
+    try:
+        yield conn
+    finally:
+        _local.depth -= 1
+        if _local.depth == 0 and conn.in_transaction:
+            conn.rollback()
+
+
+def close_thread_connection():
+    """Close this thread's pooled connection (e.g. before a thread exits)"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
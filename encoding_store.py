@@ -0,0 +1,61 @@
+import pickle
+import struct
+import numpy as np
+
+# Face encoding storage format
+# students.encoding holds an 8-byte header followed by the descriptor as raw
+# little-endian float32:
+#   magic b'FE' | version (uint8) | dtype code (uint8) | dim (uint16) | reserved (uint16)
+# The header keeps the float payload 4-byte aligned so rows can be viewed with
+# np.frombuffer without copying. Older databases stored pickle.dumps() of a
+# float64 array; those rows are only ever read by migrate_encodings().
+
+MAGIC = b'FE'
+VERSION = 1
+DTYPE_FLOAT32_LE = 1
+HEADER = struct.Struct('<2sBBHH')
+
+
+def encode_encoding(encoding):
+    """Serialize a face encoding to the compact binary column format"""
+    encoding = np.asarray(encoding, dtype='<f4').ravel()
+    return HEADER.pack(MAGIC, VERSION, DTYPE_FLOAT32_LE, len(encoding), 0) + encoding.tobytes()
+
+
+def is_binary_encoding(blob):
+    return blob is not None and len(blob) >= HEADER.size and bytes(blob[:2]) == MAGIC
+
+
+def decode_encoding(blob):
+    """View a stored encoding as a read-only float32 array (no copy)"""
+    if not is_binary_encoding(blob):
+        raise ValueError('Face encoding is in the legacy pickle format; '
+                         'run `flask --app app migrate-encodings` to convert the database')
+    magic, version, dtype_code, dim, _ = HEADER.unpack_from(blob)
+    if version != VERSION or dtype_code != DTYPE_FLOAT32_LE:
+        raise ValueError(f'Unsupported face encoding format (version {version}, dtype {dtype_code})')
+    if len(blob) != HEADER.size + 4 * dim:
+        raise ValueError('Truncated face encoding')
+    return np.frombuffer(blob, dtype='<f4', count=dim, offset=HEADER.size)
+
+
+def migrate_encodings(conn):
+    """Rewrite every legacy pickled students.encoding in place
+
+    Runs in a single transaction. Returns (converted, already_binary).
+    """
+    c = conn.cursor()
+    c.execute("SELECT id, encoding FROM students")
+    converted = []
+    already_binary = 0
+    for student_id, blob in c.fetchall():
+        if is_binary_encoding(blob):
+            already_binary += 1
+            continue
+        # Trusted one-off read of our own legacy rows; never done on the request path
+        encoding = pickle.loads(blob)
+        converted.append((encode_encoding(encoding), student_id))
+
+    c.executemany("UPDATE students SET encoding = ? WHERE id = ?", converted)
+    conn.commit()
+    return len(converted), already_binary
@@ -0,0 +1,147 @@
+import json
+import queue
+import threading
+
+# Server-sent events
+# Open pages subscribe to /events instead of polling /get_current_subject.
+# Each web worker has one broker holding a bounded queue per open stream and
+# one scheduler thread that sleeps until the next class boundary from the
+# timetable, then pushes class_start / window_close. attendance_marked events
+# are picked up from the attendance table, so a check-in handled by any
+# worker reaches the streams held by every worker.
+
+
+class Subscriber:
+    """One open event stream"""
+
+    def __init__(self, user_type, user_id, queue_size):
+        self.user_type = user_type
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.closed = False
+
+    def wants(self, student_id):
+        return student_id is None or self.user_type == 'admin' or self.user_id == student_id
+
+
+class EventBroker:
+    """Fans events out to the event streams open in this process"""
+
+    def __init__(self, max_connections, queue_size=100, heartbeat=15):
+        self.max_connections = max_connections
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self.published = 0
+        self.dropped = 0
+        self.rejected = 0
+
+    @property
+    def connections(self):
+        return len(self._subscribers)
+
+    def subscribe(self, user_type, user_id):
+        """Register a new stream, or return None if this worker is at its limit"""
+        with self._lock:
+            if len(self._subscribers) >= self.max_connections:
+                self.rejected += 1
+                return None
+            subscriber = Subscriber(user_type, user_id, self.queue_size)
+            self._subscribers.add(subscriber)
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event, data, student_id=None):
+        """Send an event to everyone, or only to one student (and the admins)"""
+        message = f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        with self._lock:
+            subscribers = [s for s in self._subscribers if s.wants(student_id)]
+            self.published += 1
+        for subscriber in subscribers:
+            try:
+                subscriber.queue.put_nowait(message)
+            except queue.Full:
+                # A client that stopped reading is cut off; EventSource reconnects on its own
+                subscriber.closed = True
+                self.dropped += 1
+
+    def stream(self, subscriber):
+        """Generator of SSE text for one subscriber; unsubscribes when the client goes away"""
+        try:
+            yield "retry: 5000\n\n"
+            while not subscriber.closed:
+                try:
+                    yield subscriber.queue.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    # Keeps proxies from timing out the stream and detects dead clients
+                    yield ": ping\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self):
+        return {'connections': self.connections, 'max_connections': self.max_connections,
+                'published': self.published, 'dropped': self.dropped, 'rejected': self.rejected}
+
+
+class EventScheduler:
+    """Background thread publishing class boundary and attendance events
+
+    `current_subject()` returns (subject or None, seconds until that can
+    change); `new_attendance(after_id)` returns (last_id, [(student_id, data)])
+    for records inserted after `after_id` (after_id=None just returns the
+    current last id).
+    """
+
+    def __init__(self, broker, current_subject, new_attendance, poll_interval=2.0):
+        self.broker = broker
+        self.current_subject = current_subject
+        self.new_attendance = new_attendance
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._subject = None
+        self._last_id = None
+
+    def start(self):
+        # Started on the first subscriber so a pre-forking server starts one per worker
+        with self._start_lock:
+            if self._thread is None:
+                self._subject, _ = self.current_subject()
+                self._thread = threading.Thread(target=self._run, name='event-scheduler', daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        """Re-check the timetable now (e.g. after this process edited a subject)"""
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            try:
+                wait = self._tick()
+            except Exception:
+                wait = self.poll_interval
+            self._wake.wait(wait)
+            self._wake.clear()
+
+    def _tick(self):
+        subject, seconds_left = self.current_subject()
+        if subject != self._subject:
+            if self._subject:
+                self.broker.publish('window_close', {'subject': self._subject})
+            if subject:
+                self.broker.publish('class_start', {'subject': subject})
+            self._subject = subject
+
+        if self.broker.connections:
+            self._last_id, rows = self.new_attendance(self._last_id)
+            for student_id, data in rows:
+                self.broker.publish('attendance_marked', data, student_id=student_id)
+            return min(self.poll_interval, seconds_left)
+        # Nobody is listening: forget the position and just wait for the next boundary
+        self._last_id = None
+        return min(60.0, seconds_left)
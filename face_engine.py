@@ -0,0 +1,254 @@
+import os
+import threading
+import cv2
+import dlib
+import numpy as np
+from face_quality import score_quality
+from liveness import score_liveness
+from metrics import StageTimer
+
+# Face detection and encoding
+# Kept separate from app.py so worker processes can load the dlib models
+# without importing the Flask application.
+#
+# Detection runs on a downscaled copy of the frame without upsampling first,
+# and only falls back to the slower passes (upsampled small copy, then the
+# original full-resolution upsampled pass) when nothing is found. The face box
+# is mapped back to full resolution so landmarks and the descriptor are
+# computed exactly as before, on an RGB crop around the face.
+#
+# An enrollment photo is encoded the same way and its face is also scored for
+# size, sharpness and pose (see face_quality.py) from the landmarks already found.
+#
+# For a liveness burst the face is detected on the first frame only; the
+# other frames follow it with dlib's correlation tracker on the downscaled
+# copies and just get landmarks (no detection, no descriptor).
+#
+# The models are loaded on first use (or by load_models()), so importing this
+# module costs nothing until a face is actually processed.
+
+# Widest image the detector sees; 0 disables downscaling
+FACE_DETECT_MAX_WIDTH = int(os.environ.get('FACE_DETECT_MAX_WIDTH', 320))
+# Fall back to the original full-resolution detector(rgb, 1) pass if the fast passes find nothing
+FACE_DETECT_FULL_FALLBACK = os.environ.get('FACE_DETECT_FULL_FALLBACK', '1') == '1'
+# Let libjpeg decode at 1/2 or 1/4 size (1 = full size); only worth it for large uploads
+FACE_DECODE_REDUCTION = int(os.environ.get('FACE_DECODE_REDUCTION', 1))
+# Margin around the face box (as a fraction of its size) kept in the encoding crop
+FACE_CROP_MARGIN = 0.5
+
+_DECODE_FLAGS = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4}
+
+SHAPE_PREDICTOR_FILE = 'shape_predictor_68_face_landmarks.dat'
+FACE_RECOGNITION_MODEL_FILE = 'dlib_face_recognition_resnet_model_v1.dat'
+
+# dlib face detector, landmark predictor and recognizer, set by load_models()
+detector = None
+predictor = None
+face_encoder = None
+_models_lock = threading.Lock()
+
+def load_models():
+    """Load the dlib models once per process (safe to call from any thread)"""
+    global detector, predictor, face_encoder
+    if face_encoder is None:
+        with _models_lock:
+            if face_encoder is None:
+                detector = dlib.get_frontal_face_detector()
+                predictor = dlib.shape_predictor(SHAPE_PREDICTOR_FILE)
+                # Set last: the other threads take a non-None face_encoder to mean all are loaded
+                face_encoder = dlib.face_recognition_model_v1(FACE_RECOGNITION_MODEL_FILE)
+    return detector, predictor, face_encoder
+
+def detect_faces(image, timer=None):
+    """Detect faces in a BGR image, returning dlib rectangles in full-resolution coordinates"""
+    timer = timer or StageTimer()
+    detector, _, _ = load_models()
+    height, width = image.shape[:2]
+    scale = 1.0
+    small = image
+    if FACE_DETECT_MAX_WIDTH and width > FACE_DETECT_MAX_WIDTH:
+        scale = FACE_DETECT_MAX_WIDTH / width
+        with timer.stage('downscale'):
+            small = cv2.resize(image, (FACE_DETECT_MAX_WIDTH, max(1, round(height * scale))),
+                               interpolation=cv2.INTER_AREA)
+
+    with timer.stage('detect_rgb'):
+        small_rgb = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+
+    # A selfie-sized face is found without upsampling; only small faces need the 2x pass
+    with timer.stage('detect'):
+        faces = detector(small_rgb, 0)
+        if len(faces) == 0:
+            faces = detector(small_rgb, 1)
+
+    if len(faces) == 0:
+        if scale == 1.0 or not FACE_DETECT_FULL_FALLBACK:
+            return []
+        with timer.stage('detect_full'):
+            return list(detector(cv2.cvtColor(image, cv2.COLOR_BGR2RGB), 1))
+
+    if scale == 1.0:
+        return list(faces)
+    return [dlib.rectangle(int(round(f.left() / scale)), int(round(f.top() / scale)),
+                           int(round(f.right() / scale)), int(round(f.bottom() / scale)))
+            for f in faces]
+
+def face_landmarks(image, face, timer=None):
+    """(RGB crop, landmark shape within it, crop origin) for one face box"""
+    timer = timer or StageTimer()
+    _, predictor, _ = load_models()
+    height, width = image.shape[:2]
+    margin_x = int(face.width() * FACE_CROP_MARGIN)
+    margin_y = int(face.height() * FACE_CROP_MARGIN)
+    x0, y0 = max(0, face.left() - margin_x), max(0, face.top() - margin_y)
+    x1, y1 = min(width, face.right() + margin_x), min(height, face.bottom() + margin_y)
+
+    with timer.stage('crop_rgb'):
+        rgb = cv2.cvtColor(image[y0:y1, x0:x1], cv2.COLOR_BGR2RGB)
+    local = dlib.rectangle(face.left() - x0, face.top() - y0, face.right() - x0, face.bottom() - y0)
+
+    with timer.stage('landmarks'):
+        shape = predictor(rgb, local)
+    return rgb, shape, (x0, y0)
+
+def shape_points(shape, origin=(0, 0)):
+    """A dlib landmark shape as a (68, 2) array, shifted by `origin`"""
+    return np.array([(shape.part(i).x + origin[0], shape.part(i).y + origin[1])
+                     for i in range(shape.num_parts())], dtype=np.float64)
+
+def encode_face(image, face, timer=None):
+    """Landmarks + 128-d descriptor for one face box, computed on an RGB crop around it"""
+    timer = timer or StageTimer()
+    rgb, shape, _ = face_landmarks(image, face, timer)
+    _, _, face_encoder = load_models()
+    with timer.stage('descriptor'):
+        encoding = np.array(face_encoder.compute_face_descriptor(rgb, shape))
+    return encoding
+
+def get_face_encoding(image, timings=None):
+    """Extract face encoding from image
+
+    Pass a dict as `timings` to collect per-stage durations in milliseconds.
+    """
+    timer = StageTimer(timings)
+    faces = detect_faces(image, timer)
+
+    if len(faces) == 0:
+        return None
+
+    return encode_face(image, faces[0], timer)
+
+def get_enrollment_encoding(image, timings=None):
+    """(encoding, quality details) of the first face in an enrollment photo, or None"""
+    timer = StageTimer(timings)
+    faces = detect_faces(image, timer)
+    if len(faces) == 0:
+        return None
+    face = faces[0]
+
+    rgb, shape, origin = face_landmarks(image, face, timer)
+    _, _, face_encoder = load_models()
+    with timer.stage('descriptor'):
+        encoding = np.array(face_encoder.compute_face_descriptor(rgb, shape))
+    with timer.stage('quality'):
+        quality = score_quality(image, (face.left(), face.top(), face.right(), face.bottom()),
+                                shape_points(shape, origin))
+    return encoding, quality
+
+def get_face_encodings(image, timings=None):
+    """Extract (box, encoding) for every face in the image"""
+    timer = StageTimer(timings)
+    faces = detect_faces(image, timer)
+
+    results = []
+    for face in faces:
+        encoding = encode_face(image, face, timer)
+        box = {'left': face.left(), 'top': face.top(), 'right': face.right(), 'bottom': face.bottom()}
+        results.append((box, encoding))
+    return results
+
+def _small(image):
+    """(downscaled grayscale copy for tracking, scale)"""
+    height, width = image.shape[:2]
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    if not FACE_DETECT_MAX_WIDTH or width <= FACE_DETECT_MAX_WIDTH:
+        return gray, 1.0
+    scale = FACE_DETECT_MAX_WIDTH / width
+    return cv2.resize(gray, (FACE_DETECT_MAX_WIDTH, max(1, round(height * scale))),
+                      interpolation=cv2.INTER_AREA), scale
+
+def get_live_face_encoding(images, timings=None):
+    """(encoding of the first frame's face, liveness details) for a burst, or None
+
+    The face is detected on the first frame only and tracked through the rest.
+    """
+    timer = StageTimer(timings)
+    faces = detect_faces(images[0], timer)
+    if len(faces) == 0:
+        return None
+    face = faces[0]
+
+    rgb, shape, origin = face_landmarks(images[0], face, timer)
+    _, _, face_encoder = load_models()
+    with timer.stage('descriptor'):
+        encoding = np.array(face_encoder.compute_face_descriptor(rgb, shape))
+    frames = [shape_points(shape, origin)]
+
+    with timer.stage('track'):
+        small, scale = _small(images[0])
+        tracker = dlib.correlation_tracker()
+        tracker.start_track(small, dlib.rectangle(int(face.left() * scale), int(face.top() * scale),
+                                                  int(face.right() * scale), int(face.bottom() * scale)))
+    for image in images[1:]:
+        if image.shape != images[0].shape:
+            continue
+        with timer.stage('track'):
+            small, _ = _small(image)
+            tracker.update(small)
+            box = tracker.get_position()
+        tracked = dlib.rectangle(int(box.left() / scale), int(box.top() / scale),
+                                 int(box.right() / scale), int(box.bottom() / scale))
+        _, shape, origin = face_landmarks(image, tracked, timer)
+        frames.append(shape_points(shape, origin))
+
+    with timer.stage('liveness'):
+        liveness = score_liveness(frames, (images[0].shape[1], images[0].shape[0]))
+    return encoding, liveness
+
+def decode_image(data, timings=None):
+    """Decode JPEG/PNG bytes into a BGR image"""
+    with StageTimer(timings).stage('decode'):
+        return cv2.imdecode(np.frombuffer(data, np.uint8), _DECODE_FLAGS.get(FACE_DECODE_REDUCTION, cv2.IMREAD_COLOR))
+
+def encode_image_bytes(data, timings=None):
+    """Decode an uploaded image and return its first face encoding (or None)"""
+    img = decode_image(data, timings)
+    if img is None:
+        return None
+    return get_face_encoding(img, timings)
+
+def encode_enrollment_image_bytes(data, timings=None):
+    """Decode an enrollment photo and return (encoding, quality) or None"""
+    img = decode_image(data, timings)
+    if img is None:
+        return None
+    return get_enrollment_encoding(img, timings)
+
+def encode_live_image_bytes(frames, timings=None):
+    """Decode a burst of uploaded frames and return (encoding, liveness) or None"""
+    images = [img for img in (decode_image(data, timings) for data in frames) if img is not None]
+    if not images:
+        return None
+    return get_live_face_encoding(images, timings)
+
+def encode_all_image_bytes(data, timings=None):
+    """Decode an uploaded image and return (box, encoding) for every face"""
+    img = decode_image(data, timings)
+    if img is None:
+        return []
+    return get_face_encodings(img, timings)
+
+# PRELOAD_MODELS=1 loads them as soon as this module is imported instead, e.g. in the
+# gunicorn master or the recognition pool's fork server (see recognition_service.py)
+if os.environ.get('PRELOAD_MODELS', '0') == '1':
+    load_models()
@@ -0,0 +1,306 @@
+import threading
+import numpy as np
+from face_index import ExactIndex
+
+# Face gallery
+# Keeps every enrolled encoding in a contiguous float32 matrix so a probe
+# face is matched against the whole class with a single vectorized pass.
+# The nearest-neighbour search itself is delegated to a pluggable index
+# (see face_index.py); the gallery maps index hits back to students.
+# Per-subject rosters get their own small precomputed matrix so a check-in
+# during a class only has to search the students enrolled in it.
+# A student can have several templates (enrollment photos taken in different
+# light, later check-ins) next to their centroid, the mean of the templates.
+# The index holds the centroid of every student under -student_id plus, for
+# students with more than one, each template under its own id, so one search
+# finds a student's nearest template or centroid, whichever is closer.
+
+ENCODING_DIM = 128
+
+
+def mean_encoding(encodings):
+    """Centroid of a student's template encodings"""
+    return np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM).mean(axis=0)
+
+
+def face_distance(encoding, stored):
+    """Distance from a probe to one stored encoding, or the nearest of several (rows)"""
+    stored = np.atleast_2d(np.asarray(stored, dtype=np.float32))
+    return float(np.min(np.linalg.norm(stored - np.asarray(encoding, dtype=np.float32), axis=1)))
+
+
+def near_duplicate_pairs(owners, vectors, tolerance, block_size=2048):
+    """Pairs of different owners with two vectors closer than `tolerance`
+
+    `owners[i]` is who `vectors[i]` belongs to (several rows may share one).
+    Every row is compared with every later one a tile of block_size x
+    block_size at a time, one matrix product per tile, so memory stays
+    bounded however large the gallery is. Returns [(owner_a, owner_b,
+    distance)] with owner_a < owner_b, each pair once at its smallest
+    distance, nearest first.
+    """
+    owners = np.asarray(owners, dtype=np.int64)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, ENCODING_DIM)
+    sq_norms = np.einsum('ij,ij->i', vectors, vectors)
+    limit = np.float32(tolerance) ** 2
+    hits_a, hits_b, hits_d = [], [], []
+    for row_start in range(0, len(vectors), block_size):
+        rows = vectors[row_start:row_start + block_size]
+        row_norms = sq_norms[row_start:row_start + block_size, None]
+        # Tiles on or above the diagonal only: each pair is looked at once
+        for col_start in range(row_start, len(vectors), block_size):
+            dist = row_norms - 2.0 * (rows @ vectors[col_start:col_start + block_size].T) \
+                + sq_norms[None, col_start:col_start + block_size]
+            i, j = np.nonzero(dist < limit)
+            keep = (j + col_start > i + row_start) & (owners[i + row_start] != owners[j + col_start])
+            i, j = i[keep], j[keep]
+            hits_a.append(owners[i + row_start])
+            hits_b.append(owners[j + col_start])
+            hits_d.append(dist[i, j])
+    if not hits_a:
+        return []
+
+    a, b = np.concatenate(hits_a), np.concatenate(hits_b)
+    a, b = np.minimum(a, b), np.maximum(a, b)
+    d = np.sqrt(np.maximum(np.concatenate(hits_d), 0.0))
+    # Nearest hit of each owner pair first, then keep the first of each pair
+    order = np.lexsort((d, b, a))
+    a, b, d = a[order], b[order], d[order]
+    first = np.ones(len(a), dtype=bool)
+    first[1:] = (a[1:] != a[:-1]) | (b[1:] != b[:-1])
+    a, b, d = a[first], b[first], d[first]
+    order = np.argsort(d, kind='stable')
+    return [(int(x), int(y), float(z)) for x, y, z in zip(a[order], b[order], d[order])]
+
+
+class FaceGallery:
+    """Process-resident gallery of enrolled student face encodings"""
+
+    def __init__(self, dim=ENCODING_DIM, index=None):
+        self.dim = dim
+        self.index = index if index is not None else ExactIndex(dim=dim)
+        self.loaded = False
+        # Opaque marker of the data the gallery was loaded from (set by the owner)
+        self.version = None
+        # Likewise for the subject rosters, which change without touching the faces
+        self.roster_version = None
+        self._lock = threading.Lock()
+        self._rosters = {}
+        self._set_rows([], [], [], np.empty((0, dim), dtype=np.float32), {})
+
+    def _set_rows(self, ids, names, roll_numbers, encodings, templates):
+        """Swap in a new student snapshot; readers never see a half-updated gallery"""
+        ids = np.asarray(ids, dtype=np.int64)
+        self._snapshot = (
+            ids,
+            np.asarray(names, dtype=object),
+            np.asarray(roll_numbers, dtype=object),
+            {int(student_id): row for row, student_id in enumerate(ids)},
+            np.ascontiguousarray(encodings, dtype=np.float32).reshape(-1, self.dim),
+            templates,
+            # Template id -> student, and the most index entries any one student has
+            {int(t): student_id for student_id, (t_ids, _) in templates.items() for t in t_ids},
+            1 + max((len(t_ids) for t_ids, _ in templates.values() if len(t_ids) > 1), default=0),
+        )
+
+    def __len__(self):
+        return len(self._snapshot[0])
+
+    def _items(self, student_id, encoding, templates):
+        """Index ids and vectors of one student: the centroid, and the templates if there are several"""
+        encoding = np.asarray(encoding, dtype=np.float32).reshape(1, self.dim)
+        if templates is None or len(templates[0]) < 2:
+            return np.array([-int(student_id)], dtype=np.int64), encoding
+        return np.append(-int(student_id), templates[0]), np.vstack([encoding, templates[1]])
+
+    def _as_templates(self, templates):
+        if not templates:
+            return None
+        return (np.array([t[0] for t in templates], dtype=np.int64),
+                np.array([t[1] for t in templates], dtype=np.float32).reshape(-1, self.dim))
+
+    def load(self, rows, templates=()):
+        """Replace the gallery with (id, name, roll_number, encoding) rows
+
+        `templates` are (template_id, student_id, encoding) rows; the encoding
+        of a student with templates is expected to be their centroid.
+        """
+        rows = list(rows)
+        grouped = {}
+        for template_id, student_id, encoding in templates:
+            grouped.setdefault(int(student_id), []).append((template_id, encoding))
+        with self._lock:
+            ids = [r[0] for r in rows]
+            encodings = np.array([r[3] for r in rows], dtype=np.float32).reshape(-1, self.dim)
+            student_templates = {}
+            item_ids, item_vectors = [], []
+            for student_id, encoding in zip(ids, encodings):
+                student_templates[int(student_id)] = self._as_templates(grouped.get(int(student_id)))
+                items = self._items(student_id, encoding, student_templates[int(student_id)])
+                item_ids.append(items[0])
+                item_vectors.append(items[1])
+            if rows:
+                self.index.build(np.concatenate(item_ids), np.vstack(item_vectors))
+            else:
+                self.index.build([], encodings)
+            self._set_rows(ids, [r[1] for r in rows], [r[2] for r in rows], encodings,
+                           {k: v for k, v in student_templates.items() if v is not None})
+            self._rosters = {}
+            self.loaded = True
+
+    def add(self, student_id, name, roll_number, encoding, templates=None):
+        """Add (or replace) a single student, optionally with their (template_id, encoding) templates"""
+        with self._lock:
+            self._put(student_id, name, roll_number, encoding, self._as_templates(templates))
+
+    def _put(self, student_id, name, roll_number, encoding, templates):
+        ids, names, rolls, _, encodings, all_templates = self._snapshot[:6]
+        keep = ids != student_id
+        encoding = np.asarray(encoding, dtype=np.float32).reshape(1, self.dim)
+        old = all_templates.get(int(student_id))
+        if old is not None:
+            self.index.remove_many(old[0])
+        self.index.add_many(*self._items(student_id, encoding, templates))
+        all_templates = dict(all_templates)
+        all_templates.pop(int(student_id), None)
+        if templates is not None:
+            all_templates[int(student_id)] = templates
+        self._set_rows(
+            np.append(ids[keep], student_id),
+            np.append(names[keep], name),
+            np.append(rolls[keep], roll_number),
+            np.vstack([encodings[keep], encoding]),
+            all_templates,
+        )
+        if not keep.all():
+            self._drop_rosters_with(student_id)
+
+    def update(self, student_id, name=None, roll_number=None, encoding=None):
+        """Update the cached details of an enrolled student
+
+        A new encoding replaces all of the student's templates.
+        """
+        with self._lock:
+            ids, names, rolls, positions, encodings, templates = self._snapshot[:6]
+            row = positions.get(int(student_id))
+            if row is None:
+                return
+            if encoding is not None:
+                self._put(student_id, names[row] if name is None else name,
+                          rolls[row] if roll_number is None else roll_number, encoding, None)
+                return
+            names, rolls = names.copy(), rolls.copy()
+            if name is not None:
+                names[row] = name
+            if roll_number is not None:
+                rolls[row] = roll_number
+            self._set_rows(ids, names, rolls, encodings, templates)
+
+    def remove(self, student_id):
+        """Drop a student from the gallery"""
+        with self._lock:
+            ids, names, rolls, _, encodings, templates = self._snapshot[:6]
+            keep = ids != student_id
+            items, _ = self._items(student_id, np.zeros(self.dim), templates.get(int(student_id)))
+            self.index.remove_many(items)
+            templates = {k: v for k, v in templates.items() if k != int(student_id)}
+            self._set_rows(ids[keep], names[keep], rolls[keep], encodings[keep], templates)
+            self._drop_rosters_with(student_id)
+
+    def get(self, student_id):
+        """(name, roll_number, encodings) of one enrolled student, or None
+
+        `encodings` has the centroid in its first row, then any templates.
+        """
+        _, names, rolls, positions, encodings, templates = self._snapshot[:6]
+        row = positions.get(int(student_id))
+        if row is None:
+            return None
+        return names[row], rolls[row], self._items(student_id, encodings[row], templates.get(int(student_id)))[1]
+
+    def template_count(self, student_id):
+        """Number of stored templates of a student (0 if only the centroid is known)"""
+        templates = self._snapshot[5].get(int(student_id))
+        return 0 if templates is None else len(templates[0])
+
+    # Subject rosters
+    def has_roster(self, subject_id):
+        return subject_id in self._rosters
+
+    def set_roster(self, subject_id, student_ids):
+        """Precompute the encoding matrix for the students enrolled in a subject"""
+        with self._lock:
+            ids, _, _, positions, encodings, templates = self._snapshot[:6]
+            item_ids, item_vectors = [np.empty(0, dtype=np.int64)], [np.empty((0, self.dim), dtype=np.float32)]
+            for student_id in student_ids:
+                row = positions.get(int(student_id))
+                if row is not None:
+                    items = self._items(ids[row], encodings[row], templates.get(int(student_id)))
+                    item_ids.append(items[0])
+                    item_vectors.append(items[1])
+            roster = ExactIndex(dim=self.dim)
+            roster.build(np.concatenate(item_ids), np.vstack(item_vectors))
+            self._rosters[subject_id] = roster
+
+    def drop_roster(self, subject_id=None):
+        """Forget one subject's roster (or all of them) so it is rebuilt on next use"""
+        with self._lock:
+            if subject_id is None:
+                self._rosters = {}
+            else:
+                self._rosters.pop(subject_id, None)
+
+    def _drop_rosters_with(self, student_id):
+        self._rosters = {subject_id: roster for subject_id, roster in self._rosters.items()
+                         if -int(student_id) not in roster}
+
+    def match(self, encoding, k=5, subject_id=None):
+        """Find the nearest students to a probe encoding
+
+        With a subject_id only that subject's roster is searched (see
+        set_roster). Returns None when there is nobody to search, otherwise a
+        dict with the best match, its distance, the margin to the runner-up
+        and the top-k candidates ordered by distance.
+        """
+        return self.match_many([encoding], k=k, subject_id=subject_id)[0]
+
+    def match_many(self, encodings, k=5, subject_id=None):
+        """Match several probe encodings in one batched search (see match)"""
+        ids, names, rolls, positions, _, _, owners, per_student = self._snapshot
+        probes = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        index = self.index if subject_id is None else self._rosters.get(subject_id)
+        if len(ids) == 0 or index is None or len(index) == 0:
+            return [None] * len(probes)
+
+        results = []
+        # Enough hits that k distinct students survive when each has several entries
+        for hit_ids, hit_dist in index.search_many(probes, max(k, 2) * per_student):
+            candidates = []
+            seen = set()
+            for item_id, distance in zip(hit_ids.tolist(), hit_dist):
+                # A student's nearest entry (template or centroid) comes first
+                student_id = -item_id if item_id < 0 else owners.get(item_id)
+                row = positions.get(student_id)
+                if row is None or student_id in seen:
+                    continue
+                seen.add(student_id)
+                candidates.append({
+                    'student_id': int(student_id),
+                    'name': names[row],
+                    'roll_number': rolls[row],
+                    'distance': float(distance)
+                })
+            if not candidates:
+                results.append(None)
+                continue
+
+            best = candidates[0]
+            results.append({
+                'student_id': best['student_id'],
+                'name': best['name'],
+                'roll_number': best['roll_number'],
+                'distance': best['distance'],
+                'margin': candidates[1]['distance'] - best['distance'] if len(candidates) > 1 else None,
+                'candidates': candidates[:k]
+            })
+        return results
@@ -0,0 +1,258 @@
+import threading
+import numpy as np
+
+# Nearest-neighbour indexes for the face gallery
+# ExactIndex scans every descriptor; IVFIndex partitions the descriptors with
+# k-means and only scans the `nprobe` partitions closest to the probe, trading a
+# little recall for latency once enrollment reaches tens of thousands.
+
+
+def _sq_distances(vectors, sq_norms, probe):
+    """Squared Euclidean distance from a probe to each row of vectors"""
+    return np.maximum(sq_norms - 2.0 * (vectors @ probe) + probe @ probe, 0.0)
+
+
+def _row_sq_norms(vectors):
+    return np.einsum('ij,ij->i', vectors, vectors)
+
+
+def kmeans(vectors, n_clusters, iterations=10, sample_size=None, seed=0):
+    """Plain Lloyd's k-means returning the float32 centroid matrix"""
+    rng = np.random.default_rng(seed)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if sample_size and len(vectors) > sample_size:
+        vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    n_clusters = min(n_clusters, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+
+    for _ in range(iterations):
+        labels = assign(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        counts = np.bincount(labels, minlength=n_clusters)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Re-seed empty clusters from random points so no partition goes unused
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+    return centroids
+
+
+def assign(vectors, centroids, chunk_size=8192):
+    """Index of the nearest centroid for each vector, computed in chunks"""
+    centroid_norms = _row_sq_norms(centroids)
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_size):
+        chunk = vectors[start:start + chunk_size]
+        scores = centroid_norms[None, :] - 2.0 * (chunk @ centroids.T)
+        labels[start:start + chunk_size] = np.argmin(scores, axis=1)
+    return labels
+
+
+class ExactIndex:
+    """Brute-force index: one matrix product over every descriptor"""
+
+    kind = 'exact'
+
+    def __init__(self, dim=128):
+        self.dim = dim
+        self._lock = threading.Lock()
+        self.build([], np.empty((0, dim), dtype=np.float32))
+
+    def __len__(self):
+        return len(self._state[0])
+
+    def __contains__(self, item_id):
+        return bool(np.any(self._state[0] == item_id))
+
+    def build(self, ids, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        self._state = (np.asarray(ids, dtype=np.int64), vectors, _row_sq_norms(vectors))
+
+    def add(self, item_id, vector):
+        self.add_many([item_id], vector)
+
+    def add_many(self, item_ids, vectors):
+        """Add (or replace) several descriptors with a single rebuild"""
+        with self._lock:
+            item_ids = np.asarray(item_ids, dtype=np.int64)
+            ids, old, _ = self._state
+            keep = ~np.isin(ids, item_ids)
+            self.build(np.append(ids[keep], item_ids),
+                       np.vstack([old[keep], np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)]))
+
+    def remove(self, item_id):
+        self.remove_many([item_id])
+
+    def remove_many(self, item_ids):
+        with self._lock:
+            ids, vectors, _ = self._state
+            keep = ~np.isin(ids, np.asarray(item_ids, dtype=np.int64))
+            self.build(ids[keep], vectors[keep])
+
+    def search(self, probe, k):
+        """Return (ids, distances) of the k nearest descriptors, nearest first"""
+        ids, vectors, sq_norms = self._state
+        if len(ids) == 0:
+            return ids, np.empty(0, dtype=np.float32)
+        probe = np.asarray(probe, dtype=np.float32).reshape(self.dim)
+        dist = _sq_distances(vectors, sq_norms, probe)
+        return _top_k(ids, dist, k)
+
+    def search_many(self, probes, k):
+        """Batched search: one matrix product for all probes"""
+        ids, vectors, sq_norms = self._state
+        probes = np.asarray(probes, dtype=np.float32).reshape(-1, self.dim)
+        if len(ids) == 0:
+            return [(ids, np.empty(0, dtype=np.float32)) for _ in probes]
+        dist = sq_norms[None, :] - 2.0 * (probes @ vectors.T) + np.einsum('ij,ij->i', probes, probes)[:, None]
+        np.maximum(dist, 0.0, out=dist)
+        return [_top_k(ids, row, k) for row in dist]
+
+
+class IVFIndex:
+    """Inverted-file index over k-means partitions of the descriptors
+
+    `nprobe` is the recall/latency knob: the number of partitions scanned per
+    query. nprobe == n_lists degrades to an exact search. Adds and removes are
+    incremental; the partitions are retrained once the index has grown to
+    `retrain_factor` times the size it was trained on.
+    """
+
+    kind = 'ivf'
+
+    def __init__(self, dim=128, n_lists=None, nprobe=8, iterations=10, retrain_factor=2.0, seed=0):
+        self.dim = dim
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.retrain_factor = retrain_factor
+        self.seed = seed
+        self._lock = threading.Lock()
+        self.build([], np.empty((0, dim), dtype=np.float32))
+
+    def __len__(self):
+        return len(self._owner)
+
+    def __contains__(self, item_id):
+        return int(item_id) in self._owner
+
+    def _choose_n_lists(self, n):
+        if self.n_lists:
+            return self.n_lists
+        # Roughly sqrt(N) partitions keeps both the centroid scan and the list scans small
+        return int(max(1, min(4096, round(2 * np.sqrt(n)))))
+
+    def build(self, ids, vectors):
+        """(Re)train the partitions on a full set of descriptors"""
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+
+        if len(ids):
+            n_lists = self._choose_n_lists(len(ids))
+            centroids = kmeans(vectors, n_lists, iterations=self.iterations,
+                               sample_size=256 * n_lists, seed=self.seed)
+            labels = assign(vectors, centroids)
+        else:
+            centroids = np.empty((0, self.dim), dtype=np.float32)
+            labels = np.empty(0, dtype=np.int64)
+
+        lists = []
+        for list_no in range(len(centroids)):
+            members = np.flatnonzero(labels == list_no)
+            lists.append(self._make_list(ids[members], vectors[members]))
+
+        # Searches read centroids and lists together, so swap them in as one tuple
+        self._state = (centroids, _row_sq_norms(centroids), lists)
+        self._owner = {int(i): int(l) for i, l in zip(ids, labels)}
+        self._trained_size = len(ids)
+
+    def _make_list(self, ids, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        return (np.asarray(ids, dtype=np.int64), vectors, _row_sq_norms(vectors))
+
+    def _all(self):
+        lists = self._state[2]
+        ids = [l[0] for l in lists]
+        vectors = [l[1] for l in lists]
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty((0, self.dim), dtype=np.float32)
+        return np.concatenate(ids), np.vstack(vectors)
+
+    def add(self, item_id, vector):
+        with self._lock:
+            item_id = int(item_id)
+            vector = np.asarray(vector, dtype=np.float32).reshape(1, self.dim)
+            if item_id in self._owner:
+                self._remove(item_id)
+            centroids, _, lists = self._state
+            if len(centroids) == 0 or len(self._owner) + 1 > self.retrain_factor * max(self._trained_size, 1):
+                ids, vectors = self._all()
+                self.build(np.append(ids, item_id), np.vstack([vectors, vector]))
+                return
+            list_no = int(assign(vector, centroids)[0])
+            ids, vectors, _ = lists[list_no]
+            lists[list_no] = self._make_list(np.append(ids, item_id), np.vstack([vectors, vector]))
+            self._owner[item_id] = list_no
+
+    def add_many(self, item_ids, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        for item_id, vector in zip(item_ids, vectors):
+            self.add(item_id, vector)
+
+    def remove(self, item_id):
+        with self._lock:
+            self._remove(int(item_id))
+
+    def remove_many(self, item_ids):
+        with self._lock:
+            for item_id in item_ids:
+                self._remove(int(item_id))
+
+    def _remove(self, item_id):
+        list_no = self._owner.pop(item_id, None)
+        if list_no is None:
+            return
+        lists = self._state[2]
+        ids, vectors, _ = lists[list_no]
+        keep = ids != item_id
+        lists[list_no] = self._make_list(ids[keep], vectors[keep])
+
+    def search(self, probe, k, nprobe=None):
+        """Return (ids, distances) of the approximate k nearest descriptors"""
+        centroids, centroid_norms, lists = self._state
+        if len(centroids) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        probe = np.asarray(probe, dtype=np.float32).reshape(self.dim)
+        nprobe = min(nprobe or self.nprobe, len(centroids))
+        centroid_dist = _sq_distances(centroids, centroid_norms, probe)
+        probed = np.argpartition(centroid_dist, nprobe - 1)[:nprobe] if nprobe < len(centroids) else range(len(centroids))
+
+        candidates = [lists[i] for i in probed if len(lists[i][0])]
+        if not candidates:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        ids = np.concatenate([c[0] for c in candidates])
+        dist = np.concatenate([_sq_distances(c[1], c[2], probe) for c in candidates])
+        return _top_k(ids, dist, k)
+
+    def search_many(self, probes, k, nprobe=None):
+        probes = np.asarray(probes, dtype=np.float32).reshape(-1, self.dim)
+        return [self.search(probe, k, nprobe=nprobe) for probe in probes]
+
+
+def _top_k(ids, sq_dist, k):
+    k = min(k, len(ids))
+    top = np.argpartition(sq_dist, k - 1)[:k] if k < len(ids) else np.arange(len(ids))
+    top = top[np.argsort(sq_dist[top], kind='stable')]
+    return ids[top], np.sqrt(sq_dist[top])
+
+
+def make_index(kind='exact', dim=128, nprobe=8):
+    """Build an index by name ('exact' or 'ivf')"""
+    if kind == 'exact':
+        return ExactIndex(dim=dim)
+    if kind == 'ivf':
+        return IVFIndex(dim=dim, nprobe=nprobe)
+    raise ValueError(f'Unknown face index: {kind}')
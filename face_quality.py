@@ -0,0 +1,80 @@
+import os
+import cv2
+from liveness import head_pose
+
+# Enrollment photo quality
+# A blurry, small or turned-away enrollment photo gives a descriptor that
+# later check-ins match poorly, so registration scores three cues of the
+# detected face:
+#   - size: width of the face box in pixels (the descriptor is computed on a
+#     150 px chip, so anything smaller is upscaled)
+#   - sharpness: variance of the Laplacian of the face, scaled to a fixed chip
+#     size so it doesn't depend on how large the face is in the frame
+#   - pose: yaw/pitch away from the camera, solved from six of the 68 landmarks
+# Each cue is scaled to 0..1 (1 = at least QUALITY_FACE_SIZE pixels, at least
+# QUALITY_SHARPNESS, facing the camera) and the score is the weakest of the three.
+
+# Face width (px) that scores a full 1 for size
+QUALITY_FACE_SIZE = float(os.environ.get('QUALITY_FACE_SIZE', 150))
+# Laplacian variance of the face chip that scores a full 1; webcam photos are ~30-100
+QUALITY_SHARPNESS = float(os.environ.get('QUALITY_SHARPNESS', 40))
+# Yaw or pitch (degrees) at which the pose cue reaches 0
+QUALITY_MAX_POSE_DEGREES = float(os.environ.get('QUALITY_MAX_POSE_DEGREES', 45))
+
+QUALITY_CHIP_SIZE = 150
+# What a rejected photo is told, by its weakest cue
+QUALITY_REASONS = {'size': 'face too small', 'sharpness': 'blurry', 'pose': 'not facing the camera'}
+
+
+def face_sharpness(image, box):
+    """Variance of the Laplacian of a BGR image's face box, resized to a fixed chip"""
+    left, top, right, bottom = box
+    height, width = image.shape[:2]
+    face = image[max(0, top):min(height, bottom), max(0, left):min(width, right)]
+    if face.size == 0:
+        return 0.0
+    gray = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY)
+    chip = cv2.resize(gray, (QUALITY_CHIP_SIZE, QUALITY_CHIP_SIZE), interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(chip, cv2.CV_64F).var())
+
+
+def face_pose(points, image_size):
+    """(yaw, pitch) of one face in degrees away from facing the camera, or None"""
+    pose = head_pose(points, image_size)
+    if pose is None:
+        return None
+    yaw, pitch = pose
+    # The pose model's y axis points up and the image's down, so a face looking
+    # straight at the camera solves to a pitch of +-180
+    return abs((yaw + 180.0) % 360.0 - 180.0), abs(pitch % 360.0 - 180.0)
+
+
+def score_quality(image, box, points):
+    """Score one detected face: `box` is (left, top, right, bottom), `points` its (68, 2) landmarks
+
+    Returns a dict with the per-cue details, `score` in 0..1 and the `weakest` cue.
+    """
+    height, width = image.shape[:2]
+    size = box[2] - box[0]
+    sharpness = face_sharpness(image, box)
+    pose = face_pose(points, (width, height))
+    turned = max(pose) if pose is not None else QUALITY_MAX_POSE_DEGREES
+    cues = {
+        'size': min(1.0, size / QUALITY_FACE_SIZE),
+        'sharpness': min(1.0, sharpness / QUALITY_SHARPNESS),
+        'pose': max(0.0, 1.0 - turned / QUALITY_MAX_POSE_DEGREES),
+    }
+    weakest = min(cues, key=cues.get)
+    return {
+        'face_size': int(size),
+        'sharpness': round(sharpness, 1),
+        'yaw': round(float(pose[0]), 1) if pose is not None else None,
+        'pitch': round(float(pose[1]), 1) if pose is not None else None,
+        'score': round(float(cues[weakest]), 3),
+        'weakest': weakest
+    }
+
+
+def quality_reason(quality):
+    """Short reason a photo was turned away, e.g. 'blurry'"""
+    return QUALITY_REASONS[quality['weakest']]
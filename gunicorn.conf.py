@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+
+# Gunicorn settings (used by the Procfile)
+# Face detection/encoding runs in the recognition process pool (see
+# recognition_service.py), so web workers only do light I/O-bound work and a
+# few threaded workers are enough for HTTP concurrency. Each web worker owns a
+# pool of RECOGNITION_WORKERS encoders, by default the cores divided by
+# WEB_CONCURRENCY (e.g. 2 each for 2 web workers on a 4-core box).
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+# The app sizes its recognition pool from this, so it must see gunicorn's default too
+os.environ['WEB_CONCURRENCY'] = str(workers)
+# Under gthread every open /events stream holds one of the worker's threads; for
+# thousands of connected pages use GUNICORN_WORKER_CLASS=gevent (pip install gevent)
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+if worker_class == 'gthread':
+    # Keep two threads free for ordinary requests: streams beyond that get 503 and the
+    # pages poll instead (the workers inherit this environment and read it at import)
+    sse_limit = max(0, threads - 2)
+    os.environ['SSE_MAX_CONNECTIONS'] = str(min(int(os.environ.get('SSE_MAX_CONNECTIONS', sse_limit)), sse_limit))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 2000))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+# PRELOAD_MODELS=1 imports the app once in the master and forks the workers from it.
+# With RECOGNITION_WORKERS=0 that includes the dlib models, which the workers then
+# share copy-on-write (a recognition pool shares them through its fork server instead).
+preload_app = os.environ.get('PRELOAD_MODELS', '0') == '1'
+
+
+def on_starting(server):
+    # Create/migrate the schema once per deploy, before any worker starts, instead of in
+    # every worker's import (INIT_DB_ON_START=0 if a release step already runs it)
+    if os.environ.get('INIT_DB_ON_START', '1') == '1':
+        # A schema migration needs no face models, so don't let it load them
+        env = {k: v for k, v in os.environ.items() if k != 'PRELOAD_MODELS'}
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'], check=True, env=env)
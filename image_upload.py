@@ -0,0 +1,81 @@
+import base64
+import struct
+
+# Uploaded image handling
+# Routes accept a captured photo three ways: a multipart file field named
+# `image` (what the templates send), a raw application/octet-stream body, or
+# the legacy base64 data URL in the `image` form field. The first two skip
+# the base64 round-trip entirely. Image dimensions are read from the JPEG/PNG
+# header so oversized frames are rejected before anything is decoded.
+
+MAX_IMAGE_SIDE = 4096
+
+
+class UploadError(ValueError):
+    """The request did not carry a usable image"""
+
+
+def image_dimensions(data):
+    """(width, height) from a JPEG or PNG header, or None if unrecognised"""
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and len(data) >= 24:
+        return struct.unpack('>II', data[16:24])
+
+    if data[:2] != b'\xff\xd8':
+        return None
+    # Walk the JPEG markers until the start-of-frame segment
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            if pos + 9 > len(data):
+                return None
+            height, width = struct.unpack('>HH', data[pos + 5:pos + 9])
+            return width, height
+        pos += 2 + length
+    return None
+
+
+def check_image(data, max_side=MAX_IMAGE_SIDE):
+    """Raise UploadError unless `data` is a JPEG/PNG within the size limit"""
+    if not data:
+        raise UploadError('No image provided')
+    size = image_dimensions(data)
+    if size is None:
+        raise UploadError('Unsupported image format (send a JPEG or PNG)')
+    if max(size) > max_side:
+        raise UploadError(f'Image is too large ({size[0]}x{size[1]}); the maximum side is {max_side}px')
+
+
+def read_uploaded_frames(request, field='frames', max_frames=10, max_side=MAX_IMAGE_SIDE):
+    """Encoded bytes of a burst of frames sent as repeated multipart files (may be empty)"""
+    uploads = request.files.getlist(field)
+    if len(uploads) > max_frames:
+        raise UploadError(f'Too many frames ({len(uploads)}); send at most {max_frames}')
+    frames = [upload.read() for upload in uploads]
+    for data in frames:
+        check_image(data, max_side)
+    return frames
+
+
+def read_uploaded_image(request, field='image', max_side=MAX_IMAGE_SIDE):
+    """Return the encoded image bytes carried by a request"""
+    upload = request.files.get(field)
+    if upload is not None:
+        data = upload.read()
+    elif request.mimetype == 'application/octet-stream':
+        data = request.get_data(cache=False)
+    else:
+        image_data = request.form.get(field)
+        if not image_data:
+            raise UploadError('No image provided')
+        # Legacy data URL: "data:image/jpeg;base64,...."
+        data = base64.b64decode(image_data.split(',', 1)[-1])
+
+    check_image(data, max_side)
+    return data
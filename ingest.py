@@ -0,0 +1,253 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from db import get_db
+
+try:
+    import fcntl
+except ImportError:  # Windows: one development server, so every journal is an orphan
+    fcntl = None
+
+# Attendance ingest
+# A verified check-in is appended to this worker's journal file and fsynced
+# (concurrent check-ins share one fsync), queued, and acknowledged. One writer
+# thread per worker drains the queue every `flush_interval` seconds and inserts
+# everything waiting with a single INSERT OR IGNORE ... executemany and one
+# commit, so a burst of check-ins costs one SQLite write transaction per batch
+# instead of one each, and request threads never wait for the write lock.
+# Each record carries a random ingest_key (unique in attendance), so replaying
+# a journal after a crash can't insert anything twice; the per-day unique
+# index drops repeat check-ins as before. Once everything journaled has been
+# committed the journal is truncated. A worker starting up replays the
+# journals no live worker holds a lock on.
+
+# A record whose student was deleted while it waited is dropped (counted as ignored)
+INSERT_SQL = """INSERT OR IGNORE INTO attendance
+                (student_id, subject_id, location_info, attendance_date, liveness_score, timestamp, ingest_key)
+                SELECT :student_id, :subject_id, :location_info, :attendance_date, :liveness_score,
+                       :timestamp, :key
+                WHERE EXISTS (SELECT 1 FROM students WHERE id = :student_id)"""
+
+
+class IngestBusy(Exception):
+    """The ingest queue is full"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def insert_records(conn, records):
+    """Insert journaled records (duplicates are ignored) and commit; returns rows inserted"""
+    inserted = conn.executemany(INSERT_SQL, records).rowcount
+    conn.commit()
+    return inserted
+
+
+def read_journal(f):
+    """Records in a journal file; a torn last line (crash mid-write) is skipped"""
+    f.seek(0)
+    records = []
+    for line in f:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            break
+    return records
+
+
+class AttendanceIngest:
+    """Write-behind queue of verified check-ins with a durable journal
+
+    With enabled=False records are inserted and committed in the calling
+    thread instead (no journal, no writer thread).
+    """
+
+    def __init__(self, journal_dir, enabled=True, queue_size=10000, batch_size=500,
+                 flush_interval=0.005, fsync=True, on_commit=None, retry_after=1):
+        self.journal_dir = journal_dir
+        self.enabled = enabled
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.on_commit = on_commit
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+        self._wake = threading.Event()
+        self._pid = None
+        self._queue = deque()
+        # (student_id, subject_id, date) of queued records, for the already-marked check
+        self._queued = {}
+        self._journal = None
+        self._written = 0
+        self._synced = 0
+        self._committed = 0
+        self.stats_counts = {'journaled': 0, 'inserted': 0, 'ignored': 0, 'batches': 0,
+                             'replayed': 0, 'rejected': 0, 'write_errors': 0}
+        self.last_batch_ms = 0.0
+
+    def _start(self):
+        # Started on first use so a pre-forking server gets a journal and writer per worker
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(self.journal_dir, exist_ok=True)
+            path = os.path.join(self.journal_dir, f'attendance-{os.getpid()}-{uuid.uuid4().hex[:8]}.jsonl')
+            self._journal = open(path, 'a+', encoding='utf-8')
+            if fcntl:
+                fcntl.flock(self._journal, fcntl.LOCK_EX)
+            self._queue.clear()
+            self._queued.clear()
+            self._written = self._synced = self._committed = 0
+            self._pid = os.getpid()
+            self.replay()
+            threading.Thread(target=self._run, name='attendance-ingest', daemon=True).start()
+            atexit.register(self.drain, 5.0)
+
+    def replay(self):
+        """Insert what the journals of workers that are gone still hold, then delete them"""
+        for name in sorted(os.listdir(self.journal_dir)):
+            path = os.path.join(self.journal_dir, name)
+            if not name.endswith('.jsonl') or os.path.abspath(path) == os.path.abspath(self._journal.name):
+                continue
+            with open(path, 'r+', encoding='utf-8') as f:
+                if fcntl:
+                    try:
+                        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except OSError:
+                        continue  # a live worker's journal
+                records = read_journal(f)
+                if records:
+                    with get_db() as conn:
+                        insert_records(conn, records)
+                    self.stats_counts['replayed'] += len(records)
+                os.remove(path)
+
+    def submit(self, records):
+        """Journal and queue check-ins; returns once they are durable
+
+        `records` are dicts with student_id, subject_id, location_info,
+        attendance_date and liveness_score. Raises IngestBusy when the queue
+        is full.
+        """
+        if not records:
+            return
+        now = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        records = [dict(r, timestamp=now, key=uuid.uuid4().hex) for r in records]
+        if not self.enabled:
+            with get_db() as conn:
+                inserted = insert_records(conn, records)
+            self.stats_counts['inserted'] += inserted
+            self.stats_counts['ignored'] += len(records) - inserted
+            if self.on_commit:
+                self.on_commit()
+            return
+        if self._pid != os.getpid():
+            self._start()
+
+        with self._lock:
+            if len(self._queue) + len(records) > self.queue_size:
+                self.stats_counts['rejected'] += len(records)
+                raise IngestBusy('Too many check-ins at once, please try again shortly', self.retry_after)
+            self._journal.write(''.join(json.dumps(r, separators=(',', ':')) + '\n' for r in records))
+            self._written += len(records)
+            seq = self._written
+            self._queue.extend(records)
+            for r in records:
+                key = (r['student_id'], r['subject_id'], r['attendance_date'])
+                self._queued[key] = self._queued.get(key, 0) + 1
+            self.stats_counts['journaled'] += len(records)
+        self._sync(seq)
+        self._wake.set()
+
+    def _sync(self, seq):
+        # Group fsync: whoever gets the lock syncs everything written so far, and
+        # the threads that queued up behind it usually find their records done
+        with self._sync_lock:
+            if self._synced >= seq:
+                return
+            with self._lock:
+                self._journal.flush()
+                written = self._written
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+            self._synced = written
+
+    def is_pending(self, student_id, subject_id, attendance_date):
+        """Whether a check-in for this student, subject and day is queued but not yet written"""
+        return (student_id, subject_id, attendance_date) in self._queued
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            # Let the rest of a burst arrive, then write it all at once
+            time.sleep(self.flush_interval)
+            while self._queue:
+                try:
+                    self._write_batch()
+                except Exception:
+                    self.stats_counts['write_errors'] += 1
+                    time.sleep(self.retry_after)
+
+    def _write_batch(self):
+        with self._lock:
+            batch = [self._queue[i] for i in range(min(self.batch_size, len(self._queue)))]
+        start = time.perf_counter()
+        try:
+            with get_db() as conn:
+                inserted = insert_records(conn, batch)
+        except sqlite3.Error:
+            # e.g. locked past busy_timeout by another process: the records stay queued
+            self.stats_counts['write_errors'] += 1
+            time.sleep(self.retry_after)
+            return
+        self.last_batch_ms = (time.perf_counter() - start) * 1000
+
+        with self._lock:
+            for _ in batch:
+                r = self._queue.popleft()
+                key = (r['student_id'], r['subject_id'], r['attendance_date'])
+                if self._queued[key] > 1:
+                    self._queued[key] -= 1
+                else:
+                    del self._queued[key]
+            self._committed += len(batch)
+            self.stats_counts['batches'] += 1
+            self.stats_counts['inserted'] += inserted
+            self.stats_counts['ignored'] += len(batch) - inserted
+            if self._committed == self._written:
+                # Everything journaled is in the database
+                self._journal.flush()
+                self._journal.truncate(0)
+            self._done.notify_all()
+        if self.on_commit:
+            self.on_commit()
+
+    def drain(self, timeout=None):
+        """Wait until everything queued has been written; False on timeout"""
+        if not self.enabled or self._pid != os.getpid():
+            return True
+        self._wake.set()
+        with self._lock:
+            return self._done.wait_for(lambda: self._committed == self._written, timeout)
+
+    def stats(self):
+        return {
+            'mode': 'queue' if self.enabled else 'direct',
+            'queued': len(self._queue),
+            'queue_size': self.queue_size,
+            'batch_size': self.batch_size,
+            'flush_interval_ms': self.flush_interval * 1000,
+            'last_batch_ms': round(self.last_batch_ms, 2),
+            **self.stats_counts
+        }
@@ -0,0 +1,87 @@
+import os
+import cv2
+import numpy as np
+
+# Liveness check
+# A printed photo or a phone screen held up to the camera doesn't blink and
+# doesn't change its head pose in 3D. Given the 68-point landmarks of the same
+# face over a short burst of frames, this scores two cues:
+#   - a blink: the eye aspect ratio (EAR) falls from open to closed
+#   - a head turn or nod: the yaw/pitch solved from six landmarks changes
+# Each cue is scaled to 0..1 (1 = a full blink / a full POSE_CHANGE_DEGREES
+# turn) and the score is the stronger of the two.
+
+# EAR of an open eye is ~0.3; a closed one is under ~0.2
+EAR_OPEN = float(os.environ.get('LIVENESS_EAR_OPEN', 0.25))
+EAR_CLOSED = float(os.environ.get('LIVENESS_EAR_CLOSED', 0.20))
+# Yaw or pitch change (degrees) that counts as a full head movement
+POSE_CHANGE_DEGREES = float(os.environ.get('LIVENESS_POSE_CHANGE_DEGREES', 10))
+
+LEFT_EYE = slice(36, 42)
+RIGHT_EYE = slice(42, 48)
+# Nose tip, chin, outer eye corners and mouth corners, and where they sit on a
+# generic head (mm, nose tip at the origin)
+POSE_LANDMARKS = [30, 8, 36, 45, 48, 54]
+POSE_MODEL = np.array([
+    (0.0, 0.0, 0.0),
+    (0.0, -330.0, -65.0),
+    (-225.0, 170.0, -135.0),
+    (225.0, 170.0, -135.0),
+    (-150.0, -150.0, -125.0),
+    (150.0, -150.0, -125.0),
+])
+
+
+def eye_aspect_ratio(eye):
+    """EAR of six eye landmarks: eye height over width, ~0 when closed"""
+    eye = np.asarray(eye, dtype=np.float64)
+    height = np.linalg.norm(eye[1] - eye[5]) + np.linalg.norm(eye[2] - eye[4])
+    width = np.linalg.norm(eye[0] - eye[3])
+    return height / (2.0 * width) if width else 0.0
+
+
+def face_ear(points):
+    """Mean EAR of both eyes for one frame's (68, 2) landmarks"""
+    return (eye_aspect_ratio(points[LEFT_EYE]) + eye_aspect_ratio(points[RIGHT_EYE])) / 2.0
+
+
+def head_pose(points, image_size):
+    """(yaw, pitch) in degrees for one frame's landmarks, or None if unsolvable"""
+    width, height = image_size
+    camera = np.array([[width, 0, width / 2], [0, width, height / 2], [0, 0, 1]], dtype=np.float64)
+    image_points = np.asarray(points, dtype=np.float64)[POSE_LANDMARKS]
+    ok, rvec, _ = cv2.solvePnP(POSE_MODEL, image_points, camera, np.zeros(4), flags=cv2.SOLVEPNP_ITERATIVE)
+    if not ok:
+        return None
+    rotation, _ = cv2.Rodrigues(rvec)
+    pitch, yaw, _ = cv2.RQDecomp3x3(rotation)[0]
+    return yaw, pitch
+
+
+def _angle_change(a, b):
+    return abs((a - b + 180.0) % 360.0 - 180.0)
+
+
+def score_liveness(frames, image_size):
+    """Score a burst of (68, 2) landmark arrays of one face
+
+    Returns a dict with the per-cue details and `score` in 0..1.
+    """
+    ears = [face_ear(points) for points in frames]
+    poses = [pose for pose in (head_pose(points, image_size) for points in frames) if pose is not None]
+
+    # How far the eyes went from open to closed, 1 = a full blink
+    ear_open, ear_closed = max(ears), min(ears)
+    blink = np.clip((ear_open - ear_closed) / (EAR_OPEN - EAR_CLOSED), 0.0, 1.0) \
+        if ear_open >= EAR_OPEN else 0.0
+    pose_change = max((max(_angle_change(yaw, poses[0][0]), _angle_change(pitch, poses[0][1]))
+                       for yaw, pitch in poses), default=0.0)
+    movement = min(1.0, pose_change / POSE_CHANGE_DEGREES)
+    return {
+        'frames': len(frames),
+        'ear_open': round(float(ear_open), 3),
+        'ear_closed': round(float(ear_closed), 3),
+        'blink': bool(ear_open >= EAR_OPEN and ear_closed <= EAR_CLOSED),
+        'pose_change': round(float(pose_change), 1),
+        'score': round(float(max(blink, movement)), 3)
+    }
@@ -0,0 +1,166 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# Metrics
+# Per-process counters and histograms, rendered in the Prometheus text
+# format by GET /metrics. Recording a value is a dict lookup and a few
+# additions under one lock, cheap enough to leave on for every request.
+# Like the other /…/stats endpoints each web worker reports its own numbers
+# (every series carries a `pid` label so a scrape of several workers adds up).
+#
+# StageTimer collects per-stage wall-clock timings of one piece of work into
+# a dict; face_engine uses it for decode/detect/landmarks/descriptor, the
+# routes for recognition, matching and database work, and the request hooks
+# turn the dict into stage histograms and the Server-Timing header.
+
+# Seconds; from a cached page hit up to a slow CPU face check
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Face distances; finer around the 0.6 match tolerance
+DISTANCE_BUCKETS = (0.2, 0.3, 0.35, 0.4, 0.45, 0.5, 0.55, 0.6, 0.65, 0.7, 0.8, 1.0)
+
+
+class StageTimer:
+    """Collects per-stage wall-clock timings (ms) into a dict"""
+
+    def __init__(self, timings=None):
+        self.timings = timings
+
+    def stage(self, name):
+        return _Stage(self.timings, name)
+
+
+class _Stage:
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.timings is not None:
+            elapsed = (time.perf_counter() - self.start) * 1000
+            self.timings[self.name] = self.timings.get(self.name, 0.0) + elapsed
+        return False
+
+
+class RequestTimer(StageTimer):
+    """StageTimer for one request that also knows when the request started"""
+
+    def __init__(self):
+        super().__init__({})
+        self.start = time.perf_counter()
+
+    def total_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+    def server_timing(self):
+        """Server-Timing header value: every stage, then the total"""
+        parts = [f'{name};dur={ms:.1f}' for name, ms in self.timings.items()]
+        parts.append(f'total;dur={self.total_ms():.1f}')
+        return ', '.join(parts)
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+class Metrics:
+    """Counters and histograms keyed by name and labels, plus collectors
+
+    Counters and histograms must be declared before use. A collector is a
+    function returning [(name, type, help, [(labels dict, value), ...])]
+    for numbers another object already keeps (queue depths, cache hits).
+    """
+
+    def __init__(self, prefix='attendance', enabled=True):
+        self.prefix = prefix
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+
+    def counter(self, name, help_text):
+        self._help[name] = help_text
+        self._counters[name] = {}
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self._help[name] = help_text
+        self._histograms[name] = (tuple(buckets), {})
+
+    def add_collector(self, collect):
+        self._collectors.append(collect)
+
+    def inc(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        series = self._counters[name]
+        with self._lock:
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        buckets, series = self._histograms[name]
+        i = bisect_left(buckets, value)
+        with self._lock:
+            counts = series.get(key)
+            if counts is None:
+                # One count per bucket plus +Inf, then the sum
+                counts = series[key] = [0] * (len(buckets) + 1) + [0.0]
+            counts[i] += 1
+            counts[-1] += value
+
+    def observe_stages(self, name, timings, **labels):
+        """Observe each stage of a StageTimer dict (ms) in seconds, labelled stage=<name>"""
+        for stage, ms in timings.items():
+            self.observe(name, ms / 1000, stage=stage, **labels)
+
+    def render(self):
+        """Everything in the Prometheus text exposition format"""
+        pid = ('pid', str(os.getpid()))
+        lines = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {name: (buckets, {k: list(v) for k, v in series.items()})
+                          for name, (buckets, series) in self._histograms.items()}
+
+        for name, series in counters.items():
+            full = f'{self.prefix}_{name}'
+            lines += [f'# HELP {full} {self._help[name]}', f'# TYPE {full} counter']
+            for key, value in sorted(series.items()):
+                lines.append(f'{full}{_label_text((pid,) + key)} {value}')
+
+        for name, (buckets, series) in histograms.items():
+            full = f'{self.prefix}_{name}'
+            lines += [f'# HELP {full} {self._help[name]}', f'# TYPE {full} histogram']
+            for key, counts in sorted(series.items()):
+                labels = (pid,) + key
+                cumulative = 0
+                for bound, count in zip(buckets + ('+Inf',), counts):
+                    cumulative += count
+                    lines.append(f'{full}_bucket{_label_text(labels + (("le", str(bound)),))} {cumulative}')
+                lines.append(f'{full}_sum{_label_text(labels)} {counts[-1]:.6f}')
+                lines.append(f'{full}_count{_label_text(labels)} {cumulative}')
+
+        for collect in self._collectors:
+            for name, kind, help_text, samples in collect():
+                full = f'{self.prefix}_{name}'
+                lines += [f'# HELP {full} {help_text}', f'# TYPE {full} {kind}']
+                for labels, value in samples:
+                    key = tuple(sorted(labels.items()))
+                    lines.append(f'{full}{_label_text((pid,) + key)} {value}')
+        return '\n'.join(lines) + '\n'
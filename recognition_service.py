@@ -0,0 +1,161 @@
+import atexit
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+# Recognition service
+# Face detection and encoding run in a fixed pool of worker processes, each
+# holding its own copy of the dlib models, instead of inside the web worker
+# handling the request. At most `workers + queue_size` jobs may be in flight;
+# anything beyond that is rejected immediately with RecognitionBusy so the
+# caller can answer 503 rather than pile up blocked request threads.
+#
+# With preload=True the pool's processes are forked from a fork server that
+# has already loaded the models, so they start at once and share one copy of
+# them, instead of each spawning a fresh interpreter and loading its own.
+
+
+class RecognitionBusy(Exception):
+    """The recognition pool is saturated (or a job took too long)"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _load_models():
+    # Once per worker process (a no-op when forked with the models already loaded)
+    import face_engine
+    face_engine.load_models()
+
+
+def _encode_one(data):
+    from face_engine import encode_image_bytes
+    timings = {}
+    return encode_image_bytes(data, timings), timings
+
+
+def _encode_enrollment(data):
+    from face_engine import encode_enrollment_image_bytes
+    timings = {}
+    return encode_enrollment_image_bytes(data, timings), timings
+
+
+def _encode_live(frames):
+    from face_engine import encode_live_image_bytes
+    timings = {}
+    return encode_live_image_bytes(frames, timings), timings
+
+
+def _encode_all(data):
+    from face_engine import encode_all_image_bytes
+    timings = {}
+    return encode_all_image_bytes(data, timings), timings
+
+
+class RecognitionService:
+    """Bounded front door to a process pool of face encoders
+
+    With workers=0 jobs run inline in the calling thread (handy for the
+    development server and tests).
+    """
+
+    def __init__(self, workers, queue_size, timeout, retry_after=2, preload=False):
+        self.workers = workers
+        self.preload = preload
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(max(workers, 1) + queue_size)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+
+    def _get_executor(self):
+        # Created on first use so a pre-forking server starts the pool in each worker
+        with self._executor_lock:
+            if self._executor is None:
+                if self.preload and 'forkserver' in multiprocessing.get_all_start_methods():
+                    context = multiprocessing.get_context('forkserver')
+                    # The fork server is a fresh interpreter, so it inherits PRELOAD_MODELS
+                    # and loads the models when it imports face_engine
+                    context.set_forkserver_preload(['face_engine'])
+                else:
+                    context = multiprocessing.get_context('spawn')
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=context,
+                    initializer=_load_models,
+                )
+                atexit.register(self._executor.shutdown, wait=False, cancel_futures=True)
+            return self._executor
+
+    def load_models(self):
+        """Load the models into this process now, if it is the one that encodes (workers=0)"""
+        if self.workers == 0:
+            _load_models()
+
+    def _run(self, fn, data):
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self.rejected += 1
+            raise RecognitionBusy('Face recognition is busy, please try again shortly', self.retry_after)
+        with self._stats_lock:
+            self.in_flight += 1
+
+        if self.workers == 0:
+            try:
+                return fn(data)
+            finally:
+                self._release()
+
+        # The slot is only freed once the job really finishes, even if we stop waiting for it
+        try:
+            future = self._get_executor().submit(fn, data)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise RecognitionBusy('Face recognition timed out, please try again', self.retry_after)
+
+    def _release(self):
+        with self._stats_lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def _timed(self, fn, data, timings):
+        # The stages are timed where the work runs and sent back with the result
+        result, stages = self._run(fn, data)
+        if timings is not None:
+            for stage, ms in stages.items():
+                timings[stage] = timings.get(stage, 0.0) + ms
+        return result
+
+    def encode(self, image_bytes, timings=None):
+        """Encoding of the first face in an encoded image, or None
+
+        Pass a dict as `timings` to collect face_engine's per-stage durations (ms).
+        """
+        return self._timed(_encode_one, image_bytes, timings)
+
+    def encode_enrollment(self, image_bytes, timings=None):
+        """(encoding, quality details) of the first face in an enrollment photo, or None"""
+        return self._timed(_encode_enrollment, image_bytes, timings)
+
+    def encode_live(self, frames, timings=None):
+        """(encoding, liveness) for a burst of encoded frames of one face, or None"""
+        return self._timed(_encode_live, frames, timings)
+
+    def encode_all(self, image_bytes, timings=None):
+        """(box, encoding) for every face in an encoded image"""
+        return self._timed(_encode_all, image_bytes, timings)
+
+    def stats(self):
+        return {'workers': self.workers, 'queue_size': self.queue_size,
+                'in_flight': self.in_flight, 'rejected': self.rejected}
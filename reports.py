@@ -0,0 +1,239 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Attendance reports
+# Absence is never recorded, only implied: a student enrolled in a subject
+# is expected at every session of it (one per week, on the subject's
+# day_of_week) from the later of the report start, the day the subject was
+# created and the day the student enrolled (or registered, for subjects
+# without an enrollment list, which everybody takes) up to the report end.
+# Today's sessions count once they have started. Expected sessions for every
+# (student, subject) pair are counted with one vectorized weekday formula and
+# compared with a single GROUP BY over the attendance table, so the cost
+# does not grow with a per-student loop.
+
+# Ranges longer than this scan the covering (student, subject, date) unique
+# index in group order instead of looking each row of a date-index range up
+# in the table, which is ~10x faster once the range holds most of the history
+LONG_RANGE_DAYS = 31
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+def load_subjects(c, utc_offset, subject_id=None):
+    """(id, code, name, weekday 0-6, start_time, first day) for the scheduled subjects"""
+    sql = "SELECT id, code, name, day_of_week, start_time, DATE(created_date, ?) FROM subjects"
+    params = [utc_offset]
+    if subject_id is not None:
+        sql += " WHERE id = ?"
+        params.append(subject_id)
+    c.execute(sql + " ORDER BY code", params)
+    return [(r[0], r[1], r[2], WEEKDAYS.index(r[3]), r[4], r[5] or '0001-01-01')
+            for r in c.fetchall() if r[3] in WEEKDAYS]
+
+
+def last_session_days(subjects, end, now):
+    """Last day whose session of each subject counts: `end`, or the day before if today's hasn't started"""
+    today = now.strftime('%Y-%m-%d')
+    if end < today:
+        return tuple(end for _ in subjects)
+    yesterday = str(np.datetime64(today) - 1)
+    started = now.strftime('%H:%M')
+    return tuple(today if start_time[:5] <= started else yesterday
+                 for _, _, _, _, start_time, _ in subjects)
+
+
+def count_weekdays(begin, end, weekday):
+    """How many days in [begin, end] fall on `weekday` (0 = Monday), elementwise"""
+    b = begin.astype('datetime64[D]').astype(np.int64)
+    e = end.astype('datetime64[D]').astype(np.int64)
+    # 1970-01-01 was a Thursday (weekday 3)
+    first = b + (weekday - (b + 3)) % 7
+    return np.maximum(0, (e - first) // 7 + 1)
+
+
+class Report:
+    """Expected and attended sessions for every (student, subject) pair in a date range"""
+
+    def __init__(self, start, end, subjects, students, sessions, pair_subject, pair_student, expected, attended):
+        self.start = start
+        self.end = end
+        self.subjects = subjects
+        self.students = students
+        self.sessions = sessions
+        self.pair_subject = pair_subject
+        self.pair_student = pair_student
+        self.expected = expected
+        self.attended = attended
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.percentage = np.where(expected > 0, 100.0 * attended / expected, np.nan)
+
+    def below(self, threshold):
+        """Mask of pairs whose attendance is under `threshold` percent"""
+        return (self.expected > 0) & (self.percentage < threshold)
+
+    def rows(self, threshold, mask=None):
+        """Per-student, per-subject rows (all of them, or those selected by `mask`)"""
+        picked = np.flatnonzero(mask) if mask is not None else np.arange(len(self.expected))
+        percentage = self.percentage[picked].round(1)
+        rows = []
+        for s, j, expected, attended, pct, below in zip(
+                self.pair_student[picked].tolist(), self.pair_subject[picked].tolist(),
+                self.expected[picked].tolist(), self.attended[picked].tolist(),
+                percentage.tolist(), self.below(threshold)[picked].tolist()):
+            student, subject = self.students[s], self.subjects[j]
+            rows.append({
+                'student_id': student[0],
+                'name': student[1],
+                'roll_number': student[2],
+                'subject_id': subject[0],
+                'subject_code': subject[1],
+                'subject_name': subject[2],
+                'expected': expected,
+                'attended': attended,
+                'percentage': None if pct != pct else pct,
+                'below_threshold': below
+            })
+        return rows
+
+    def subject_summary(self, threshold):
+        """Per-subject totals: students expected, sessions held, overall percentage"""
+        below = self.below(threshold)
+        n = len(self.subjects)
+        students = np.bincount(self.pair_subject, minlength=n)
+        expected = np.bincount(self.pair_subject, weights=self.expected, minlength=n)
+        attended = np.bincount(self.pair_subject, weights=self.attended, minlength=n)
+        flagged = np.bincount(self.pair_subject, weights=below, minlength=n)
+        return [{
+            'subject_id': subject[0],
+            'subject_code': subject[1],
+            'subject_name': subject[2],
+            'students': int(students[i]),
+            'sessions': int(self.sessions[i]),
+            'percentage': round(100.0 * attended[i] / expected[i], 1) if expected[i] else None,
+            'below_threshold': int(flagged[i])
+        } for i, subject in enumerate(self.subjects)]
+
+    def student(self, student_id):
+        """Mask of one student's pairs"""
+        ids = np.array([s[0] for s in self.students], dtype=np.int64)
+        return ids[self.pair_student] == student_id
+
+    def absent(self):
+        """Mask of pairs that were expected at least once and never attended"""
+        return (self.expected > 0) & (self.attended == 0)
+
+    def absentees(self):
+        """Per subject held in the range, the students who never attended it"""
+        absent = self.absent()
+        lists = {i: [] for i in np.flatnonzero(self.sessions > 0)}
+        for i in np.flatnonzero(absent):
+            student = self.students[self.pair_student[i]]
+            lists[self.pair_subject[i]].append({'student_id': student[0], 'name': student[1],
+                                                'roll_number': student[2]})
+        return [{
+            'subject_id': self.subjects[i][0],
+            'subject_code': self.subjects[i][1],
+            'subject_name': self.subjects[i][2],
+            'absentees': students
+        } for i, students in lists.items()]
+
+
+def build_report(c, subjects, start, last_days, utc_offset):
+    """Compute a Report for sessions from `start` up to each subject's day in `last_days`"""
+    c.execute("""SELECT id, name, roll_number, DATE(registered_date, ?)
+                 FROM students ORDER BY roll_number""", (utc_offset,))
+    students = c.fetchall()
+    student_ids = np.array([s[0] for s in students], dtype=np.int64)
+    student_order = np.argsort(student_ids)
+    registered = np.array([s[3] or '0001-01-01' for s in students], dtype='datetime64[D]')
+
+    subject_ids = np.array([s[0] for s in subjects], dtype=np.int64)
+    subject_pos = {s[0]: i for i, s in enumerate(subjects)}
+    c.execute("SELECT subject_id, student_id, DATE(enrolled_date, ?) FROM subject_enrollments",
+              (utc_offset,))
+    enrollments = [e for e in c.fetchall() if e[0] in subject_pos]
+
+    # Enrolled pairs, then every student for subjects nobody is enrolled in
+    enrolled_subjects = {e[0] for e in enrollments}
+    e_student = np.array([e[1] for e in enrollments], dtype=np.int64)
+    e_rows = np.zeros(len(enrollments), dtype=np.int64)
+    known = np.zeros(len(enrollments), dtype=bool)
+    if len(students):
+        pos = np.minimum(np.searchsorted(student_ids, e_student, sorter=student_order), len(students) - 1)
+        e_rows = student_order[pos]
+        known = student_ids[e_rows] == e_student
+    open_subjects = np.array([i for i, s in enumerate(subjects) if s[0] not in enrolled_subjects],
+                             dtype=np.int64)
+    pair_subject = np.concatenate([
+        np.array([subject_pos[e[0]] for e in enrollments], dtype=np.int64)[known],
+        np.repeat(open_subjects, len(students))])
+    pair_student = np.concatenate([e_rows[known], np.tile(np.arange(len(students)), len(open_subjects))])
+    joined = np.concatenate([
+        np.array([e[2] or '0001-01-01' for e in enrollments], dtype='datetime64[D]')[known],
+        np.tile(registered, len(open_subjects))])
+
+    created = np.array([s[5] for s in subjects], dtype='datetime64[D]')
+    weekday = np.array([s[3] for s in subjects], dtype=np.int64)
+    last = np.array(last_days, dtype='datetime64[D]')
+    held_from = np.maximum(created, np.datetime64(start))
+    sessions = count_weekdays(held_from, last, weekday)
+    begin = np.maximum(joined, held_from[pair_subject])
+    expected = count_weekdays(begin, last[pair_subject], weekday[pair_subject])
+
+    # Attended sessions, one grouped scan of the date range
+    attended = np.zeros(len(pair_subject), dtype=np.int64)
+    if len(subjects) and len(pair_subject):
+        end = max(last_days)
+        where, params = ["attendance_date BETWEEN ? AND ?", "subject_id IS NOT NULL"], [start, end]
+        if len(subjects) == 1:
+            where.append("subject_id = ?")
+            params.append(subjects[0][0])
+        long_range = np.datetime64(end) - np.datetime64(start) > LONG_RANGE_DAYS
+        c.execute(f"""SELECT student_id, subject_id, COUNT(*)
+                      FROM attendance {'INDEXED BY idx_attendance_once_per_day' if long_range else ''}
+                      WHERE {' AND '.join(where)} GROUP BY student_id, subject_id""", params)
+        counts = np.array(c.fetchall(), dtype=np.int64).reshape(-1, 3)
+        pair_keys = subject_ids[pair_subject] << 32 | student_ids[pair_student]
+        count_keys = counts[:, 1] << 32 | counts[:, 0]
+        order = np.argsort(count_keys)
+        pos = np.minimum(np.searchsorted(count_keys, pair_keys, sorter=order), max(len(order) - 1, 0))
+        if len(order):
+            found = count_keys[order[pos]] == pair_keys
+            attended[found] = counts[order[pos[found]], 2]
+        # A record before the student joined (or on a moved class day) can't push them past 100%
+        attended = np.minimum(attended, expected)
+
+    # Students in roll number order, subjects in code order within each student
+    order = np.lexsort((pair_subject, pair_student))
+    return Report(start, max(last_days) if last_days else start, subjects, students, sessions,
+                  pair_subject[order], pair_student[order], expected[order], attended[order])
+
+
+class ReportCache:
+    """Small LRU of computed reports, each valid for one data version"""
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, key, version, report):
+        with self._lock:
+            self._entries[key] = (version, report)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -0,0 +1,144 @@
+# Attendance rollups
+# Per-day and per-month record counts, kept up to date by triggers on the
+# attendance table so every insert path (and deleting a student's records)
+# maintains them in the same transaction. `period` is either a date
+# (YYYY-MM-DD, from attendance_date) or a month (YYYY-MM). Records without a
+# subject are counted under subject_id 0.
+#
+#   attendance_rollup_subject  (period, subject_id) -> records
+#   attendance_rollup_student  (period, student_id) -> records
+#   attendance_rollup_totals   (period)             -> records, distinct students
+
+ROLLUP_TABLES = ('attendance_rollup_subject', 'attendance_rollup_student', 'attendance_rollup_totals')
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS attendance_rollup_subject
+       (period TEXT NOT NULL,
+        subject_id INTEGER NOT NULL,
+        records INTEGER NOT NULL,
+        PRIMARY KEY (period, subject_id)) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS attendance_rollup_student
+       (period TEXT NOT NULL,
+        student_id INTEGER NOT NULL,
+        records INTEGER NOT NULL,
+        PRIMARY KEY (period, student_id)) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS attendance_rollup_totals
+       (period TEXT PRIMARY KEY,
+        records INTEGER NOT NULL,
+        students INTEGER NOT NULL) WITHOUT ROWID''',
+]
+
+# The two periods every attendance row counts towards
+_PERIODS = ('{row}.attendance_date', 'substr({row}.attendance_date, 1, 7)')
+
+
+def _insert_statements(period):
+    p = period.format(row='NEW')
+    return f'''
+        INSERT INTO attendance_rollup_subject (period, subject_id, records)
+        VALUES ({p}, IFNULL(NEW.subject_id, 0), 1)
+        ON CONFLICT (period, subject_id) DO UPDATE SET records = records + 1;
+        INSERT INTO attendance_rollup_student (period, student_id, records)
+        VALUES ({p}, NEW.student_id, 1)
+        ON CONFLICT (period, student_id) DO UPDATE SET records = records + 1;
+        INSERT INTO attendance_rollup_totals (period, records, students)
+        VALUES ({p}, 1, 1)
+        ON CONFLICT (period) DO UPDATE SET records = records + 1,
+            students = students + (SELECT records = 1 FROM attendance_rollup_student
+                                   WHERE period = {p} AND student_id = NEW.student_id);'''
+
+
+def _delete_statements(period):
+    p = period.format(row='OLD')
+    return f'''
+        UPDATE attendance_rollup_subject SET records = records - 1
+        WHERE period = {p} AND subject_id = IFNULL(OLD.subject_id, 0);
+        UPDATE attendance_rollup_student SET records = records - 1
+        WHERE period = {p} AND student_id = OLD.student_id;
+        UPDATE attendance_rollup_totals SET records = records - 1,
+            students = students - (SELECT records = 0 FROM attendance_rollup_student
+                                   WHERE period = {p} AND student_id = OLD.student_id)
+        WHERE period = {p};
+        DELETE FROM attendance_rollup_subject WHERE period = {p} AND records = 0;
+        DELETE FROM attendance_rollup_student WHERE period = {p} AND records = 0;
+        DELETE FROM attendance_rollup_totals WHERE period = {p} AND records = 0;'''
+
+
+TRIGGERS = [
+    f'''CREATE TRIGGER IF NOT EXISTS attendance_rollup_insert
+        AFTER INSERT ON attendance WHEN NEW.attendance_date IS NOT NULL
+        BEGIN{''.join(_insert_statements(p) for p in _PERIODS)}
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS attendance_rollup_delete
+        AFTER DELETE ON attendance WHEN OLD.attendance_date IS NOT NULL
+        BEGIN{''.join(_delete_statements(p) for p in _PERIODS)}
+        END''',
+]
+
+# The rollups as they should be, computed from the raw attendance table
+_EXPECTED = {
+    'attendance_rollup_subject': '''
+        SELECT attendance_date, IFNULL(subject_id, 0), COUNT(*) FROM attendance
+        WHERE attendance_date IS NOT NULL GROUP BY 1, 2
+        UNION ALL
+        SELECT substr(attendance_date, 1, 7), IFNULL(subject_id, 0), COUNT(*) FROM attendance
+        WHERE attendance_date IS NOT NULL GROUP BY 1, 2''',
+    'attendance_rollup_student': '''
+        SELECT attendance_date, student_id, COUNT(*) FROM attendance
+        WHERE attendance_date IS NOT NULL GROUP BY 1, 2
+        UNION ALL
+        SELECT substr(attendance_date, 1, 7), student_id, COUNT(*) FROM attendance
+        WHERE attendance_date IS NOT NULL GROUP BY 1, 2''',
+    'attendance_rollup_totals': '''
+        SELECT attendance_date, COUNT(*), COUNT(DISTINCT student_id) FROM attendance
+        WHERE attendance_date IS NOT NULL GROUP BY 1
+        UNION ALL
+        SELECT substr(attendance_date, 1, 7), COUNT(*), COUNT(DISTINCT student_id) FROM attendance
+        WHERE attendance_date IS NOT NULL GROUP BY 1''',
+}
+
+
+def create_rollups(c):
+    """Create the rollup tables and triggers; returns True if the tables are new"""
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'attendance_rollup_totals'")
+    created = c.fetchone() is None
+    for statement in SCHEMA + TRIGGERS:
+        c.execute(statement)
+    return created
+
+
+def rebuild_rollups(c):
+    """Recompute every rollup from the attendance table (caller commits)"""
+    for table in ROLLUP_TABLES:
+        c.execute(f"DELETE FROM {table}")
+        c.execute(f"INSERT INTO {table} {_EXPECTED[table]}")
+
+
+def check_rollups(c, limit=20):
+    """Compare the rollups with the attendance table
+
+    Returns {table: [(key, expected, actual), ...]} for tables that disagree,
+    listing at most `limit` differences per table.
+    """
+    problems = {}
+    for table in ROLLUP_TABLES:
+        c.execute(f"PRAGMA table_info({table})")
+        columns = [row[1] for row in c.fetchall()]
+        keys = 1 if table == 'attendance_rollup_totals' else 2
+        c.execute(_EXPECTED[table])
+        expected = {tuple(r[:keys]): tuple(r[keys:]) for r in c.fetchall()}
+        c.execute(f"SELECT {', '.join(columns)} FROM {table}")
+        actual = {tuple(r[:keys]): tuple(r[keys:]) for r in c.fetchall()}
+        diffs = [(key, expected.get(key), actual.get(key))
+                 for key in sorted(expected.keys() | actual.keys())
+                 if expected.get(key) != actual.get(key)]
+        if diffs:
+            problems[table] = diffs[:limit]
+    return problems
+
+
+def get_totals(c, period):
+    """(records, distinct students) for one day or month"""
+    c.execute("SELECT records, students FROM attendance_rollup_totals WHERE period = ?", (period,))
+    row = c.fetchone()
+    return row if row else (0, 0)
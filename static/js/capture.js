@@ -0,0 +1,153 @@
+// Camera capture with a local quality check
+// Takes a short burst of frames, keeps the sharpest, and only uploads it if it
+// is bright enough, sharp enough and looks like it contains a face. Frames are
+// downscaled to the size the server asks for (GET /capture_settings) before
+// JPEG encoding. Rejected frames are reported to /capture/rejected so the
+// server can count how many uploads (and face detections) were avoided.
+
+let captureSettings = null;
+
+async function getCaptureSettings() {
+    if (!captureSettings) {
+        try {
+            const response = await fetch('/capture_settings');
+            captureSettings = await response.json();
+        } catch (err) {
+            captureSettings = {
+                max_width: 640, jpeg_quality: 0.85, burst_frames: 3, burst_interval_ms: 120,
+                min_brightness: 40, max_brightness: 220, min_sharpness: 15, min_skin_ratio: 0.04,
+                liveness_frames: 0, liveness_interval_ms: 150, enroll_max_images: 5
+            };
+        }
+    }
+    return captureSettings;
+}
+
+// Mean luma and variance of the Laplacian on a small grayscale copy
+function frameQuality(canvas) {
+    const width = 160;
+    const height = Math.max(1, Math.round(canvas.height * width / canvas.width));
+    const small = document.createElement('canvas');
+    small.width = width;
+    small.height = height;
+    const ctx = small.getContext('2d');
+    ctx.drawImage(canvas, 0, 0, width, height);
+    const data = ctx.getImageData(0, 0, width, height).data;
+
+    const gray = new Float32Array(width * height);
+    let sum = 0;
+    let skin = 0;
+    let centre = 0;
+    for (let i = 0, p = 0; p < gray.length; i += 4, p++) {
+        const r = data[i], g = data[i + 1], b = data[i + 2];
+        const y = 0.299 * r + 0.587 * g + 0.114 * b;
+        gray[p] = y;
+        sum += y;
+        // Skin-tone pixels (YCbCr range) in the middle half of the frame
+        const x = p % width, row = Math.floor(p / width);
+        if (x > width / 4 && x < 3 * width / 4 && row > height / 8 && row < 7 * height / 8) {
+            centre++;
+            const cb = 128 - 0.168736 * r - 0.331264 * g + 0.5 * b;
+            const cr = 128 + 0.5 * r - 0.418688 * g - 0.081312 * b;
+            if (cb >= 77 && cb <= 127 && cr >= 133 && cr <= 173) skin++;
+        }
+    }
+
+    let lapSum = 0, lapSq = 0, n = 0;
+    for (let row = 1; row < height - 1; row++) {
+        for (let x = 1; x < width - 1; x++) {
+            const p = row * width + x;
+            const lap = gray[p - 1] + gray[p + 1] + gray[p - width] + gray[p + width] - 4 * gray[p];
+            lapSum += lap;
+            lapSq += lap * lap;
+            n++;
+        }
+    }
+    const mean = lapSum / Math.max(n, 1);
+    return {
+        brightness: sum / gray.length,
+        sharpness: lapSq / Math.max(n, 1) - mean * mean,
+        skinRatio: skin / Math.max(centre, 1)
+    };
+}
+
+async function hasFace(canvas, quality, settings) {
+    // Use the browser's own face detector where there is one
+    if ('FaceDetector' in window) {
+        try {
+            const faces = await new FaceDetector({ maxDetectedFaces: 1, fastMode: true }).detect(canvas);
+            return faces.length > 0;
+        } catch (err) {
+            // Fall through to the skin-tone heuristic
+        }
+    }
+    return quality.skinRatio >= settings.min_skin_ratio;
+}
+
+function reportRejectedFrame(reason) {
+    const body = new FormData();
+    body.append('reason', reason);
+    if (!(navigator.sendBeacon && navigator.sendBeacon('/capture/rejected', body))) {
+        fetch('/capture/rejected', { method: 'POST', body: body }).catch(() => {});
+    }
+}
+
+// Returns { blob } for a frame worth uploading, or { problem } explaining why not
+async function captureCheckedFrame(video, canvas, options = {}) {
+    const settings = await getCaptureSettings();
+    const maxWidth = options.maxWidth || settings.max_width;
+    const scale = Math.min(1, maxWidth / video.videoWidth);
+    canvas.width = Math.round(video.videoWidth * scale);
+    canvas.height = Math.round(video.videoHeight * scale);
+    const context = canvas.getContext('2d');
+
+    // Keep the sharpest frame of a short burst
+    const frames = Math.max(1, settings.burst_frames);
+    let best = null;
+    for (let i = 0; i < frames; i++) {
+        if (i > 0) await new Promise(resolve => setTimeout(resolve, settings.burst_interval_ms));
+        context.drawImage(video, 0, 0, canvas.width, canvas.height);
+        const quality = frameQuality(canvas);
+        if (!best || quality.sharpness > best.quality.sharpness) {
+            best = { quality: quality, pixels: context.getImageData(0, 0, canvas.width, canvas.height) };
+        }
+    }
+    context.putImageData(best.pixels, 0, 0);
+
+    const quality = best.quality;
+    let problem = null;
+    let reason = null;
+    if (quality.brightness < settings.min_brightness) {
+        problem = 'Image is too dark. Move to a brighter spot and try again.';
+        reason = 'dark';
+    } else if (quality.brightness > settings.max_brightness) {
+        problem = 'Image is too bright. Avoid facing a strong light and try again.';
+        reason = 'bright';
+    } else if (quality.sharpness < settings.min_sharpness) {
+        problem = 'Image is blurry. Hold still and try again.';
+        reason = 'blurry';
+    } else if (!options.skipFaceCheck && !(await hasFace(canvas, quality, settings))) {
+        problem = 'No face in view. Look at the camera and try again.';
+        reason = 'no_face';
+    }
+    if (problem) {
+        reportRejectedFrame(reason);
+        return { problem: problem };
+    }
+
+    const blob = await new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg', settings.jpeg_quality));
+    return { blob: blob };
+}
+
+// For the liveness check: the checked frame followed by a short burst of the same size
+async function captureLivenessBurst(video, canvas, firstBlob) {
+    const settings = await getCaptureSettings();
+    const context = canvas.getContext('2d');
+    const blobs = [firstBlob];
+    for (let i = 1; i < settings.liveness_frames; i++) {
+        await new Promise(resolve => setTimeout(resolve, settings.liveness_interval_ms));
+        context.drawImage(video, 0, 0, canvas.width, canvas.height);
+        blobs.push(await new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg', settings.jpeg_quality)));
+    }
+    return blobs;
+}
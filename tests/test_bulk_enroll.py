@@ -0,0 +1,58 @@
+import os
+import sqlite3
+import sys
+from concurrent.futures import Executor
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import bulk_enroll
+from encoding_store import encode_encoding
+
+
+class InlineExecutor(Executor):
+    """Runs the pool's jobs in this process"""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def map(self, fn, *iterables, **kwargs):
+        return map(fn, *iterables)
+
+
+def fake_enroll_photo(job):
+    """Stand-in for the dlib worker: a random face, saved like the real one"""
+    path, password, photo_path, min_quality = job
+    with open(path, 'rb') as src, open(photo_path, 'wb') as dst:
+        dst.write(src.read())
+    return encode_encoding(np.random.default_rng().normal(size=128)), 'hash:' + password, None
+
+
+def make_db():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('''CREATE TABLE students
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL,
+                     roll_number TEXT UNIQUE NOT NULL, password TEXT NOT NULL,
+                     encoding BLOB NOT NULL, photo_path TEXT, photo_hash TEXT)''')
+    return conn
+
+
+def test_one_roll_number_in_two_formats(tmp_path, monkeypatch):
+    monkeypatch.setattr(bulk_enroll, 'ProcessPoolExecutor', InlineExecutor)
+    monkeypatch.setattr(bulk_enroll, 'enroll_photo', fake_enroll_photo)
+    photos, uploads = tmp_path / 'photos', tmp_path / 'uploads'
+    photos.mkdir()
+    uploads.mkdir()
+    for ext, value in (('.jpg', 50), ('.png', 200)):
+        cv2.imwrite(str(photos / f'123{ext}'), np.full((40, 40, 3), value, dtype=np.uint8))
+    names = tmp_path / 'names.csv'
+    names.write_text('roll_number,name,password\n123,Ali,pw\n')
+    conn = make_db()
+
+    report = bulk_enroll.bulk_enroll(conn, str(photos), str(names), str(uploads))
+
+    assert report['enrolled'] == 1
+    assert [(e['file'], e['status']) for e in report['files']] == [('123.jpg', 'enrolled'), ('123.png', 'error')]
+    assert report['files'][1]['message'] == 'Roll number repeated in this import'
+    assert conn.execute('SELECT roll_number FROM students').fetchall() == [('123',)]
@@ -0,0 +1,80 @@
+import threading
+from bisect import bisect_right
+
+# Weekly timetable
+# The subjects table changes only when an admin edits it, so each process
+# keeps an in-memory index of it instead of querying on every check-in and
+# every /get_current_subject poll. For each weekday the day is cut into
+# disjoint slots at every class start and attendance-window end; each slot
+# records the subject active in it (the earliest-starting one if classes
+# overlap, as the old ORDER BY start_time query picked), so a lookup is a
+# single bisect over the slot start times.
+
+DAY_SECONDS = 24 * 60 * 60
+
+
+def parse_time(value):
+    """Seconds since midnight for 'HH:MM' or 'HH:MM:SS'"""
+    parts = [int(p) for p in value.split(':')]
+    return parts[0] * 3600 + parts[1] * 60 + (parts[2] if len(parts) > 2 else 0)
+
+
+class Timetable:
+    """Per-weekday sorted slots of the active subject, answered by bisect"""
+
+    def __init__(self):
+        self.loaded = False
+        # Opaque marker of the data the timetable was loaded from (set by the owner)
+        self.version = None
+        self._lock = threading.Lock()
+        self._days = {}
+
+    def load(self, rows):
+        """Rebuild from (id, name, code, day_of_week, start_time, end_time, attendance_window) rows"""
+        classes = {}
+        for subject_id, name, code, day, start_time, end_time, window in rows:
+            start = parse_time(start_time)
+            # Attendance stays open `window` minutes after the class ends (inclusive, like BETWEEN)
+            end = (parse_time(end_time) + (window or 0) * 60) % DAY_SECONDS + 1
+            if end <= start:
+                continue
+            subject = {
+                'id': subject_id,
+                'name': name,
+                'code': code,
+                'start_time': start_time,
+                'end_time': end_time,
+                'attendance_window': window
+            }
+            classes.setdefault(day, []).append((start, end, start_time, subject_id, subject))
+
+        days = {}
+        for day, intervals in classes.items():
+            intervals.sort(key=lambda i: (i[2], i[3]))
+            bounds = sorted({0, DAY_SECONDS} | {i[0] for i in intervals} | {i[1] for i in intervals})
+            starts, subjects = [], []
+            for slot_start in bounds[:-1]:
+                active = next((i[4] for i in intervals if i[0] <= slot_start < i[1]), None)
+                # Merge neighbouring slots with the same answer
+                if subjects and subjects[-1] is active:
+                    continue
+                starts.append(slot_start)
+                subjects.append(active)
+            days[day] = (starts, subjects)
+
+        with self._lock:
+            self._days = days
+            self.loaded = True
+
+    def lookup(self, when):
+        """(subject or None, slot_start, slot_end) for a datetime; the answer holds until slot_end
+
+        Slot bounds are seconds since midnight of `when`'s day.
+        """
+        day = when.strftime('%A')
+        # Compare at minute resolution, as the SQL version did
+        now = when.hour * 3600 + when.minute * 60
+        starts, subjects = self._days.get(day, ([0], [None]))
+        i = bisect_right(starts, now) - 1
+        slot_end = starts[i + 1] if i + 1 < len(starts) else DAY_SECONDS
+        return subjects[i], starts[i], slot_end